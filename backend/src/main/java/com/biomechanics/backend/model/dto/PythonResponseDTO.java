@@ -51,6 +51,13 @@ public class PythonResponseDTO {
     @JsonProperty("point_cloud")
     private List<List<Double>> pointCloud;
 
+    /**
+     * Binary point cloud (base64 in JSON), sent instead of {@code point_cloud}
+     * when the request asks for a non-JSON encoding. See PointCloudConverter.
+     */
+    @JsonProperty("point_cloud_encoded")
+    private byte[] pointCloudEncoded;
+
     @Data
     @NoArgsConstructor
     public static class KeypointDTO {
@@ -28,6 +28,12 @@ public class PythonIntegrationService {
     @Value("${python.service.timeout:180}")
     private int timeoutSeconds;
 
+    @Value("${python.service.point-cloud-encoding:json}")
+    private String pointCloudEncoding;
+
+    @Value("${python.service.point-cloud-compression:none}")
+    private String pointCloudCompression;
+
     /**
      * Sends .ply scan file to Python Flask service for AI processing.
      *
@@ -52,6 +58,10 @@ public class PythonIntegrationService {
                 }
             });
             builder.part("height", heightCm.toString());
+            if (pointCloudEncoding != null && !"json".equalsIgnoreCase(pointCloudEncoding)) {
+                builder.part("point_cloud_encoding", pointCloudEncoding);
+                builder.part("point_cloud_compression", pointCloudCompression);
+            }
 
             PythonResponseDTO response = pythonWebClient
                     .post()
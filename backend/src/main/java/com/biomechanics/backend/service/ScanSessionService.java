@@ -91,7 +91,15 @@ public class ScanSessionService {
                 }
             }
 
-            if (pythonResponse.getPointCloud() != null && !pythonResponse.getPointCloud().isEmpty()) {
+            if (pythonResponse.getPointCloudEncoded() != null && pythonResponse.getPointCloudEncoded().length > 0) {
+                byte[] compressedPly = PointCloudConverter.encodedToCompressedPly(pythonResponse.getPointCloudEncoded());
+                if (compressedPly != null) {
+                    savedSession.setPointCloudData(compressedPly);
+                    log.info("Point cloud stored for session ID={}: {} KB encoded, {} KB compressed",
+                            savedSession.getId(), pythonResponse.getPointCloudEncoded().length / 1024,
+                            compressedPly.length / 1024);
+                }
+            } else if (pythonResponse.getPointCloud() != null && !pythonResponse.getPointCloud().isEmpty()) {
                 byte[] compressedPly = PointCloudConverter.pointsToCompressedPly(pythonResponse.getPointCloud());
                 if (compressedPly != null) {
                     savedSession.setPointCloudData(compressedPly);
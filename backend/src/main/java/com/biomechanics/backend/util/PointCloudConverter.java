@@ -7,13 +7,22 @@ import java.io.IOException;
 import java.nio.ByteBuffer;
 import java.nio.ByteOrder;
 import java.nio.charset.StandardCharsets;
+import java.util.Arrays;
 import java.util.List;
+import java.util.zip.DataFormatException;
 import java.util.zip.GZIPInputStream;
 import java.util.zip.GZIPOutputStream;
+import java.util.zip.Inflater;
 
 @Slf4j
 public class PointCloudConverter {
 
+    private static final byte[] ENCODED_MAGIC = "BPC1".getBytes(StandardCharsets.US_ASCII);
+    private static final int ENCODED_HEADER_SIZE = 36;
+    private static final int ENCODING_FLOAT32 = 1;
+    private static final int ENCODING_QUANTIZED16 = 2;
+    private static final int COMPRESSION_ZLIB = 1;
+
     private PointCloudConverter() {
     }
 
@@ -40,6 +49,78 @@ public class PointCloudConverter {
         }
     }
 
+    /**
+     * Converts the binary point cloud sent by the Python service (BPC1 layout,
+     * documented in data-processing/point_cloud_codec.py) into the same gzipped
+     * binary PLY produced by {@link #pointsToCompressedPly(List)}.
+     */
+    public static byte[] encodedToCompressedPly(byte[] encoded) {
+        if (encoded == null || encoded.length == 0) {
+            log.warn("Encoded point cloud is null or empty - returning null");
+            return null;
+        }
+
+        try {
+            float[] xyz = decodeEncodedPoints(encoded);
+            if (xyz.length == 0) {
+                return null;
+            }
+            byte[] plyBytes = generateBinaryPly(xyz);
+            return gzipCompress(plyBytes);
+        } catch (IOException e) {
+            log.error("Failed to convert encoded point cloud to compressed PLY: {}", e.getMessage());
+            return null;
+        }
+    }
+
+    /**
+     * Decodes a BPC1 blob into a flat x, y, z float array.
+     */
+    public static float[] decodeEncodedPoints(byte[] encoded) throws IOException {
+        if (encoded.length < ENCODED_HEADER_SIZE) {
+            throw new IOException("Encoded point cloud is shorter than its header");
+        }
+        ByteBuffer header = ByteBuffer.wrap(encoded, 0, ENCODED_HEADER_SIZE).order(ByteOrder.LITTLE_ENDIAN);
+        byte[] magic = new byte[4];
+        header.get(magic);
+        int version = header.get() & 0xFF;
+        if (!Arrays.equals(magic, ENCODED_MAGIC) || version != 1) {
+            throw new IOException("Not a BPC1 point cloud");
+        }
+        int encoding = header.get() & 0xFF;
+        int compression = header.get() & 0xFF;
+        header.get();
+        int count = header.getInt();
+        float[] min = {header.getFloat(), header.getFloat(), header.getFloat()};
+        float[] max = {header.getFloat(), header.getFloat(), header.getFloat()};
+
+        byte[] payload = Arrays.copyOfRange(encoded, ENCODED_HEADER_SIZE, encoded.length);
+        if (compression == COMPRESSION_ZLIB) {
+            payload = zlibDecompress(payload);
+        }
+
+        ByteBuffer data = ByteBuffer.wrap(payload).order(ByteOrder.LITTLE_ENDIAN);
+        float[] xyz = new float[count * 3];
+        if (encoding == ENCODING_FLOAT32) {
+            if (payload.length < xyz.length * 4) {
+                throw new IOException("Encoded point cloud payload is truncated");
+            }
+            data.asFloatBuffer().get(xyz);
+        } else if (encoding == ENCODING_QUANTIZED16) {
+            if (payload.length < xyz.length * 2) {
+                throw new IOException("Encoded point cloud payload is truncated");
+            }
+            for (int i = 0; i < xyz.length; i++) {
+                int axis = i % 3;
+                int q = data.getShort() & 0xFFFF;
+                xyz[i] = (float) (min[axis] + q / 65535.0 * (max[axis] - min[axis]));
+            }
+        } else {
+            throw new IOException("Unknown point cloud encoding: " + encoding);
+        }
+        return xyz;
+    }
+
     public static byte[] decompressPly(byte[] compressed) throws IOException {
         if (compressed == null || compressed.length == 0) {
             return null;
@@ -49,29 +130,57 @@ public class PointCloudConverter {
 
 
     private static byte[] generateBinaryPly(List<List<Double>> points) throws IOException {
+        float[] xyz = new float[points.size() * 3];
+        int n = 0;
+        for (List<Double> point : points) {
+            if (point.size() < 3) continue;
+            xyz[n++] = point.get(0).floatValue();
+            xyz[n++] = point.get(1).floatValue();
+            xyz[n++] = point.get(2).floatValue();
+        }
+        return generateBinaryPly(n == xyz.length ? xyz : Arrays.copyOf(xyz, n));
+    }
+
+    private static byte[] generateBinaryPly(float[] xyz) throws IOException {
         ByteArrayOutputStream out = new ByteArrayOutputStream();
 
         String header = "ply\n" +
                 "format binary_little_endian 1.0\n" +
-                "element vertex " + points.size() + "\n" +
+                "element vertex " + (xyz.length / 3) + "\n" +
                 "property float x\n" +
                 "property float y\n" +
                 "property float z\n" +
                 "end_header\n";
         out.write(header.getBytes(StandardCharsets.US_ASCII));
 
-        ByteBuffer buffer = ByteBuffer.allocate(points.size() * 12).order(ByteOrder.LITTLE_ENDIAN);
-        for (List<Double> point : points) {
-            if (point.size() < 3) continue;
-            buffer.putFloat(point.get(0).floatValue());
-            buffer.putFloat(point.get(1).floatValue());
-            buffer.putFloat(point.get(2).floatValue());
-        }
+        ByteBuffer buffer = ByteBuffer.allocate(xyz.length * 4).order(ByteOrder.LITTLE_ENDIAN);
+        buffer.asFloatBuffer().put(xyz);
         out.write(buffer.array());
 
         return out.toByteArray();
     }
 
+    private static byte[] zlibDecompress(byte[] compressed) throws IOException {
+        Inflater inflater = new Inflater();
+        inflater.setInput(compressed);
+        ByteArrayOutputStream baos = new ByteArrayOutputStream();
+        byte[] buf = new byte[8192];
+        try {
+            while (!inflater.finished()) {
+                int len = inflater.inflate(buf);
+                if (len == 0 && (inflater.needsInput() || inflater.needsDictionary())) {
+                    throw new IOException("Truncated zlib stream");
+                }
+                baos.write(buf, 0, len);
+            }
+        } catch (DataFormatException e) {
+            throw new IOException("Invalid zlib stream", e);
+        } finally {
+            inflater.end();
+        }
+        return baos.toByteArray();
+    }
+
     private static byte[] gzipCompress(byte[] data) throws IOException {
         ByteArrayOutputStream baos = new ByteArrayOutputStream();
         try (GZIPOutputStream gzip = new GZIPOutputStream(baos)) {
@@ -4,11 +4,15 @@ import org.junit.jupiter.api.DisplayName;
 import org.junit.jupiter.api.Nested;
 import org.junit.jupiter.api.Test;
 
+import java.io.ByteArrayOutputStream;
 import java.io.IOException;
+import java.nio.ByteBuffer;
+import java.nio.ByteOrder;
 import java.nio.charset.StandardCharsets;
 import java.util.ArrayList;
 import java.util.Collections;
 import java.util.List;
+import java.util.zip.Deflater;
 
 import static org.assertj.core.api.Assertions.*;
 
@@ -121,5 +125,100 @@ class PointCloudConverterTest {
 
             assertThat(header).contains("element vertex 10");
         }
+
+        @Test
+        @DisplayName("Skipped points are left out of the vertex count")
+        void shouldCountOnlyWrittenPoints() throws IOException {
+            List<List<Double>> points = new ArrayList<>();
+            points.add(List.of(1.0, 2.0, 3.0));
+            points.add(List.of(4.0, 5.0));
+            points.add(List.of(7.0, 8.0, 9.0));
+
+            byte[] decompressed = PointCloudConverter.decompressPly(PointCloudConverter.pointsToCompressedPly(points));
+            String header = new String(decompressed, StandardCharsets.US_ASCII);
+            int bodyStart = header.indexOf("end_header\n") + "end_header\n".length();
+
+            assertThat(header).contains("element vertex 2");
+            assertThat(decompressed.length - bodyStart).isEqualTo(2 * 12);
+        }
+    }
+
+    @Nested
+    @DisplayName("Encoded point cloud (BPC1)")
+    class EncodedPointCloud {
+
+        private byte[] encode(int encoding, boolean zlib, float[] min, float[] max, byte[] payload) {
+            byte[] body = payload;
+            if (zlib) {
+                Deflater deflater = new Deflater();
+                deflater.setInput(payload);
+                deflater.finish();
+                ByteArrayOutputStream out = new ByteArrayOutputStream();
+                byte[] buf = new byte[1024];
+                while (!deflater.finished()) {
+                    out.write(buf, 0, deflater.deflate(buf));
+                }
+                deflater.end();
+                body = out.toByteArray();
+            }
+
+            int count = payload.length / (encoding == 1 ? 12 : 6);
+            ByteBuffer buffer = ByteBuffer.allocate(36 + body.length).order(ByteOrder.LITTLE_ENDIAN);
+            buffer.put("BPC1".getBytes(StandardCharsets.US_ASCII));
+            buffer.put((byte) 1).put((byte) encoding).put((byte) (zlib ? 1 : 0)).put((byte) 0);
+            buffer.putInt(count);
+            for (float v : min) buffer.putFloat(v);
+            for (float v : max) buffer.putFloat(v);
+            buffer.put(body);
+            return buffer.array();
+        }
+
+        @Test
+        @DisplayName("float32 payload is decoded as-is")
+        void shouldDecodeFloat32() throws IOException {
+            ByteBuffer payload = ByteBuffer.allocate(24).order(ByteOrder.LITTLE_ENDIAN);
+            payload.putFloat(1f).putFloat(2f).putFloat(3f).putFloat(4f).putFloat(5f).putFloat(6f);
+
+            float[] xyz = PointCloudConverter.decodeEncodedPoints(
+                    encode(1, false, new float[]{1f, 2f, 3f}, new float[]{4f, 5f, 6f}, payload.array()));
+
+            assertThat(xyz).containsExactly(1f, 2f, 3f, 4f, 5f, 6f);
+        }
+
+        @Test
+        @DisplayName("zlib-compressed quantized payload is dequantized to the bounding box")
+        void shouldDecodeCompressedQuantized() throws IOException {
+            ByteBuffer payload = ByteBuffer.allocate(12).order(ByteOrder.LITTLE_ENDIAN);
+            payload.putShort((short) 0).putShort((short) 0).putShort((short) 0);
+            payload.putShort((short) 0xFFFF).putShort((short) 0xFFFF).putShort((short) 0);
+
+            float[] xyz = PointCloudConverter.decodeEncodedPoints(
+                    encode(2, true, new float[]{-1f, 0f, 2f}, new float[]{1f, 1.8f, 2f}, payload.array()));
+
+            assertThat(xyz).containsExactly(new float[]{-1f, 0f, 2f, 1f, 1.8f, 2f}, within(1e-4f));
+        }
+
+        @Test
+        @DisplayName("Encoded cloud converts to a gzipped PLY with the right vertex count")
+        void shouldConvertToCompressedPly() throws IOException {
+            ByteBuffer payload = ByteBuffer.allocate(24).order(ByteOrder.LITTLE_ENDIAN);
+            payload.putFloat(0f).putFloat(0f).putFloat(0f).putFloat(1f).putFloat(1f).putFloat(1f);
+
+            byte[] compressed = PointCloudConverter.encodedToCompressedPly(
+                    encode(1, true, new float[]{0f, 0f, 0f}, new float[]{1f, 1f, 1f}, payload.array()));
+            String header = new String(PointCloudConverter.decompressPly(compressed), StandardCharsets.US_ASCII);
+
+            assertThat(header).contains("element vertex 2");
+        }
+
+        @Test
+        @DisplayName("Blob without the BPC1 magic is rejected")
+        void shouldRejectUnknownMagic() {
+            byte[] invalid = new byte[40];
+
+            assertThatThrownBy(() -> PointCloudConverter.decodeEncodedPoints(invalid))
+                    .isInstanceOf(IOException.class);
+            assertThat(PointCloudConverter.encodedToCompressedPly(invalid)).isNull();
+        }
     }
 }
@@ -2,10 +2,22 @@
 """
 Analizează cerințele de memorie pentru fișiere .ply
 Afișează: dimensiunea fișierului, numărul de puncte, memoria estimată necesară
+
+Cu --profile rulează efectiv pipeline-ul (încărcare, outlieri, predict,
+serializare) și măsoară RSS-ul real, alocările și timpul pe fiecare etapă.
+Cu --sweep face același lucru pe scanări sintetice de mai multe mărimi și
+potrivește un model de cost per punct.
 """
 
+import argparse
+import json
 import sys
 import os
+import tempfile
+import time
+import tracemalloc
+
+import numpy as np
 
 def analyze_ply_file(filepath):
     """
@@ -21,7 +33,6 @@ def analyze_ply_file(filepath):
     # 1. Dimensiunea fișierului pe disk
     file_size_bytes = os.path.getsize(filepath)
     file_size_mb = file_size_bytes / (1024 * 1024)
-    file_size_gb = file_size_bytes / (1024 * 1024 * 1024)
     
     print("="*70)
     print(f"📁 FIȘIER: {os.path.basename(filepath)}")
@@ -33,7 +44,6 @@ def analyze_ply_file(filepath):
     try:
         with open(filepath, 'r', encoding='utf-8', errors='ignore') as f:
             vertex_count = 0
-            in_header = True
             format_type = "unknown"
             
             for line in f:
@@ -53,7 +63,6 @@ def analyze_ply_file(filepath):
                 
                 # Sfârșitul header-ului
                 if line == 'end_header':
-                    in_header = False
                     break
             
             if vertex_count == 0:
@@ -136,17 +145,7 @@ def analyze_ply_file(filepath):
             print("⚙️  CONFIGURAȚIE SPRING BOOT NECESARĂ")
             print("="*70)
             
-            # Rotunjește în sus la următoarea limită (100MB, 200MB, 500MB, 1GB, etc.)
-            if file_size_mb <= 100:
-                config_limit = "100MB"
-            elif file_size_mb <= 200:
-                config_limit = "200MB"
-            elif file_size_mb <= 500:
-                config_limit = "500MB"
-            elif file_size_mb <= 1024:
-                config_limit = "1GB"
-            else:
-                config_limit = f"{int(file_size_mb / 1024) + 1}GB"
+            config_limit = spring_limit(file_size_mb)
             
             print(f"spring.servlet.multipart.max-file-size: {config_limit}")
             print(f"spring.servlet.multipart.max-request-size: {config_limit}")
@@ -168,6 +167,8 @@ def analyze_ply_file(filepath):
             print(f"Total estimat:               ~{estimated_time_minutes + (file_size_mb / 10 / 60):.1f} minute")
             
             print()
+            print("ℹ️  Cifrele de mai sus sunt estimări fixe. Pentru valori măsurate:")
+            print(f"    python analyze_ply_memory.py {filepath} --profile")
             print("="*70)
             
             return {
@@ -183,20 +184,271 @@ def analyze_ply_file(filepath):
         print(f"❌ Eroare la citirea fișierului: {e}")
         return None
 
+def spring_limit(size_mb):
+    """Rotunjește în sus la următoarea limită (100MB, 200MB, 500MB, 1GB, etc.)"""
+    if size_mb <= 100:
+        return "100MB"
+    elif size_mb <= 200:
+        return "200MB"
+    elif size_mb <= 500:
+        return "500MB"
+    elif size_mb <= 1024:
+        return "1GB"
+    else:
+        return f"{int(size_mb / 1024) + 1}GB"
+
+
+# ----------------------------------------------------------------------
+# Profilare măsurată
+# ----------------------------------------------------------------------
+
+def read_proc_kb(field):
+    """Citește un câmp din /proc/self/status (VmRSS, VmHWM) în KB; None în afara Linux."""
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith(field + ":"):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return None
+
+
+def reset_peak_rss():
+    """Resetează VmHWM (vârful RSS) ca fiecare etapă să-și vadă propriul vârf."""
+    try:
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+        return True
+    except OSError:
+        return False
+
+
+def measure_stage(name, fn, stages, allocations=False):
+    """Rulează fn() și notează timpul, RSS-ul de vârf și (opțional) alocările Python/NumPy."""
+    peak_resettable = reset_peak_rss()
+    rss_before = read_proc_kb("VmRSS")
+    if allocations:
+        tracemalloc.start()
+    started = time.perf_counter()
+    try:
+        result = fn()
+    finally:
+        elapsed = time.perf_counter() - started
+        alloc_peak = tracemalloc.get_traced_memory()[1] if allocations else None
+        if allocations:
+            tracemalloc.stop()
+    rss_after = read_proc_kb("VmRSS")
+    rss_peak = read_proc_kb("VmHWM") if peak_resettable else None
+
+    stage = {
+        "name": name,
+        "seconds": elapsed,
+        "rss_before_mb": rss_before / 1024 if rss_before is not None else None,
+        "rss_after_mb": rss_after / 1024 if rss_after is not None else None,
+        "rss_peak_mb": rss_peak / 1024 if rss_peak is not None else None,
+        "alloc_peak_mb": alloc_peak / (1024 * 1024) if alloc_peak is not None else None,
+    }
+    stages.append(stage)
+    return result
+
+
+def profile_pipeline(filepath, allocations=False):
+    """Rulează pipeline-ul din app.py pe un fișier și măsoară fiecare etapă."""
+    # Fiecare rulare trebuie să facă toată munca, deci cache-ul de rezultate și
+    # prior-ul de orientare (care ar învăța și din scanările de test) sunt oprite.
+    os.environ["RESULT_CACHE_MB"] = "0"
+    os.environ["ORIENTATION_PRIOR"] = "0"
+    import app
+    from ply_upload import PlyUpload
+
+    # Estimatorul se creează leneș la primul checkout; îl construim (și încălzim)
+    # înainte de baseline, ca modelele MediaPipe să nu intre în vârful primei etape.
+    app.warm_up()
+
+    stages = []
+    vertex_count = read_vertex_count(filepath)
+    baseline_kb = read_proc_kb("VmRSS")
+
+    pcd = measure_stage("incarcare", lambda: app.load_point_cloud(PlyUpload(path=filepath)), stages, allocations)
+    loaded_points = len(pcd.points)
+    pcd, _ = measure_stage("outlieri", lambda: app.remove_outliers(pcd), stages, allocations)
+
+    with app.engine_pool.checkout(timeout=app.ENGINE_TIMEOUT) as engine:
+        try:
+            result = measure_stage("predict", lambda: engine.predict(pcd, real_height_meters=1.75), stages, allocations)
+        except Exception as e:
+            print(f"⚠️  Predict a eșuat ({e}), se măsoară fallback-ul euristic")
+            result = measure_stage("predict", lambda: app.get_heuristic_keypoints(pcd), stages, allocations)
+
+    body = measure_stage("serializare", lambda: json.dumps(app.encode_result(result)), stages, allocations)
+
+    peaks = [s["rss_peak_mb"] for s in stages if s["rss_peak_mb"] is not None]
+    return {
+        "file": filepath,
+        "file_size_mb": os.path.getsize(filepath) / (1024 * 1024),
+        "vertex_count": vertex_count,
+        "loaded_points": loaded_points,
+        "baseline_rss_mb": baseline_kb / 1024 if baseline_kb is not None else None,
+        "peak_rss_mb": max(peaks) if peaks else None,
+        "total_seconds": sum(s["seconds"] for s in stages),
+        "response_mb": len(body) / (1024 * 1024),
+        "stages": stages,
+    }
+
+
+def read_vertex_count(filepath):
+    with open(filepath, "rb") as f:
+        for raw in f:
+            line = raw.decode("ascii", errors="ignore").strip()
+            if line.startswith("element vertex"):
+                return int(line.split()[2])
+            if line == "end_header":
+                break
+    return 0
+
+
+def print_profile(profile):
+    print()
+    print("="*70)
+    print(f"🔬 PROFIL MĂSURAT: {os.path.basename(profile['file'])}")
+    print("="*70)
+    print(f"Puncte în fișier: {profile['vertex_count']:,}  |  încărcate: {profile['loaded_points']:,}")
+    if profile["baseline_rss_mb"] is not None:
+        print(f"RSS de bază (Python + modele încărcate): {profile['baseline_rss_mb']:.1f} MB")
+    print()
+    print(f"{'Etapă':<14}{'Timp':>10}{'RSS vârf':>12}{'RSS după':>12}{'Alocări':>12}")
+    for s in profile["stages"]:
+        peak = f"{s['rss_peak_mb']:.1f} MB" if s["rss_peak_mb"] is not None else "-"
+        after = f"{s['rss_after_mb']:.1f} MB" if s["rss_after_mb"] is not None else "-"
+        alloc = f"{s['alloc_peak_mb']:.1f} MB" if s["alloc_peak_mb"] is not None else "-"
+        print(f"{s['name']:<14}{s['seconds']:>9.2f}s{peak:>12}{after:>12}{alloc:>12}")
+    print()
+    if profile["peak_rss_mb"] is not None:
+        print(f"RSS de vârf pe proces:       {profile['peak_rss_mb']:8.1f} MB")
+    print(f"Timp total (fără upload):     {profile['total_seconds']:8.2f} s")
+    print(f"Răspuns JSON către Spring:    {profile['response_mb']:8.2f} MB")
+
+
+def run_sweep(sizes, allocations=False):
+    """Profilează scanări sintetice (vezi benchmark.py) de mărimile date."""
+    from benchmark import synthetic_humanoid, write_binary_ply
+
+    profiles = []
+    with tempfile.TemporaryDirectory() as workdir:
+        for n in sizes:
+            path = os.path.join(workdir, f"sintetic_{n}.ply")
+            points, _, _ = synthetic_humanoid(n, platform=True)
+            write_binary_ply(path, points)
+            del points
+            print(f"🔁 Sweep: {n:,} puncte...")
+            profiles.append(profile_pipeline(path, allocations))
+            os.remove(path)
+    return profiles
+
+
+def fit_cost_model(profiles, load_max_points):
+    """Potrivește RSS și timp ca a + b * puncte (cele mai mici pătrate).
+
+    După încărcare pipeline-ul lucrează pe cel mult LOAD_MAX_POINTS puncte, așa
+    că modelul folosește min(puncte, LOAD_MAX_POINTS).
+    """
+    n = np.array([min(p["vertex_count"], load_max_points or p["vertex_count"]) for p in profiles], dtype=float)
+    rss = np.array([p["peak_rss_mb"] - p["baseline_rss_mb"] for p in profiles], dtype=float)
+    seconds = np.array([p["total_seconds"] for p in profiles], dtype=float)
+    response = np.array([p["response_mb"] for p in profiles], dtype=float)
+    if len(np.unique(n)) < 2:
+        return None
+
+    rss_slope, rss_base = np.polyfit(n, rss, 1)
+    time_slope, time_base = np.polyfit(n, seconds, 1)
+    return {
+        "load_max_points": load_max_points,
+        "bytes_per_point": rss_slope * 1024 * 1024,
+        "rss_fixed_mb": rss_base,
+        "baseline_rss_mb": float(np.median([p["baseline_rss_mb"] for p in profiles])),
+        "seconds_per_10k": time_slope * 10000,
+        "seconds_fixed": time_base,
+        "response_mb_max": float(response.max()),
+    }
+
+
+def predict_from_model(model, vertex_count):
+    n = min(vertex_count, model["load_max_points"] or vertex_count)
+    rss = model["baseline_rss_mb"] + model["rss_fixed_mb"] + n * model["bytes_per_point"] / (1024 * 1024)
+    seconds = model["seconds_fixed"] + n / 10000 * model["seconds_per_10k"]
+    return max(rss, model["baseline_rss_mb"]), max(seconds, 0.0)
+
+
+def print_cost_model(model):
+    print()
+    print("="*70)
+    print("📈 MODEL DE COST MĂSURAT (per punct)")
+    print("="*70)
+    print(f"RSS fix (Python + modele):    {model['baseline_rss_mb']:8.1f} MB")
+    print(f"RSS suplimentar fix:          {model['rss_fixed_mb']:8.1f} MB")
+    print(f"RSS per punct:                {model['bytes_per_point']:8.1f} bytes")
+    print(f"Timp fix:                     {model['seconds_fixed']:8.2f} s")
+    print(f"Timp per 10.000 puncte:       {model['seconds_per_10k']:8.3f} s")
+    if model["load_max_points"]:
+        print(f"(peste {model['load_max_points']:,} puncte costul nu mai crește: LOAD_MAX_POINTS)")
+    print(f"(cu LOAD_MEMORY_MB, LOAD_BYTES_PER_POINT ar trebui să fie cel puțin {model['bytes_per_point']:.0f})")
+
+
+def print_measured_recommendations(file_size_mb, peak_rss_mb, seconds, response_mb, workers):
+    """Recomandările de mai sus, dar calculate din cifrele măsurate."""
+    print()
+    print("="*70)
+    print("🔧 RECOMANDĂRI PE BAZA MĂSURĂTORILOR")
+    print("="*70)
+    python_mb = peak_rss_mb * workers * 1.25
+    print(f"RAM Python ({workers} worker(i), +25% rezervă): {python_mb:8.1f} MB ({python_mb / 1024:.2f} GB)")
+
+    # Spring ține upload-ul (multipart + byte[] trimis mai departe) și răspunsul
+    # JSON decodat; listele de Double boxed costă ~4x față de textul JSON.
+    upload_mb = file_size_mb * 3
+    response_heap_mb = response_mb * 4
+    heap_gb = max(2, (upload_mb + response_heap_mb) * 1.5 / 1024)
+    print(f"Memorie Spring pentru upload: {upload_mb:8.2f} MB")
+    print(f"Memorie Spring pentru răspuns: {response_heap_mb:7.2f} MB (răspuns măsurat: {response_mb:.2f} MB)")
+    print(f"⚠️  Recomandare JVM Heap: -Xmx{heap_gb:.0f}g (minim)")
+    print()
+    print(f"spring.servlet.multipart.max-file-size: {spring_limit(file_size_mb)}")
+    print(f"spring.servlet.multipart.max-request-size: {spring_limit(file_size_mb)}")
+    print(f"spring.codec.max-in-memory-size: {spring_limit(max(file_size_mb, response_mb * 2))}")
+    print(f"Timeout Python (WebClient): minim {max(30, int(seconds * 3))} s (de 3x timpul măsurat de {seconds:.1f} s)")
+    print("="*70)
+
 
 def main():
-    if len(sys.argv) < 2:
-        print("Utilizare: python analyze_ply_memory.py <fisier.ply>")
+    parser = argparse.ArgumentParser(
+        description="Analizează cerințele de memorie pentru fișiere .ply",
+        epilog="Exemplu: python analyze_ply_memory.py test.ply --profile",
+    )
+    parser.add_argument("filepath", nargs="?", help="fișierul .ply analizat")
+    parser.add_argument("--profile", action="store_true", help="rulează pipeline-ul și măsoară RSS/timp pe etape")
+    parser.add_argument("--sweep", help="mărimi sintetice separate prin virgulă, ex. 10000,100000,1000000")
+    parser.add_argument("--allocations", action="store_true", help="măsoară și alocările cu tracemalloc (mai lent)")
+    parser.add_argument("--workers", type=int, default=int(os.environ.get("POSE_WORKERS", "1")),
+                        help="câte scanări procesează serviciul în paralel")
+    parser.add_argument("--json", help="salvează măsurătorile în acest fișier JSON")
+    args = parser.parse_args()
+
+    if not args.filepath and not args.sweep:
+        parser.print_usage()
         print()
         print("Exemplu:")
         print("  python analyze_ply_memory.py test.ply")
-        print("  python analyze_ply_memory.py scans/patient_001.ply")
+        print("  python analyze_ply_memory.py scans/patient_001.ply --profile")
+        print("  python analyze_ply_memory.py --sweep 10000,100000,1000000 scans/patient_001.ply")
         sys.exit(1)
-    
-    filepath = sys.argv[1]
-    result = analyze_ply_file(filepath)
-    
-    if result:
+
+    filepath = args.filepath
+    result = analyze_ply_file(filepath) if filepath else None
+    if filepath and not result:
+        sys.exit(1)
+
+    if not args.profile and not args.sweep:
         print()
         print(" Analiza completă!")
         print()
@@ -206,6 +458,42 @@ def main():
         print(f"   - RAM Python necesar: {result['memory_processing_mb'] / 1024:.2f} GB")
         print(f"   - JVM Heap recomandat: -Xmx{max(2, int(result['memory_upload_mb'] / 1024) + 1)}g")
         print(f"   - Config Spring Boot: {result['config_limit']}")
+        return
+
+    report = {}
+    if args.profile and filepath:
+        profile = profile_pipeline(filepath, args.allocations)
+        print_profile(profile)
+        report["profile"] = profile
+        if profile["peak_rss_mb"] is not None:
+            print_measured_recommendations(profile["file_size_mb"], profile["peak_rss_mb"],
+                                           profile["total_seconds"], profile["response_mb"], args.workers)
+
+    if args.sweep:
+        sizes = [int(s) for s in args.sweep.split(",") if s]
+        profiles = run_sweep(sizes, args.allocations)
+        for profile in profiles:
+            print_profile(profile)
+        report["sweep"] = profiles
+
+        import app
+        model = fit_cost_model(profiles, app.LOAD_MAX_POINTS) if all(p["peak_rss_mb"] is not None for p in profiles) else None
+        if model is None:
+            print("⚠️  Modelul de cost cere cel puțin două mărimi diferite și /proc (Linux)")
+        else:
+            report["model"] = model
+            print_cost_model(model)
+            if result:
+                rss, seconds = predict_from_model(model, result["vertex_count"])
+                print()
+                print(f"Pentru {os.path.basename(filepath)} ({result['vertex_count']:,} puncte) modelul prezice:")
+                print(f"   RSS de vârf ~{rss:.1f} MB, timp ~{seconds:.1f} s")
+                print_measured_recommendations(result["file_size_mb"], rss, seconds, model["response_mb_max"], args.workers)
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"💾 Măsurători salvate în {args.json}")
 
 
 if __name__ == "__main__":
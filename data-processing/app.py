@@ -1,15 +1,144 @@
+import time
+# Taken before the heavy imports so the reported startup time includes them.
+IMPORT_STARTED = time.perf_counter()
+
 import open3d as o3d
 import numpy as np
 import os
-import tempfile
-from flask import Flask, request, jsonify
+import base64
+import queue
+import threading
+from flask import Flask, Request, Response, request, jsonify
 
-from model_loader import AI_Pose_Estimator
+from estimator_pool import EstimatorPool
+from model_loader import AI_Pose_Estimator, sample_point_cloud
+from job_queue import ScanJobQueue, QueueFullError
+from preprocessing import denoise, REDUCTIONS, OUTLIER_METHODS
+from diagnose_scan import score_scan
+from ply_reader import read_ply_points, new_stats
+from ply_upload import PlyUpload
+from metrics import StageTimings, STAGE_SECONDS, STARTUP_SECONDS, SCANS, AI_FAILURES, HEURISTIC_FALLBACKS, SCAN_POINTS, render_all
+from orientation_prior import OrientationPrior
+from result_cache import ResultCache, cache_key
+from point_cloud_codec import encode_point_cloud, ENCODINGS, COMPRESSIONS
+from point_sampling import SAMPLERS, FPS_MAX_POINTS
 
 app = Flask(__name__)
 
-print("INIT: Loading AI system...")
-ai_engine = AI_Pose_Estimator()
+POSE_WORKERS = int(os.environ.get("POSE_WORKERS", "1"))
+SEARCH_WORKERS = int(os.environ.get("POSE_SEARCH_WORKERS", "1"))
+USE_ALIGNMENT = os.environ.get("POSE_ALIGNMENT", "1") == "1"
+# Score at which a prior- or alignment-ordered search stops early; 0 searches every orientation.
+EARLY_EXIT_SCORE = float(os.environ.get("POSE_EARLY_EXIT_SCORE", "1.2")) or None
+CASCADE_TOP_K = int(os.environ.get("POSE_CASCADE_TOP_K", "0"))
+CASCADE_IMAGE_SIZE = int(os.environ.get("POSE_CASCADE_IMAGE_SIZE", "256"))
+CASCADE_COMPLEXITY = int(os.environ.get("POSE_CASCADE_COMPLEXITY", "0"))
+LEAN_MEMORY = os.environ.get("POSE_LEAN_MEMORY", "0") == "1"
+DEBUG_IMAGE_DIR = os.environ.get("POSE_DEBUG_IMAGE_DIR") or None
+ENGINE_TIMEOUT = float(os.environ.get("POSE_ENGINE_TIMEOUT", "600"))
+HTTP_THREADS = int(os.environ.get("HTTP_THREADS", str(POSE_WORKERS + 2)))
+LOAD_MAX_POINTS = int(os.environ.get("LOAD_MAX_POINTS", "0"))
+LOAD_SAMPLING = os.environ.get("LOAD_SAMPLING", "random")
+LOAD_VOXEL_SIZE = float(os.environ.get("LOAD_VOXEL_SIZE", "0.005"))
+LOAD_MEMORY_MB = float(os.environ.get("LOAD_MEMORY_MB", "0"))
+LOAD_BYTES_PER_POINT = float(os.environ.get("LOAD_BYTES_PER_POINT", "128"))
+UPLOAD_SPILL_MB = float(os.environ.get("UPLOAD_SPILL_MB", "128"))
+DENOISE_REDUCTION = os.environ.get("DENOISE_REDUCTION", "none")
+DENOISE_VOXEL_SIZE = float(os.environ.get("DENOISE_VOXEL_SIZE", "0.005"))
+DENOISE_MAX_PER_VOXEL = int(os.environ.get("DENOISE_MAX_PER_VOXEL", "4"))
+OUTLIER_METHOD = os.environ.get("OUTLIER_METHOD", "statistical")
+OCCUPANCY_VOXEL = float(os.environ.get("OCCUPANCY_VOXEL", "0.03"))
+OCCUPANCY_MIN_NEIGHBOURS = int(os.environ.get("OCCUPANCY_MIN_NEIGHBOURS", "20"))
+JOB_API = os.environ.get("JOB_API", "1") == "1"
+JOB_WORKERS = int(os.environ.get("JOB_WORKERS", str(POSE_WORKERS)))
+JOB_QUEUE_SIZE = int(os.environ.get("JOB_QUEUE_SIZE", "16"))
+JOB_RESULT_TTL = int(os.environ.get("JOB_RESULT_TTL", "3600"))
+JOB_RETRY_AFTER = int(os.environ.get("JOB_RETRY_AFTER", "5"))
+ORIENTATION_PRIOR = os.environ.get("ORIENTATION_PRIOR", "0") == "1"
+ORIENTATION_PRIOR_PATH = os.environ.get("ORIENTATION_PRIOR_PATH", "orientation_prior.json") or None
+QUALITY_GATE = os.environ.get("QUALITY_GATE", "0") == "1"
+QUALITY_MIN_SCORE = float(os.environ.get("QUALITY_MIN_SCORE", "1.5"))
+RESULT_CACHE_MB = int(os.environ.get("RESULT_CACHE_MB", "256"))
+RESULT_CACHE_DIR = os.environ.get("RESULT_CACHE_DIR") or None
+RESULT_CACHE_DISK_MB = int(os.environ.get("RESULT_CACHE_DISK_MB", "2048"))
+POINT_CLOUD_POINTS = int(os.environ.get("POINT_CLOUD_POINTS", "50000"))
+POINT_CLOUD_MAX_POINTS = int(os.environ.get("POINT_CLOUD_MAX_POINTS", "200000"))
+POINT_CLOUD_SAMPLING = os.environ.get("POINT_CLOUD_SAMPLING", "uniform")
+
+if DENOISE_REDUCTION not in REDUCTIONS:
+    raise ValueError(f"DENOISE_REDUCTION must be one of {', '.join(REDUCTIONS)}, got '{DENOISE_REDUCTION}'")
+if OUTLIER_METHOD not in OUTLIER_METHODS:
+    raise ValueError(f"OUTLIER_METHOD must be one of {', '.join(OUTLIER_METHODS)}, got '{OUTLIER_METHOD}'")
+
+# A memory ceiling bounds the sample a scan is reduced to while it is read,
+# whatever the file size. Above a warmed-up process a scan costs about
+# LOAD_FIXED_MB plus 100 bytes per loaded point (analyze_ply_memory.py
+# --sweep); LOAD_BYTES_PER_POINT keeps some headroom on top of that.
+LOAD_FIXED_MB = 48
+LOAD_MIN_POINTS = 20_000
+LOAD_MAX_VOXELS = None
+if LOAD_MEMORY_MB > 0:
+    budget_points = int((LOAD_MEMORY_MB - LOAD_FIXED_MB) * 1024 * 1024 / LOAD_BYTES_PER_POINT)
+    if budget_points < LOAD_MIN_POINTS:
+        print(f"WARNING: LOAD_MEMORY_MB={LOAD_MEMORY_MB:g} leaves room for {max(budget_points, 0)} points, using {LOAD_MIN_POINTS}")
+        budget_points = LOAD_MIN_POINTS
+    LOAD_MAX_POINTS = min(LOAD_MAX_POINTS, budget_points) if LOAD_MAX_POINTS else budget_points
+    LOAD_MAX_VOXELS = LOAD_MAX_POINTS
+    print(f"INIT: Memory ceiling {LOAD_MEMORY_MB:g} MB, scans are sampled to at most {LOAD_MAX_POINTS} points")
+
+# Everything that changes the height-independent analysis of a scan.
+PIPELINE_CONFIG = {
+    "version": "BruteForce_v6_CleanReproject",
+    "load": (LOAD_MAX_POINTS, LOAD_SAMPLING, LOAD_VOXEL_SIZE, LOAD_MAX_VOXELS),
+    "denoise": (DENOISE_REDUCTION, DENOISE_VOXEL_SIZE, DENOISE_MAX_PER_VOXEL),
+    "outliers": (OUTLIER_METHOD, OCCUPANCY_VOXEL, OCCUPANCY_MIN_NEIGHBOURS),
+    "alignment": USE_ALIGNMENT,
+    "early_exit": EARLY_EXIT_SCORE,
+    "cascade": (CASCADE_TOP_K, CASCADE_IMAGE_SIZE, CASCADE_COMPLEXITY) if CASCADE_TOP_K > 0 else None,
+    "lean": LEAN_MEMORY,
+}
+
+print(f"INIT: Configuring AI system ({POSE_WORKERS} estimator(s) per process)...")
+orientation_prior = OrientationPrior(ORIENTATION_PRIOR_PATH) if ORIENTATION_PRIOR else None
+engine_pool = EstimatorPool(size=POSE_WORKERS, search_workers=SEARCH_WORKERS, use_alignment=USE_ALIGNMENT,
+                            search_accept_score=EARLY_EXIT_SCORE, prior=orientation_prior,
+                            cascade_top_k=CASCADE_TOP_K, cascade_image_size=CASCADE_IMAGE_SIZE,
+                            cascade_complexity=CASCADE_COMPLEXITY, lean=LEAN_MEMORY,
+                            point_cloud_points=POINT_CLOUD_POINTS, point_cloud_sampling=POINT_CLOUD_SAMPLING,
+                            debug_dir=DEBUG_IMAGE_DIR)
+class ScanRequest(Request):
+    uploads = ()
+
+    def _get_file_stream(self, total_content_length, content_type, filename=None, content_length=None):
+        # Uploads are parsed into points while the body arrives; only large ones go to a temp file.
+        upload = PlyUpload(total_content_length, UPLOAD_SPILL_MB * 1024 * 1024, name=filename or "upload.ply",
+                           max_points=LOAD_MAX_POINTS or None, method=LOAD_SAMPLING, voxel_size=LOAD_VOXEL_SIZE,
+                           max_voxels=LOAD_MAX_VOXELS)
+        self.uploads = self.uploads + (upload,)
+        return upload
+
+app.request_class = ScanRequest
+
+@app.teardown_request
+def discard_uploads(exc=None):
+    # Runs after every request, including early returns and errors; uploads
+    # handed to the job queue are marked `keep` and discarded by the queue.
+    for upload in getattr(request, "uploads", ()):
+        if not upload.keep:
+            upload.discard()
+
+# The estimators are built by warm_up(): before serving when app.py is run
+# directly, after the fork in every worker under gunicorn.conf.py.
+startup = {"ready": False, "pid": os.getpid(), "import_seconds": None, "warm_up_seconds": None,
+           "startup_seconds": None, "error": None}
+
+result_cache = None
+if RESULT_CACHE_MB > 0:
+    result_cache = ResultCache(
+        max_bytes=RESULT_CACHE_MB * 1024 * 1024,
+        disk_dir=RESULT_CACHE_DIR,
+        disk_max_bytes=RESULT_CACHE_DISK_MB * 1024 * 1024,
+    )
 
 def get_heuristic_keypoints(pcd):
     points = np.asarray(pcd.points)
@@ -34,39 +163,191 @@ def get_heuristic_keypoints(pcd):
         "meta": {"method": "Heuristic_Fallback"},
     }
 
-def process_scan(file_path, user_height=1.75):
+def load_point_cloud(upload, stats=None):
+    """Reads the (sampled) points of an upload; `stats` receives the whole-file statistics if given."""
+    if upload.points is not None:
+        print(f"  Parsed {len(upload.points)} points during upload ({LOAD_SAMPLING} sampling, cap={LOAD_MAX_POINTS or 'none'})")
+        if stats is not None and upload.stats is not None:
+            stats.update(upload.stats)
+        return o3d.geometry.PointCloud(o3d.utility.Vector3dVector(upload.points))
+    if upload.path is None:
+        print(f"  PLY stream parser: {upload.error}")
+        return o3d.geometry.PointCloud()
     try:
-        print("PROCESSING: ", os.path.basename(file_path))
-        print(f"  Target Height: {user_height} m")
+        points = read_ply_points(upload.path, max_points=LOAD_MAX_POINTS or None, method=LOAD_SAMPLING,
+                                 voxel_size=LOAD_VOXEL_SIZE, max_voxels=LOAD_MAX_VOXELS, stats=stats)
+    except ValueError as e:
+        size_mb = os.path.getsize(upload.path) / (1024 * 1024)
+        if LOAD_MEMORY_MB > 0 and size_mb > LOAD_MEMORY_MB:
+            # Open3D reads every point; on a file this size that would break the ceiling.
+            raise ValueError(f"{e}; a {size_mb:.0f} MB file is too large for the Open3D fallback (LOAD_MEMORY_MB={LOAD_MEMORY_MB:g})")
+        print(f"  PLY reader: {e}, falling back to Open3D")
+        return o3d.io.read_point_cloud(upload.path)
+    print(f"  Loaded {len(points)} points ({LOAD_SAMPLING} sampling, cap={LOAD_MAX_POINTS or 'none'})")
+    return o3d.geometry.PointCloud(o3d.utility.Vector3dVector(points))
 
-        pcd = o3d.io.read_point_cloud(file_path)
-        if pcd.is_empty():
-            return {"error": "Empty or corrupt file"}
+def remove_outliers(pcd, nb_neighbors=30, std_ratio=3.0):
+    return denoise(
+        pcd,
+        reduction=DENOISE_REDUCTION,
+        voxel_size=DENOISE_VOXEL_SIZE,
+        max_per_voxel=DENOISE_MAX_PER_VOXEL,
+        outlier=OUTLIER_METHOD,
+        nb_neighbors=nb_neighbors,
+        std_ratio=std_ratio,
+        occupancy_voxel=OCCUPANCY_VOXEL,
+        min_neighbours=OCCUPANCY_MIN_NEIGHBOURS,
+    )
 
-        pcd, _ = pcd.remove_statistical_outlier(nb_neighbors=30, std_ratio=3.0)
+def process_scan(upload, user_height=1.75, device_id=None, progress=None, sampling=None):
+    """Runs the pipeline on a PlyUpload, or on the path of a PLY file.
 
-    except Exception as e:
-        return {"error": f"Loading error: {e}"}
+    `progress(event, body)`, if given, receives the intermediate results:
+    a "preview" with the heuristic keypoints as soon as the scan is loaded,
+    then a "best_so_far" whenever the orientation search finds a better one.
+    `sampling` ({"points", "method"}) sets the returned point cloud's
+    subsample, the server defaults if not given.
+    """
+    if isinstance(upload, str):
+        upload = PlyUpload(path=upload)
+    timings = StageTimings()
+    try:
+        with timings.stage("total"):
+            result, outcome = run_scan(upload, user_height, timings, device_id, progress, sampling)
+    except TimeoutError:
+        SCANS.inc(outcome="timeout")
+        raise
+    SCANS.inc(outcome=outcome)
+    if "meta" in result:
+        result["meta"]["timings_ms"] = timings.as_dict()
+    return result
+
+def run_scan(upload, user_height, timings, device_id=None, progress=None, sampling=None):
+    print("PROCESSING: ", upload.name)
+    print(f"  Target Height: {user_height} m")
+    sampling = sampling or {"points": POINT_CLOUD_POINTS, "method": POINT_CLOUD_SAMPLING}
 
+    key = None
+    if result_cache is not None:
+        with timings.stage("cache_lookup"):
+            try:
+                # The returned subsample is part of the cached analysis.
+                config = {**PIPELINE_CONFIG, "point_cloud": (sampling["points"], sampling["method"])}
+                key = cache_key(upload.path, config, digest=upload.hexdigest())
+            except OSError as e:
+                print(f"  [CACHE] Cannot hash upload: {e}")
+            analysis = result_cache.get(key) if key is not None else None
+        if analysis is not None:
+            print(f"  [CACHE] Hit {key[:12]}, rescaling without inference")
+            keypoints = AI_Pose_Estimator.finalize(analysis, user_height)
+            keypoints["meta"]["cache"] = "hit"
+            return keypoints, "cache_hit"
+
+    scan_stats = new_stats()
     try:
-        print("AI: Running inference...")
-        keypoints = ai_engine.predict(pcd, real_height_meters=user_height)
-        return keypoints
+        with timings.stage("load"):
+            pcd = load_point_cloud(upload, scan_stats)
+        if pcd.is_empty():
+            return {"error": "Empty or corrupt file"}, "error"
+        SCAN_POINTS.observe(len(pcd.points), step="loaded")
+        if progress is not None:
+            progress("preview", get_heuristic_keypoints(pcd))
+
+        if QUALITY_GATE:
+            with timings.stage("quality_gate"):
+                quality = score_scan(np.asarray(pcd.points))
+            print(f"  [QUALITY] Score {quality['score']:.1f} ({quality['verdict']})")
+            if quality["score"] < QUALITY_MIN_SCORE:
+                return {"error": f"Scan rejected by quality gate (score {quality['score']:.1f} < {QUALITY_MIN_SCORE})",
+                        "quality": quality}, "rejected"
+
+        with timings.stage("outlier_removal"):
+            pcd, preprocess_report = remove_outliers(pcd)
+        SCAN_POINTS.observe(len(pcd.points), step="denoised")
 
     except Exception as e:
-        print(f"AI FAILED: {e}. Using heuristic fallback...")
+        return {"error": f"Loading error: {e}"}, "error"
+
+    print("AI: Running inference...")
+    analysis, ai_error = None, None
+    with engine_pool.checkout(timeout=ENGINE_TIMEOUT) as engine:
+        try:
+            on_best = None
+            if progress is not None:
+                on_best = lambda update: progress("best_so_far", best_so_far_body(update, user_height))
+            analysis = engine.analyze(pcd, timings, device_id, on_best)
+        except Exception as e:
+            ai_error = e
+
+    if analysis is None:
+        print(f"AI FAILED: {ai_error}. Using heuristic fallback...")
+        AI_FAILURES.inc()
         try:
             fallback_keypoints = get_heuristic_keypoints(pcd)
-            return fallback_keypoints
+            fallback_keypoints["meta"]["preprocess"] = preprocess_report
+            fallback_keypoints["meta"]["scan"] = scan_stats
+            HEURISTIC_FALLBACKS.inc()
+            return fallback_keypoints, "fallback"
         except Exception as fallback_e:
-            return {"error": f"AI failed ({e}) and fallback also failed ({fallback_e})"}
+            return {"error": f"AI failed ({ai_error}) and fallback also failed ({fallback_e})"}, "error"
 
-@app.route('/process-scan', methods=['POST'])
-def api_endpoint():
+    # The response subsample is drawn once the estimator is back in the pool,
+    # so a slow sampling method never holds one.
+    with timings.stage("subsample"):
+        analysis["point_cloud"] = sample_point_cloud(np.asarray(pcd.points), sampling["points"], sampling["method"])
+    analysis["meta"]["preprocess"] = preprocess_report
+    analysis["meta"]["scan"] = scan_stats
+    if key is not None:
+        result_cache.put(key, analysis)
+    keypoints = AI_Pose_Estimator.finalize(analysis, user_height)
+    if key is not None:
+        keypoints["meta"]["cache"] = "miss"
+    return keypoints, "ai"
+
+def best_so_far_body(update, user_height):
+    keypoints = AI_Pose_Estimator.scale_keypoints(update["keypoints"], update["current_height"], user_height)
+    keypoints["meta"].update(method="SearchPreview", best_orientation=update["orientation"], best_score=update["score"],
+                             orientations_evaluated=update["evaluated"], orientations_total=update["total"])
+    return keypoints
+
+def encode_result(result, encoding="json", compression="none"):
+    points = result.pop("point_cloud", None)
+    if points is None:
+        return result
+    started = time.perf_counter()
+    if encoding == "json":
+        result["point_cloud"] = np.asarray(points, dtype=float).tolist()
+    else:
+        blob = encode_point_cloud(points, encoding=encoding, compression=compression)
+        result["point_cloud_encoded"] = base64.b64encode(blob).decode("ascii")
+    elapsed = time.perf_counter() - started
+    STAGE_SECONDS.observe(elapsed, stage="serialize")
+    if "timings_ms" in result.get("meta", {}):
+        result["meta"]["timings_ms"]["serialize"] = round(elapsed * 1000, 1)
+    return result
+
+# Job state lives in this process; with several server processes a poll can
+# reach one that never saw the job (see gunicorn.conf.py).
+job_queue = ScanJobQueue(
+    lambda upload, height, options: encode_result(
+        process_scan(upload, user_height=height, device_id=options.get("device_id"), sampling=options.get("sampling")),
+        encoding=options["encoding"],
+        compression=options["compression"],
+    ),
+    workers=JOB_WORKERS,
+    max_queue=JOB_QUEUE_SIZE,
+    result_ttl=JOB_RESULT_TTL,
+) if JOB_API else None
+
+def job_api_disabled():
+    return jsonify({"error": "Job API disabled (JOB_API=0)"}), 404
+
+def read_upload():
     if 'file' not in request.files:
-        return jsonify({"error": "No file provided"}), 400
+        return None, None, (jsonify({"error": "No file provided"}), 400)
 
     file = request.files['file']
+    upload = file.stream
 
     try:
         height_cm = float(request.form.get('height', 175))
@@ -76,17 +357,247 @@ def api_endpoint():
     user_height_meters = height_cm / 100.0
 
     if file.filename == '':
-        return jsonify({"error": "Empty filename"}), 400
+        return None, None, (jsonify({"error": "Empty filename"}), 400)
+
+    upload.finish()
+    return upload, user_height_meters, None
+
+def read_device_id():
+    return request.form.get("device_id") or None
+
+def read_encoding_options():
+    encoding = request.form.get('point_cloud_encoding', 'json')
+    compression = request.form.get('point_cloud_compression', 'none')
+    if encoding != 'json' and encoding not in ENCODINGS:
+        return None, (jsonify({"error": f"Unknown point_cloud_encoding '{encoding}'"}), 400)
+    if compression not in COMPRESSIONS:
+        return None, (jsonify({"error": f"Unknown point_cloud_compression '{compression}'"}), 400)
+    return {"encoding": encoding, "compression": compression}, None
+
+def read_sampling_options():
+    method = request.form.get('point_cloud_sampling', POINT_CLOUD_SAMPLING)
+    if method not in SAMPLERS:
+        return None, (jsonify({"error": f"Unknown point_cloud_sampling '{method}'"}), 400)
+    try:
+        default = min(POINT_CLOUD_POINTS, FPS_MAX_POINTS) if method == "fps" else POINT_CLOUD_POINTS
+        points = int(request.form.get('point_cloud_points', default))
+    except ValueError:
+        return None, (jsonify({"error": "point_cloud_points must be an integer"}), 400)
+    if not 0 <= points <= POINT_CLOUD_MAX_POINTS:
+        return None, (jsonify({"error": f"point_cloud_points must be between 0 and {POINT_CLOUD_MAX_POINTS}"}), 400)
+    if method == "fps" and points > FPS_MAX_POINTS:
+        return None, (jsonify({"error": f"point_cloud_sampling 'fps' allows at most {FPS_MAX_POINTS} points"}), 400)
+    return {"points": points, "method": method}, None
+
+def warm_up():
+    """Creates every estimator, runs a dummy inference on each and marks the process ready."""
+    started = time.perf_counter()
+    try:
+        engine_pool.fill(warm_up=True)
+    except Exception as e:
+        startup["error"] = str(e)
+        print(f"STARTUP: warm-up failed: {e}")
+        raise
+    now = time.perf_counter()
+    STARTUP_SECONDS.set(now - started, phase="warm_up")
+    # perf_counter is system-wide monotonic, so a forked worker measures from the master's import.
+    STARTUP_SECONDS.set(now - IMPORT_STARTED, phase="total")
+    startup.update(ready=True, pid=os.getpid(), warm_up_seconds=round(now - started, 2),
+                   startup_seconds=round(now - IMPORT_STARTED, 2))
+    print(f"READY: pid {os.getpid()} warmed {POSE_WORKERS} estimator(s) in {now - started:.2f}s, "
+          f"{now - IMPORT_STARTED:.2f}s after import started")
+
+def start_warm_up():
+    # In the background, so liveness answers while the models load.
+    threading.Thread(target=warm_up, name="warm-up", daemon=True).start()
+
+@app.route('/health/live', methods=['GET'])
+def liveness():
+    if startup["error"]:
+        return jsonify({"status": "failed", "error": startup["error"]}), 500
+    return jsonify({"status": "alive", "pid": os.getpid()})
 
-    with tempfile.NamedTemporaryFile(delete=False, suffix=".ply") as tmp:
-        file.save(tmp.name)
-        path = tmp.name
+@app.route('/health/ready', methods=['GET'])
+def readiness():
+    return jsonify(startup), 200 if startup["ready"] else 503
 
-    result = process_scan(path, user_height=user_height_meters)
-    os.remove(path)
+@app.route('/process-scan', methods=['POST'])
+def api_endpoint():
+    options, error = read_encoding_options()
+    if error:
+        return error
+    sampling, error = read_sampling_options()
+    if error:
+        return error
+
+    upload, user_height_meters, error = read_upload()
+    if error:
+        return error
+
+    try:
+        result = encode_result(process_scan(upload, user_height=user_height_meters, device_id=read_device_id(),
+                                            sampling=sampling), **options)
+    except TimeoutError as e:
+        return jsonify({"error": str(e)}), 503
 
     return jsonify(result)
 
+@app.route('/process-scan/stream', methods=['POST'])
+def stream_endpoint():
+    """/process-scan as NDJSON: one {"event", "data"} line per preview,
+    best_so_far and final result (or error), so a client can draw a
+    skeleton right away and refine it.
+    """
+    options, error = read_encoding_options()
+    if error:
+        return error
+    sampling, error = read_sampling_options()
+    if error:
+        return error
+
+    upload, user_height_meters, error = read_upload()
+    if error:
+        return error
+
+    # The scan runs on its own thread so its progress callbacks can be
+    # written out while it works; it owns the upload from here on.
+    events = queue.Queue()
+    device_id = read_device_id()
+    upload.keep = True
+
+    def run():
+        try:
+            result = process_scan(upload, user_height=user_height_meters, device_id=device_id,
+                                  progress=lambda event, body: events.put((event, body)), sampling=sampling)
+            events.put(("result", encode_result(result, **options)))
+        except Exception as e:
+            events.put(("error", {"error": str(e)}))
+        finally:
+            upload.discard()
+            events.put(None)
+
+    threading.Thread(target=run, name="scan-stream", daemon=True).start()
+
+    def generate():
+        while True:
+            item = events.get()
+            if item is None:
+                return
+            event, body = item
+            yield app.json.dumps({"event": event, "data": body}) + "\n"
+
+    return Response(generate(), mimetype="application/x-ndjson")
+
+def job_status_body(job):
+    body = {
+        "job_id": job["id"],
+        "status": job["status"],
+        "submitted_at": job["submitted_at"],
+        "started_at": job["started_at"],
+        "finished_at": job["finished_at"],
+    }
+    if job["status"] == "failed" and job["result"]:
+        body["error"] = job["result"].get("error")
+    return body
+
+@app.route('/diagnose-scan', methods=['POST'])
+def diagnose_endpoint():
+    upload, _, error = read_upload()
+    if error:
+        return error
+
+    try:
+        pcd = load_point_cloud(upload)
+        report = score_scan(np.asarray(pcd.points))
+    except Exception as e:
+        return jsonify({"error": f"Loading error: {e}"}), 400
+
+    return jsonify(report)
+
+@app.route('/jobs', methods=['POST'])
+def submit_job():
+    if job_queue is None:
+        return job_api_disabled()
+    options, error = read_encoding_options()
+    if error:
+        return error
+    sampling, error = read_sampling_options()
+    if error:
+        return error
+
+    upload, user_height_meters, error = read_upload()
+    if error:
+        return error
+
+    try:
+        job_id = job_queue.submit(upload, user_height_meters, {**options, "device_id": read_device_id(), "sampling": sampling})
+    except QueueFullError as e:
+        response = jsonify({"error": str(e), **job_queue.stats()})
+        response.headers["Retry-After"] = str(JOB_RETRY_AFTER)
+        return response, 429
+
+    upload.keep = True
+    response = jsonify({"job_id": job_id, "status": "queued", **job_queue.stats()})
+    response.headers["Location"] = f"/jobs/{job_id}"
+    return response, 202
+
+@app.route('/jobs/stats', methods=['GET'])
+def job_stats():
+    if job_queue is None:
+        return jsonify({"enabled": False})
+    return jsonify(job_queue.stats())
+
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    return Response(render_all(), mimetype="text/plain; version=0.0.4")
+
+@app.route('/orientation-prior', methods=['GET'])
+def orientation_prior_stats():
+    if orientation_prior is None:
+        return jsonify({"enabled": False})
+    return jsonify({"enabled": True, "devices": orientation_prior.stats()})
+
+@app.route('/cache/stats', methods=['GET'])
+def cache_stats():
+    if result_cache is None:
+        return jsonify({"enabled": False})
+    return jsonify({"enabled": True, **result_cache.stats()})
+
+@app.route('/jobs/<job_id>', methods=['GET'])
+def job_status(job_id):
+    if job_queue is None:
+        return job_api_disabled()
+    job = job_queue.get(job_id)
+    if job is None:
+        return jsonify({"error": "Unknown job"}), 404
+    return jsonify(job_status_body(job))
+
+@app.route('/jobs/<job_id>/result', methods=['GET'])
+def job_result(job_id):
+    if job_queue is None:
+        return job_api_disabled()
+    job = job_queue.get(job_id)
+    if job is None:
+        return jsonify({"error": "Unknown job"}), 404
+    if job["status"] in ("queued", "running"):
+        response = jsonify(job_status_body(job))
+        response.headers["Retry-After"] = str(JOB_RETRY_AFTER)
+        return response, 202
+    return jsonify(job["result"])
+
+startup["import_seconds"] = round(time.perf_counter() - IMPORT_STARTED, 2)
+STARTUP_SECONDS.set(startup["import_seconds"], phase="import")
+print(f"INIT: app.py imported in {startup['import_seconds']:.2f}s")
+
 if __name__ == '__main__':
-    print("Server starting at http://127.0.0.1:5000/process-scan")
-    app.run(host='0.0.0.0', port=5000, debug=True)
\ No newline at end of file
+    warm_up()
+    host = os.environ.get("HOST", "0.0.0.0")
+    port = int(os.environ.get("PORT", "5000"))
+    print(f"Server starting at http://{host}:{port}/process-scan ({POSE_WORKERS} estimator(s), {HTTP_THREADS} HTTP threads)")
+    try:
+        from waitress import serve
+    except ImportError:
+        print("WARNING: waitress not installed, falling back to Flask's threaded server")
+        app.run(host=host, port=port, threaded=True)
+    else:
+        serve(app, host=host, port=port, threads=HTTP_THREADS)
\ No newline at end of file
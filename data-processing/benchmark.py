@@ -0,0 +1,404 @@
+"""Synthetic-scan benchmark for the data-processing pipeline.
+
+Generates humanoid point clouds with known joints, runs the pipeline stages
+and the end-to-end path on them and writes a JSON report (latency
+percentiles, throughput, peak memory, orientation/keypoint accuracy) that
+can be compared with a report from another commit:
+
+    python benchmark.py --sizes 10000,100000,1000000 --output bench.json
+    python benchmark.py --sizes 10000,100000,1000000 --compare bench.json
+
+The coarse-to-fine cascade only replaces the full search, so it is
+benchmarked with --no-alignment, once without and once with --cascade-top-k;
+--compare reports the accuracy change next to the latency change.
+"""
+
+import argparse
+import json
+import os
+import platform as platform_info
+import resource
+import subprocess
+import tempfile
+import time
+import tracemalloc
+
+import numpy as np
+import open3d as o3d
+
+from model_loader import AI_Pose_Estimator
+from ply_reader import read_ply_points
+from preprocessing import denoise
+
+STAGES = ("load", "outliers", "render", "predict", "end_to_end")
+
+# Upright body, y up, facing +z, feet at y = 0. Left is +x.
+JOINTS = {
+    "nose": (0.0, 1.62, 0.09),
+    "l_ear": (0.075, 1.63, 0.0),
+    "r_ear": (-0.075, 1.63, 0.0),
+    "l_shoulder": (0.19, 1.44, 0.0),
+    "r_shoulder": (-0.19, 1.44, 0.0),
+    "l_elbow": (0.26, 1.16, 0.0),
+    "r_elbow": (-0.26, 1.16, 0.0),
+    "l_wrist": (0.30, 0.90, 0.02),
+    "r_wrist": (-0.30, 0.90, 0.02),
+    "l_hip": (0.10, 0.92, 0.0),
+    "r_hip": (-0.10, 0.92, 0.0),
+    "l_knee": (0.11, 0.50, 0.01),
+    "r_knee": (-0.11, 0.50, 0.01),
+    "l_ankle": (0.12, 0.08, -0.01),
+    "r_ankle": (-0.12, 0.08, -0.01),
+}
+
+# (from joint, to joint, radius) capsules; the torso and head are added separately.
+LIMBS = [
+    ("l_shoulder", "l_elbow", 0.045), ("l_elbow", "l_wrist", 0.038),
+    ("r_shoulder", "r_elbow", 0.045), ("r_elbow", "r_wrist", 0.038),
+    ("l_hip", "l_knee", 0.075), ("l_knee", "l_ankle", 0.05),
+    ("r_hip", "r_knee", 0.075), ("r_knee", "r_ankle", 0.05),
+]
+
+
+def sample_capsule(rng, a, b, radius, n):
+    a, b = np.asarray(a, dtype=float), np.asarray(b, dtype=float)
+    axis = b - a
+    length = np.linalg.norm(axis)
+    axis = axis / length
+    helper = np.array([1.0, 0.0, 0.0]) if abs(axis[0]) < 0.9 else np.array([0.0, 0.0, 1.0])
+    e1 = np.cross(axis, helper)
+    e1 /= np.linalg.norm(e1)
+    e2 = np.cross(axis, e1)
+    t = rng.uniform(0, length, n)[:, None]
+    angle = rng.uniform(0, 2 * np.pi, n)[:, None]
+    return a + t * axis + radius * (np.cos(angle) * e1 + np.sin(angle) * e2)
+
+
+def sample_ellipsoid(rng, center, radii, n):
+    d = rng.normal(size=(n, 3))
+    d /= np.linalg.norm(d, axis=1, keepdims=True)
+    return np.asarray(center) + d * np.asarray(radii)
+
+
+def sample_platform(rng, n, radius=0.45, y=-0.02):
+    r = radius * np.sqrt(rng.uniform(0, 1, n))
+    angle = rng.uniform(0, 2 * np.pi, n)
+    return np.column_stack([r * np.cos(angle), np.full(n, y) + rng.normal(0, 0.003, n), r * np.sin(angle)])
+
+
+def synthetic_humanoid(n_points, noise=0.002, platform=False, outlier_fraction=0.001, seed=0):
+    """Upright humanoid surface samples plus its ground-truth joints.
+
+    Returns (points, joints, body_height). `noise` is the Gaussian sigma in
+    metres; `platform` adds a scanner turntable under the feet (15% of the
+    points); `outlier_fraction` of the points are uniform strays in the bbox.
+    """
+    rng = np.random.default_rng(seed)
+    j = {name: np.array(xyz) for name, xyz in JOINTS.items()}
+    n_platform = int(n_points * 0.15) if platform else 0
+    n_outliers = int(n_points * outlier_fraction)
+    n_body = n_points - n_platform - n_outliers
+
+    parts = [
+        ("head", lambda n: sample_ellipsoid(rng, (0.0, 1.62, 0.0), (0.08, 0.11, 0.095), n), 0.08),
+        ("neck", lambda n: sample_capsule(rng, (0.0, 1.44, 0.0), (0.0, 1.53, 0.0), 0.05, n), 0.02),
+        ("torso", lambda n: sample_ellipsoid(rng, (0.0, 1.18, 0.0), (0.19, 0.30, 0.11), n), 0.30),
+        ("pelvis", lambda n: sample_ellipsoid(rng, (0.0, 0.93, 0.0), (0.17, 0.10, 0.10), n), 0.08),
+        ("feet_l", lambda n: sample_ellipsoid(rng, (0.12, 0.03, 0.05), (0.045, 0.03, 0.11), n), 0.02),
+        ("feet_r", lambda n: sample_ellipsoid(rng, (-0.12, 0.03, 0.05), (0.045, 0.03, 0.11), n), 0.02),
+    ]
+    limb_weight = 0.48 / len(LIMBS)
+    for a, b, radius in LIMBS:
+        parts.append((a + "-" + b, lambda n, a=a, b=b, radius=radius: sample_capsule(rng, j[a], j[b], radius, n), limb_weight))
+
+    weights = np.array([w for _, _, w in parts])
+    counts = rng.multinomial(n_body, weights / weights.sum())
+    body = np.vstack([sample(n) for (_, sample, _), n in zip(parts, counts)])
+    if noise > 0:
+        body += rng.normal(0, noise, body.shape)
+    body_height = float(np.ptp(body[:, 1]))
+
+    pieces = [body]
+    if n_platform:
+        pieces.append(sample_platform(rng, n_platform))
+    if n_outliers:
+        lo, hi = body.min(axis=0) - 0.3, body.max(axis=0) + 0.3
+        pieces.append(rng.uniform(lo, hi, (n_outliers, 3)))
+    points = np.vstack(pieces)
+    return points[rng.permutation(len(points))], j, body_height
+
+
+def write_binary_ply(path, points):
+    points = np.asarray(points, dtype="<f4")
+    header = (
+        "ply\nformat binary_little_endian 1.0\n"
+        f"element vertex {len(points)}\n"
+        "property float x\nproperty float y\nproperty float z\nend_header\n"
+    )
+    with open(path, "wb") as f:
+        f.write(header.encode("ascii"))
+        points.tofile(f)
+
+
+def percentiles(samples_ms):
+    arr = np.asarray(samples_ms)
+    return {
+        "runs": len(arr),
+        "mean_ms": round(float(np.mean(arr)), 2),
+        "min_ms": round(float(np.min(arr)), 2),
+        "p50_ms": round(float(np.percentile(arr, 50)), 2),
+        "p90_ms": round(float(np.percentile(arr, 90)), 2),
+        "p99_ms": round(float(np.percentile(arr, 99)), 2),
+    }
+
+
+def measure(fn, repeat, n_points, track_memory):
+    """Runs `fn` `repeat` times; one more run under tracemalloc gives the peak."""
+    samples, result = [], None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = fn()
+        samples.append((time.perf_counter() - started) * 1000)
+    stats = percentiles(samples)
+    stats["points"] = n_points
+    stats["points_per_s"] = round(n_points / (stats["mean_ms"] / 1000), 1) if stats["mean_ms"] > 0 else None
+    stats["runs_per_s"] = round(1000 / stats["mean_ms"], 3) if stats["mean_ms"] > 0 else None
+    if track_memory:
+        tracemalloc.start()
+        try:
+            fn()
+            stats["peak_mb"] = round(tracemalloc.get_traced_memory()[1] / 2**20, 1)
+        finally:
+            tracemalloc.stop()
+    return stats, result
+
+
+def keypoint_accuracy(keypoints, truth, rotation):
+    """Mean keypoint error (cm) against the rotated ground truth.
+
+    Mirrored left/right is scored too, because a front/back flip of the body is
+    an equally upright orientation; the better of the two is reported.
+    """
+    names = [n for n in truth if n in keypoints and isinstance(keypoints[n], dict)]
+    if not names:
+        return None
+    predicted = np.array([[keypoints[n]["x"], keypoints[n]["y"], keypoints[n]["z"]] for n in names])
+    expected = np.array([truth[n] for n in names]) @ rotation
+
+    def swap(name):
+        return "r_" + name[2:] if name.startswith("l_") else "l_" + name[2:] if name.startswith("r_") else name
+    mirrored = np.array([truth[swap(n)] for n in names]) @ rotation
+
+    direct = np.linalg.norm(predicted - expected, axis=1)
+    swapped = np.linalg.norm(predicted - mirrored, axis=1)
+    best, lr_swapped = (swapped, True) if swapped.mean() < direct.mean() else (direct, False)
+    return {
+        "mean_error_cm": round(float(best.mean() * 100), 2),
+        "max_error_cm": round(float(best.max() * 100), 2),
+        "lr_swapped": lr_swapped,
+        "per_joint_cm": {n: round(float(e * 100), 2) for n, e in zip(names, best)},
+    }
+
+
+def run_case(estimator, process_scan, n_points, label, rotation, noise, with_platform, args, workdir):
+    upright, joints, body_height = synthetic_humanoid(n_points, noise=noise, platform=with_platform, seed=args.seed)
+    # The estimator looks for R with points @ R.T upright, so a scan "in" orientation R is upright @ R.
+    scan = upright @ rotation
+    truth = {name: xyz for name, xyz in joints.items()}
+    case = {
+        "id": f"n={n_points} orient={label} noise={noise} platform={int(with_platform)}",
+        "points": n_points, "orientation": label, "noise": noise, "platform": with_platform,
+        "stages": {},
+    }
+    print(f"[BENCH] {case['id']}")
+
+    path = os.path.join(workdir, "scan.ply")
+    write_binary_ply(path, scan)
+
+    loaded = scan
+    if "load" in args.stages:
+        stats, loaded = measure(lambda: read_ply_points(path, max_points=args.load_max_points), args.repeat, n_points, args.memory)
+        case["stages"]["load"] = stats
+    elif args.load_max_points and len(scan) > args.load_max_points:
+        loaded = read_ply_points(path, max_points=args.load_max_points)
+
+    pcd = o3d.geometry.PointCloud(o3d.utility.Vector3dVector(loaded))
+    clean = pcd
+    if "outliers" in args.stages:
+        stats, (clean, _) = measure(lambda: denoise(pcd), args.repeat, len(loaded), args.memory)
+        case["stages"]["outliers"] = stats
+    else:
+        clean, _ = denoise(pcd)
+
+    if "render" in args.stages:
+        points = np.asarray(clean.points)
+        upright_cloud = (points - points.mean(axis=0)) @ rotation.T
+        stats, _ = measure(lambda: estimator.render_snapshot(upright_cloud), args.repeat, len(points), args.memory)
+        case["stages"]["render"] = stats
+
+    if "predict" in args.stages:
+        def predict():
+            try:
+                return estimator.predict(clean, real_height_meters=body_height)
+            except Exception as e:
+                return {"error": str(e)}
+        stats, result = measure(predict, args.repeat, len(clean.points), args.memory)
+        case["stages"]["predict"] = stats
+        case["accuracy"] = score_result(result, truth, rotation, estimator)
+
+    if "end_to_end" in args.stages:
+        stats, result = measure(lambda: process_scan(path, user_height=body_height), args.repeat, n_points, args.memory)
+        case["stages"]["end_to_end"] = stats
+        case.setdefault("accuracy", score_result(result, truth, rotation, estimator))
+
+    os.remove(path)
+    return case
+
+
+def score_result(result, truth, rotation, estimator):
+    meta = result.get("meta", {})
+    if "error" in result or meta.get("method") == "Heuristic_Fallback":
+        return {"ai_succeeded": False, "method": meta.get("method"), "error": result.get("error")}
+    matrices = {lbl: np.asarray(m, dtype=float) for m, lbl in estimator.get_rotation_matrices()}
+    found = matrices.get(meta.get("best_orientation"))
+    # Upright when the recovered rotation maps the body's up axis back onto +y.
+    upright = bool(found is not None and (found @ rotation.T @ np.array([0.0, 1.0, 0.0]))[1] > 0.9)
+    accuracy = {
+        "ai_succeeded": True,
+        "best_orientation": meta.get("best_orientation"),
+        "best_score": meta.get("best_score"),
+        "upright": upright,
+        "orientation_inferences": meta.get("orientation_inferences"),
+        "coarse_scores": meta.get("coarse_scores"),
+    }
+    accuracy.update(keypoint_accuracy(result, truth, rotation) or {})
+    return accuracy
+
+
+def git_commit():
+    try:
+        out = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True,
+                             cwd=os.path.dirname(os.path.abspath(__file__)))
+        return out.stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(report, baseline):
+    print("\n[COMPARE] p50 change vs baseline", baseline.get("commit"))
+    old_cases = {case["id"]: case for case in baseline.get("cases", [])}
+    for case in report["cases"]:
+        old = old_cases.get(case["id"])
+        if old is None:
+            print(f"  {case['id']}: not in baseline")
+            continue
+        for stage, stats in case["stages"].items():
+            before = old["stages"].get(stage)
+            if not before:
+                continue
+            change = (stats["p50_ms"] - before["p50_ms"]) / before["p50_ms"] * 100 if before["p50_ms"] else 0.0
+            print(f"  {case['id']:<48} {stage:<11} {before['p50_ms']:>10.1f} -> {stats['p50_ms']:>10.1f} ms ({change:+.1f}%)")
+
+    print("\n[COMPARE] Accuracy vs baseline (upright, mean keypoint error)")
+    changed = {"upright": 0, "error_cm": []}
+    for case in report["cases"]:
+        old = old_cases.get(case["id"])
+        if old is None or "accuracy" not in case or "accuracy" not in old:
+            continue
+        before, after = old["accuracy"], case["accuracy"]
+        changed["upright"] += int(bool(after.get("upright"))) - int(bool(before.get("upright")))
+        if "mean_error_cm" in before and "mean_error_cm" in after:
+            changed["error_cm"].append(after["mean_error_cm"] - before["mean_error_cm"])
+        print(f"  {case['id']:<48} upright {str(before.get('upright')):<5} -> {str(after.get('upright')):<5} "
+              f"error {before.get('mean_error_cm', '-')} -> {after.get('mean_error_cm', '-')} cm")
+    if changed["error_cm"]:
+        print(f"  Upright cases {changed['upright']:+d}, mean error change {np.mean(changed['error_cm']):+.2f} cm "
+              f"over {len(changed['error_cm'])} case(s)")
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Benchmark the scan pipeline on synthetic humanoids.")
+    parser.add_argument("--sizes", default="10000,100000,1000000", help="comma-separated point counts (10k..5M)")
+    parser.add_argument("--orientations", default="Original", help="labels from get_rotation_matrices, or 'all'")
+    parser.add_argument("--noise", default="0.002", help="comma-separated Gaussian sigmas in metres")
+    parser.add_argument("--platform", choices=("off", "on", "both"), default="both")
+    parser.add_argument("--stages", default=",".join(STAGES), help="subset of " + ",".join(STAGES))
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--load-max-points", type=int, default=int(os.environ.get("LOAD_MAX_POINTS", "0")),
+                        help="sample scans to at most this many points while loading (0 = no cap, like the server)")
+    parser.add_argument("--memory", action="store_true", help="one extra run per stage under tracemalloc for peak MB")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--no-alignment", action="store_true", help="skip the principal-axis pre-alignment (full search)")
+    parser.add_argument("--lean", action="store_true", help="float32 memory-lean estimator (POSE_LEAN_MEMORY)")
+    parser.add_argument("--cascade-top-k", type=int, default=int(os.environ.get("POSE_CASCADE_TOP_K", "0")),
+                        help="orientations given to the full model after the coarse ranking (0 = no cascade)")
+    parser.add_argument("--cascade-image-size", type=int, default=int(os.environ.get("POSE_CASCADE_IMAGE_SIZE", "256")))
+    parser.add_argument("--cascade-complexity", type=int, default=int(os.environ.get("POSE_CASCADE_COMPLEXITY", "0")))
+    parser.add_argument("--output", help="write the JSON report here (default: stdout)")
+    parser.add_argument("--compare", help="baseline JSON report to diff p50 latencies against")
+    args = parser.parse_args()
+    args.stages = [s for s in args.stages.split(",") if s]
+    unknown = set(args.stages) - set(STAGES)
+    if unknown:
+        parser.error(f"unknown stages: {sorted(unknown)}")
+    return args
+
+
+def main():
+    args = parse_args()
+    estimator = AI_Pose_Estimator(use_alignment=not args.no_alignment, cascade_top_k=args.cascade_top_k, cascade_image_size=args.cascade_image_size,
+                                  cascade_complexity=args.cascade_complexity, lean=args.lean)
+    rotations = {label: np.asarray(m, dtype=float) for m, label in estimator.get_rotation_matrices()}
+    labels = list(rotations) if args.orientations == "all" else args.orientations.split(",")
+    platforms = {"off": [False], "on": [True], "both": [False, True]}[args.platform]
+
+    process_scan = None
+    if "end_to_end" in args.stages:
+        # Every run must do the full work, so the result cache and the
+        # orientation prior (which would also learn from synthetic scans) stay off.
+        os.environ["RESULT_CACHE_MB"] = "0"
+        os.environ["ORIENTATION_PRIOR"] = "0"
+        os.environ["POSE_ALIGNMENT"] = "0" if args.no_alignment else "1"
+        os.environ["POSE_LEAN_MEMORY"] = "1" if args.lean else "0"
+        os.environ["POSE_CASCADE_TOP_K"] = str(args.cascade_top_k)
+        os.environ["POSE_CASCADE_IMAGE_SIZE"] = str(args.cascade_image_size)
+        os.environ["POSE_CASCADE_COMPLEXITY"] = str(args.cascade_complexity)
+        from app import process_scan
+
+    started = time.time()
+    cases = []
+    with tempfile.TemporaryDirectory() as workdir:
+        for n_points in (int(s) for s in args.sizes.split(",")):
+            for label in labels:
+                for noise in (float(s) for s in args.noise.split(",")):
+                    for with_platform in platforms:
+                        cases.append(run_case(estimator, process_scan, n_points, label, rotations[label],
+                                              noise, with_platform, args, workdir))
+
+    report = {
+        "commit": git_commit(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "duration_s": round(time.time() - started, 1),
+        "python": platform_info.python_version(),
+        "numpy": np.__version__,
+        "cpu_count": os.cpu_count(),
+        "config": {k: v for k, v in vars(args).items() if k not in ("output", "compare")},
+        "max_rss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+        "cases": cases,
+    }
+
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(text)
+        print(f"[BENCH] Report written to {args.output}")
+    else:
+        print(text)
+
+    if args.compare:
+        with open(args.compare) as f:
+            compare(report, json.load(f))
+
+
+if __name__ == "__main__":
+    main()
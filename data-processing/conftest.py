@@ -0,0 +1 @@
+# Puts data-processing/ on sys.path so the tests import the modules as app.py does.
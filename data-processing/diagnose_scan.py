@@ -3,6 +3,157 @@ import numpy as np
 import sys
 import os
 
+from ply_reader import read_ply_points
+from slice_stats import height_slices, occupied_span
+
+CLUSTER_EPS = 0.3
+CLUSTER_MIN_POINTS = 30
+CLUSTER_MAX_POINTS = 200_000
+MAX_GRID_CELLS = 4_000_000
+
+def grid_shifts(ring=1):
+    r = range(-ring, ring + 1)
+    return [(dx, dy, dz) for dx in r for dy in r for dz in r if (dx, dy, dz) != (0, 0, 0)]
+
+def shifted(padded, shift, shape):
+    dx, dy, dz = shift
+    return padded[1 + dx:1 + dx + shape[0], 1 + dy:1 + dy + shape[1], 1 + dz:1 + dz + shape[2]]
+
+def voxel_components(points, eps=CLUSTER_EPS, min_points=CLUSTER_MIN_POINTS):
+    """DBSCAN-like clustering on a dense voxel grid.
+
+    Voxels are eps / 2 wide. A voxel is a core voxel when its 3x3x3 block holds
+    at least `min_points` points (the block is about as large as an eps ball),
+    core voxels touching in any of the 26 directions are merged by label
+    propagation, and occupied non-core voxels next to a cluster join it as
+    border voxels. Returns a cluster label per point, -1 for noise.
+    """
+    voxel = eps / 2
+    origin = points.min(axis=0)
+    shape = np.floor((points.max(axis=0) - origin) / voxel).astype(np.int64) + 1
+    if np.prod(shape) > MAX_GRID_CELLS:
+        # Far-away strays would blow up the grid; coarsen it instead.
+        voxel *= (np.prod(shape) / MAX_GRID_CELLS) ** (1.0 / 3.0)
+        shape = np.floor((points.max(axis=0) - origin) / voxel).astype(np.int64) + 1
+    cells = np.floor((points - origin) / voxel).astype(np.int64)
+    cells = np.minimum(cells, shape - 1)
+    flat = np.ravel_multi_index(cells.T, shape)
+
+    counts = np.bincount(flat, minlength=int(np.prod(shape))).reshape(shape)
+    padded = np.pad(counts, 1)
+    block = counts.copy()
+    for shift in grid_shifts():
+        block += shifted(padded, shift, shape)
+    occupied = counts > 0
+    core = occupied & (block >= min_points)
+
+    labels = np.where(core, np.arange(core.size).reshape(shape), -1)
+    while True:
+        padded = np.pad(labels, 1, constant_values=-1)
+        merged = labels.copy()
+        for shift in grid_shifts():
+            np.maximum(merged, shifted(padded, shift, shape), out=merged)
+        merged[~core] = -1
+        if np.array_equal(merged, labels):
+            break
+        labels = merged
+
+    # Border voxels take the label of any neighbouring core voxel.
+    padded = np.pad(labels, 1, constant_values=-1)
+    border = labels.copy()
+    for shift in grid_shifts():
+        np.maximum(border, shifted(padded, shift, shape), out=border)
+    labels = np.where(core, labels, np.where(occupied, border, -1))
+
+    point_labels = labels.ravel()[flat]
+    clustered = point_labels >= 0
+    _, point_labels[clustered] = np.unique(point_labels[clustered], return_inverse=True)
+    return point_labels
+
+def score_scan(points, seed=42):
+    """Quality score of a scan from its points, without printing.
+
+    Returns a report dict with the basic stats, the cluster analysis and the
+    score (0..4) with its verdict. Clustering runs on at most
+    CLUSTER_MAX_POINTS points with `min_points` scaled to the sample, which
+    keeps the main-cluster share while bounding the cost.
+    """
+    points = np.asarray(points)
+    num_points = len(points)
+    report = {"num_points": num_points, "score": 0.0, "max_score": 4}
+    if num_points == 0:
+        report.update(verdict="empty", ok=False)
+        return report
+
+    extent = points.max(axis=0) - points.min(axis=0)
+    volume = float(np.prod(extent))
+    density = num_points / volume if volume > 0 else 0
+    report.update(extent=[float(e) for e in extent], volume=volume, density=density, height=float(extent[2]))
+
+    profile = height_slices(points, 100, axis=2)
+    bottom, top = occupied_span(profile)
+    span = (profile["edges"] >= bottom) & (profile["edges"] < top)
+    report["height_without_strays"] = top - bottom
+    report["empty_height_bands"] = int(np.count_nonzero(profile["count"][span[:-1]] == 0))
+
+    score = 0.0
+    if num_points < 5000:
+        report["point_count_level"] = "very low"
+    elif num_points < 15000:
+        report["point_count_level"] = "low"
+        score += 1
+    elif num_points < 30000:
+        report["point_count_level"] = "moderate"
+        score += 2
+    else:
+        report["point_count_level"] = "high"
+        score += 3
+
+    if density < 5000:
+        report["density_level"] = "sparse"
+    elif density < 15000:
+        report["density_level"] = "moderate"
+        score += 1
+    else:
+        report["density_level"] = "good"
+        score += 1
+
+    sample = points
+    if num_points > CLUSTER_MAX_POINTS:
+        rng = np.random.default_rng(seed)
+        sample = points[rng.choice(num_points, CLUSTER_MAX_POINTS, replace=False)]
+    min_points = max(2, int(round(CLUSTER_MIN_POINTS * len(sample) / num_points)))
+    labels = voxel_components(sample, min_points=min_points)
+    sizes = np.bincount(labels[labels >= 0]) if np.any(labels >= 0) else np.zeros(0, dtype=np.int64)
+    report["clusters"] = int(len(sizes))
+    if len(sizes):
+        pct_main_cluster = float(sizes.max()) / len(sample) * 100
+        report["main_cluster_pct"] = pct_main_cluster
+        report["main_cluster_points"] = int(round(pct_main_cluster / 100 * num_points))
+        if pct_main_cluster < 50:
+            report["cluster_level"] = "noisy background"
+        elif pct_main_cluster < 70:
+            report["cluster_level"] = "acceptable"
+            score += 0.5
+        else:
+            report["cluster_level"] = "clear main cluster"
+            score += 1
+
+    report["score"] = score
+    if score < 1.5:
+        report.update(verdict="insufficient", ok=False)
+    elif score < 3.0:
+        report.update(verdict="moderate", ok=True)
+    else:
+        report.update(verdict="good", ok=True)
+    return report
+
+def load_points(file_path):
+    try:
+        return read_ply_points(file_path)
+    except ValueError:
+        return np.asarray(o3d.io.read_point_cloud(file_path).points)
+
 def diagnose_scan(file_path):
     print("DIAGNOSTIC: 3D scan quality check")
 
@@ -14,103 +165,51 @@ def diagnose_scan(file_path):
     print(f"Size: {os.path.getsize(file_path) / 1024:.1f} KB")
 
     try:
-        pcd = o3d.io.read_point_cloud(file_path)
-        if pcd.is_empty():
+        points = load_points(file_path)
+        if len(points) == 0:
             print("ERROR: File is empty or corrupt")
             return False
     except Exception as e:
         print(f"ERROR reading file: {e}")
         return False
 
-    points = np.asarray(pcd.points)
-    num_points = len(points)
+    report = score_scan(points)
+    extent = report["extent"]
 
     print("Basic stats:")
-    print(f"  Total points: {num_points:,}")
-
-    bbox = pcd.get_axis_aligned_bounding_box()
-    extent = bbox.get_extent()
-    volume = np.prod(extent)
-    density = num_points / volume if volume > 0 else 0
-
+    print(f"  Total points: {report['num_points']:,}")
     print(f"  Dimensions (L x W x H): {extent[0]:.2f} x {extent[1]:.2f} x {extent[2]:.2f} m")
-    print(f"  Volume: {volume:.2f} m^3")
-    print(f"  Density: {density:.1f} points/m^3")
-
-    height = extent[2]
-    print(f"Detected height: {height:.2f} m")
+    print(f"  Volume: {report['volume']:.2f} m^3")
+    print(f"  Density: {report['density']:.1f} points/m^3")
 
-    score = 0
-    max_score = 4
+    print(f"Detected height: {report['height']:.2f} m")
+    print(f"  Height without sparse strays: {report['height_without_strays']:.2f} m")
+    print(f"  Empty height bands (1% each): {report['empty_height_bands']}")
 
     print("Evaluating absolute density:")
-    if num_points < 5000:
-        print(f"  Very low ({num_points:,} points)")
-        score += 0
-    elif num_points < 15000:
-        print(f"  Low ({num_points:,} points)")
-        score += 1
-    elif num_points < 30000:
-        print(f"  Moderate ({num_points:,} points)")
-        score += 2
-    else:
-        print(f"  High ({num_points:,} points)")
-        score += 3
+    print(f"  {report['point_count_level'].capitalize()} ({report['num_points']:,} points)")
 
     print("Evaluating relative density (points/m^3):")
-    if density < 5000:
-        print(f"  Sparse ({density:.0f} p/m^3)")
-        score += 0
-    elif density < 15000:
-        print(f"  Moderate ({density:.0f} p/m^3)")
-        score += 1
-    else:
-        print(f"  Good ({density:.0f} p/m^3)")
-        score += 1
+    print(f"  {report['density_level'].capitalize()} ({report['density']:.0f} p/m^3)")
 
     print("Checking clustering:")
-    try:
-        labels = np.array(pcd.cluster_dbscan(eps=0.3, min_points=30, print_progress=False))
-        num_clusters = labels.max() + 1
-
-        if num_clusters == 0:
-            print("  No clusters detected")
-            score += 0
-        else:
-            largest_cluster_size = 0
-            for i in range(num_clusters):
-                cluster_size = np.sum(labels == i)
-                if cluster_size > largest_cluster_size:
-                    largest_cluster_size = cluster_size
-
-            pct_main_cluster = (largest_cluster_size / num_points) * 100
-            print(f"  Clusters found: {num_clusters}")
-            print(f"  Main cluster: {largest_cluster_size:,} points ({pct_main_cluster:.1f}%)")
-
-            if pct_main_cluster < 50:
-                print("  Main cluster <50% - noisy background")
-                score += 0
-            elif pct_main_cluster < 70:
-                print("  Main cluster ~50-70% - acceptable")
-                score += 0.5
-            else:
-                print("  Clear main cluster")
-                score += 1
-    except Exception as e:
-        print(f"  Clustering failed: {e}")
+    if report["clusters"] == 0:
+        print("  No clusters detected")
+    else:
+        print(f"  Clusters found: {report['clusters']}")
+        print(f"  Main cluster: {report['main_cluster_points']:,} points ({report['main_cluster_pct']:.1f}%)")
+        print(f"  {report['cluster_level'].capitalize()}")
 
     print("Final score:")
-    print(f"  Score: {score:.1f}/{max_score}")
+    print(f"  Score: {report['score']:.1f}/{report['max_score']}")
 
-    if score < 1.5:
+    if report["verdict"] == "insufficient":
         print("VERDICT: Insufficient scan quality")
-        return False
-    elif score < 3.0:
+    elif report["verdict"] == "moderate":
         print("VERDICT: Moderate quality")
-        return True
     else:
         print("VERDICT: Good quality")
-        return True
+    return report["ok"]
 
 if __name__ == "__main__":
     if len(sys.argv) < 2:
@@ -0,0 +1,77 @@
+import queue
+import threading
+from contextlib import contextmanager
+
+from model_loader import AI_Pose_Estimator
+
+
+class EstimatorPool:
+    """Bounded pool of AI_Pose_Estimator instances.
+
+    A MediaPipe Pose graph must not be driven by two threads at once, so every
+    request checks out a whole estimator and hands it back when done. Instances
+    are created lazily, up to `size`, the first time they are needed.
+    """
+
+    def __init__(self, size=1, **estimator_kwargs):
+        self.size = max(1, int(size))
+        self.estimator_kwargs = estimator_kwargs
+        self._idle = queue.LifoQueue()
+        self._created = 0
+        self._lock = threading.Lock()
+
+    def _create_if_allowed(self):
+        with self._lock:
+            if self._created >= self.size:
+                return None
+            self._created += 1
+        try:
+            return AI_Pose_Estimator(**self.estimator_kwargs)
+        except Exception:
+            with self._lock:
+                self._created -= 1
+            raise
+
+    def acquire(self, timeout=None):
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            pass
+
+        engine = self._create_if_allowed()
+        if engine is not None:
+            return engine
+
+        try:
+            return self._idle.get(timeout=timeout)
+        except queue.Empty:
+            raise TimeoutError(f"No AI engine became free within {timeout}s ({self.size} in use)")
+
+    def release(self, engine):
+        self._idle.put(engine)
+
+    @contextmanager
+    def checkout(self, timeout=None):
+        engine = self.acquire(timeout=timeout)
+        try:
+            yield engine
+        finally:
+            self.release(engine)
+
+    def fill(self, warm_up=False):
+        """Creates every estimator not created yet, optionally running a warm-up inference on each."""
+        while True:
+            engine = self._create_if_allowed()
+            if engine is None:
+                return
+            try:
+                if warm_up:
+                    print(f"   [POOL] Estimator warmed up in {engine.warm_up():.2f}s")
+            finally:
+                self.release(engine)
+
+    def stats(self):
+        with self._lock:
+            created = self._created
+        idle = self._idle.qsize()
+        return {"size": self.size, "created": created, "idle": idle, "busy": created - idle}
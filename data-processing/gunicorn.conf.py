@@ -0,0 +1,36 @@
+"""Preforked production server for app.py:
+
+    gunicorn -c gunicorn.conf.py app:app
+
+The master imports app.py once (preload_app), so open3d, MediaPipe, cv2 and
+numpy are loaded a single time and shared copy-on-write by the workers.
+MediaPipe graphs run native threads that do not survive a fork, so each
+worker builds and warms its own estimators right after it starts. Until then
+/health/live answers 200 and /health/ready answers 503.
+
+Job state (/jobs), the in-memory result cache and /metrics are per worker,
+so a job poll could reach a worker that never saw the job. While the /jobs
+API is on (JOB_API=1, the default) one worker is started unless
+SERVER_WORKERS says otherwise; set JOB_API=0 to default to two.
+"""
+
+import os
+
+bind = f"{os.environ.get('HOST', '0.0.0.0')}:{os.environ.get('PORT', '5000')}"
+job_api = os.environ.get("JOB_API", "1") == "1"
+workers = int(os.environ.get("SERVER_WORKERS", "1" if job_api else "2"))
+worker_class = "gthread"
+threads = int(os.environ.get("HTTP_THREADS", str(int(os.environ.get("POSE_WORKERS", "1")) + 2)))
+preload_app = True
+
+
+def when_ready(server):
+    import app
+    server.log.info(f"Master ready, app.py imported in {app.startup['import_seconds']:.2f}s; forking {workers} worker(s)")
+    if job_api and workers > 1:
+        server.log.warning(f"{workers} workers with the /jobs API on: job polls may reach a worker that does not know the job")
+
+
+def post_worker_init(worker):
+    import app
+    app.start_warm_up()
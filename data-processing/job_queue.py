@@ -0,0 +1,117 @@
+import os
+import queue
+import threading
+import time
+import uuid
+
+
+class QueueFullError(Exception):
+    pass
+
+
+class ScanJobQueue:
+    """Bounded FIFO of scan jobs drained by a pool of background threads.
+
+    `handler(path, height, options)` is run for every job and its return value is kept
+    as the job result. The upload at `path` (a file path, or an object with
+    `discard()` such as a PlyUpload) is deleted once the job has run.
+    Finished jobs are forgotten after `result_ttl` seconds; expired ones are
+    dropped on every submit, get and stats call and after each job.
+    """
+
+    def __init__(self, handler, workers=1, max_queue=16, result_ttl=3600):
+        self.handler = handler
+        self.workers = max(1, int(workers))
+        self.max_queue = max(1, int(max_queue))
+        self.result_ttl = result_ttl
+        self._queue = queue.Queue(maxsize=self.max_queue)
+        self._jobs = {}
+        self._lock = threading.Lock()
+        self._threads = []
+        self._running = 0
+
+    def _ensure_started(self):
+        with self._lock:
+            if self._threads:
+                return
+            for i in range(self.workers):
+                thread = threading.Thread(target=self._worker_loop, name=f"scan-job-{i}", daemon=True)
+                thread.start()
+                self._threads.append(thread)
+
+    def submit(self, path, height, options=None):
+        self._ensure_started()
+        self._purge_expired()
+
+        job_id = uuid.uuid4().hex
+        job = {"id": job_id, "status": "queued", "submitted_at": time.time(), "started_at": None, "finished_at": None, "result": None}
+        with self._lock:
+            self._jobs[job_id] = job
+        try:
+            self._queue.put_nowait((job_id, path, height, options or {}))
+        except queue.Full:
+            with self._lock:
+                del self._jobs[job_id]
+            raise QueueFullError(f"Scan queue is full ({self.max_queue} jobs waiting)")
+        return job_id
+
+    def get(self, job_id):
+        self._purge_expired()
+        with self._lock:
+            job = self._jobs.get(job_id)
+            return dict(job) if job is not None else None
+
+    def stats(self):
+        self._purge_expired()
+        with self._lock:
+            running = self._running
+            finished = sum(1 for job in self._jobs.values() if job["status"] in ("done", "failed"))
+        depth = self._queue.qsize()
+        return {
+            "queue_depth": depth,
+            "max_queue": self.max_queue,
+            "workers": self.workers,
+            "running": running,
+            "idle_workers": self.workers - running,
+            "finished_jobs_retained": finished,
+            "accepting": depth < self.max_queue,
+        }
+
+    def _worker_loop(self):
+        while True:
+            job_id, path, height, options = self._queue.get()
+            with self._lock:
+                job = self._jobs.get(job_id)
+                if job is not None:
+                    job["status"] = "running"
+                    job["started_at"] = time.time()
+                self._running += 1
+            try:
+                result = self.handler(path, height, options)
+                status = "failed" if isinstance(result, dict) and "error" in result else "done"
+            except Exception as e:
+                print(f"JOB {job_id} FAILED: {e}")
+                result, status = {"error": f"Processing error: {e}"}, "failed"
+            finally:
+                if hasattr(path, "discard"):
+                    path.discard()
+                elif os.path.exists(path):
+                    os.remove(path)
+                with self._lock:
+                    self._running -= 1
+                self._queue.task_done()
+
+            with self._lock:
+                job = self._jobs.get(job_id)
+                if job is not None:
+                    job["status"] = status
+                    job["result"] = result
+                    job["finished_at"] = time.time()
+            self._purge_expired()
+
+    def _purge_expired(self):
+        cutoff = time.time() - self.result_ttl
+        with self._lock:
+            expired = [job_id for job_id, job in self._jobs.items() if job["finished_at"] is not None and job["finished_at"] < cutoff]
+            for job_id in expired:
+                del self._jobs[job_id]
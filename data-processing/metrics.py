@@ -0,0 +1,151 @@
+"""In-process counters and histograms rendered in the Prometheus text format."""
+
+import threading
+import time
+from contextlib import contextmanager
+
+SECONDS_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+POINTS_BUCKETS = (1e3, 1e4, 5e4, 1e5, 2.5e5, 5e5, 1e6, 2.5e6, 5e6, 1e7)
+
+REGISTRY = []
+
+
+def _label_text(labelnames, values):
+    if not labelnames:
+        return ""
+    pairs = ",".join(f'{name}="{value}"' for name, value in zip(labelnames, values))
+    return "{" + pairs + "}"
+
+
+class Counter:
+    def __init__(self, name, help_text, labelnames=()):
+        self.name = name
+        self.help_text = help_text
+        self.labelnames = tuple(labelnames)
+        # An unlabelled counter is exported as 0 before its first increment.
+        self._values = {} if self.labelnames else {(): 0}
+        self._lock = threading.Lock()
+        REGISTRY.append(self)
+
+    def inc(self, amount=1, **labels):
+        key = tuple(str(labels[name]) for name in self.labelnames)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for key, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{_label_text(self.labelnames, key)} {value}")
+        return lines
+
+
+class Gauge:
+    def __init__(self, name, help_text, labelnames=()):
+        self.name = name
+        self.help_text = help_text
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+        REGISTRY.append(self)
+
+    def set(self, value, **labels):
+        key = tuple(str(labels[name]) for name in self.labelnames)
+        with self._lock:
+            self._values[key] = value
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} gauge"]
+        with self._lock:
+            for key, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{_label_text(self.labelnames, key)} {value}")
+        return lines
+
+
+class Histogram:
+    def __init__(self, name, help_text, labelnames=(), buckets=SECONDS_BUCKETS):
+        self.name = name
+        self.help_text = help_text
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        self._series = {}
+        self._lock = threading.Lock()
+        REGISTRY.append(self)
+
+    def observe(self, value, **labels):
+        key = tuple(str(labels[name]) for name in self.labelnames)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = {"counts": [0] * len(self.buckets), "sum": 0.0, "count": 0}
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series["counts"][i] += 1
+            series["sum"] += value
+            series["count"] += 1
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        names = self.labelnames + ("le",)
+        with self._lock:
+            for key, series in sorted(self._series.items()):
+                for bound, count in zip(self.buckets, series["counts"]):
+                    lines.append(f"{self.name}_bucket{_label_text(names, key + (f'{bound:g}',))} {count}")
+                lines.append(f"{self.name}_bucket{_label_text(names, key + ('+Inf',))} {series['count']}")
+                lines.append(f"{self.name}_sum{_label_text(self.labelnames, key)} {series['sum']}")
+                lines.append(f"{self.name}_count{_label_text(self.labelnames, key)} {series['count']}")
+        return lines
+
+
+def render_all():
+    lines = []
+    for metric in REGISTRY:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+
+STAGE_SECONDS = Histogram("scan_stage_seconds", "Time spent in each scan pipeline stage.", ("stage",))
+SCANS = Counter("scans_total", "Scans processed, by outcome.", ("outcome",))
+AI_FAILURES = Counter("ai_failures_total", "Scans where the pose estimator raised.")
+HEURISTIC_FALLBACKS = Counter("heuristic_fallbacks_total", "Scans answered by get_heuristic_keypoints.")
+STARTUP_SECONDS = Gauge("startup_seconds", "Seconds this process spent in each startup phase.", ("phase",))
+SCAN_POINTS = Histogram("scan_points", "Point count of a scan at each pipeline step.", ("step",), POINTS_BUCKETS)
+
+
+class StageTimings:
+    """Per-request stage timer.
+
+    Every finished stage is observed in STAGE_SECONDS and summed into this
+    request's breakdown; repeated stages (one render per orientation) add up.
+    Safe to share with the orientation search threads.
+    """
+
+    def __init__(self):
+        self._ms = {}
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def stage(self, name):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(name, time.perf_counter() - started)
+
+    def record(self, name, seconds):
+        STAGE_SECONDS.observe(seconds, stage=name)
+        with self._lock:
+            self._ms[name] = self._ms.get(name, 0.0) + seconds * 1000
+
+    def as_dict(self):
+        with self._lock:
+            return {name: round(ms, 1) for name, ms in self._ms.items()}
+
+
+@contextmanager
+def maybe_stage(timings, name):
+    if timings is None:
+        yield
+    else:
+        with timings.stage(name):
+            yield
@@ -1,45 +1,194 @@
+import os
+import queue
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
 import numpy as np
 import mediapipe as mp
 import cv2
 import open3d as o3d
 
+from spatial_index import GridIndex
+from metrics import maybe_stage
+from point_sampling import sample_points
+from slice_stats import height_slices, horizontal_spread
+
+SPLAT_RADIUS = 5
+SPLAT_KERNEL = cv2.circle(
+    np.zeros((2 * SPLAT_RADIUS + 1, 2 * SPLAT_RADIUS + 1), dtype=np.uint8),
+    (SPLAT_RADIUS, SPLAT_RADIUS), SPLAT_RADIUS, 1, -1,
+)
+MIN_POSE_SCORE = 0.3
+COARSE_MAX_POINTS = 50000
+# MediaPipe Pose landmark index of every keypoint that is lifted to 3D.
+KEYPOINT_LANDMARKS = {
+    "nose": 0,
+    "l_ear": 7,
+    "r_ear": 8,
+    "l_shoulder": 11,
+    "r_shoulder": 12,
+    "l_hip": 23,
+    "r_hip": 24,
+    "l_knee": 25,
+    "r_knee": 26,
+    "l_ankle": 27,
+    "r_ankle": 28,
+}
+
+
+def splat_kernel(image_size):
+    # SPLAT_RADIUS is tuned for 1024 px renders; smaller renders get a
+    # proportionally smaller disc so the silhouette keeps its shape.
+    radius = max(1, int(round(SPLAT_RADIUS * image_size / 1024)))
+    if radius == SPLAT_RADIUS:
+        return SPLAT_KERNEL
+    return cv2.circle(np.zeros((2 * radius + 1, 2 * radius + 1), dtype=np.uint8), (radius, radius), radius, 1, -1)
+
+
+def sample_point_cloud(points_original, max_points, method):
+    """The subsample returned with the keypoints (and drawn by visualize_skeleton).
+
+    Only the response uses it: the orientation search, the renders and the
+    landmark lifting keep working on the whole loaded cloud, whose size is
+    set by the loader (LOAD_MAX_POINTS, LOAD_SAMPLING). It is drawn after
+    the analysis, so the server can do it without holding an estimator.
+    """
+    try:
+        point_cloud_data = sample_points(points_original, max_points, method)
+        print(f"   [POINT_CLOUD] Raw subsampled ({method}, no transforms): {len(points_original)} -> {len(point_cloud_data)} points")
+    except Exception as pc_e:
+        print(f"   [POINT_CLOUD WARNING] Raw subsampling failed: {pc_e}")
+        point_cloud_data = np.empty((0, 3))
+    return point_cloud_data
+
+
+def warm_up_figure(points_per_segment=400):
+    # Rough 1.75 m stick figure (y up, metres), enough for the detector and
+    # the landmark model to both run during warm-up.
+    segments = [
+        ((0.0, 1.50), (0.0, 1.75)), ((0.0, 1.00), (0.0, 1.50)),
+        ((-0.20, 1.45), (0.20, 1.45)), ((-0.20, 1.45), (-0.30, 0.95)), ((0.20, 1.45), (0.30, 0.95)),
+        ((-0.10, 1.00), (0.10, 1.00)), ((-0.10, 1.00), (-0.12, 0.0)), ((0.10, 1.00), (0.12, 0.0)),
+    ]
+    t = np.linspace(0.0, 1.0, points_per_segment)[:, None]
+    lines = [np.hstack([np.array(a) + t * (np.array(b) - np.array(a)), np.zeros((points_per_segment, 1))]) for a, b in segments]
+    return np.vstack(lines)
+
 
 class AI_Pose_Estimator:
-    def __init__(self):
+    def __init__(self, search_workers=1, use_alignment=True, align_min_confidence=0.5, align_top_k=2, align_accept_score=1.2,
+                 search_accept_score=1.2, prior=None, cascade_top_k=0, cascade_image_size=256, cascade_complexity=0, lean=False,
+                 point_cloud_points=50000, point_cloud_sampling="uniform", debug_dir=None):
         print("--> [AI] Initializing Brute-Force Scaling Engine v6...")
         self.mp_pose = mp.solutions.pose
-        self.pose = self.mp_pose.Pose(
-            static_image_mode=True,
-            model_complexity=2,
+        self.pose = self.create_pose()
+
+        # Principal-axis pre-alignment: when confident, only the top-k ranked
+        # orientations are tried first and the search stops once one of them
+        # scores at least search_accept_score (None turns the early exit off).
+        # Otherwise all 9 are evaluated. align_accept_score is the score a
+        # tracked frame needs in predict_sequence.
+        self.use_alignment = use_alignment
+        self.align_min_confidence = align_min_confidence
+        self.align_top_k = align_top_k
+        self.align_accept_score = align_accept_score
+        self.search_accept_score = search_accept_score
+
+        # Learned orientation prior (OrientationPrior, shared by every estimator
+        # of a pool). When it is confident it orders the candidates instead
+        # of the alignment, otherwise it only reorders the alignment ranking;
+        # any candidate scoring at least search_accept_score ends the search.
+        self.prior = prior
+
+        # Coarse-to-fine cascade for searches neither the prior nor the
+        # alignment can shortcut: with cascade_top_k > 0 every orientation is
+        # first scored on a cascade_image_size render by a light Pose model and
+        # only the best cascade_top_k go through the full model. The clean
+        # re-render always uses the full model.
+        self.cascade_top_k = max(0, int(cascade_top_k))
+        self.cascade_image_size = cascade_image_size
+        self.coarse_pose = None
+        if self.cascade_top_k > 0:
+            self.coarse_pose = self.create_pose(model_complexity=cascade_complexity)
+            print(f"   [AI] Cascade: {cascade_image_size}px complexity-{cascade_complexity} ranking, "
+                  f"full model on top {self.cascade_top_k}")
+
+        # Memory-lean mode: the search works on a float32 copy of the cloud
+        # (see analyze for the peak per point).
+        self.dtype = np.float32 if lean else np.float64
+
+        # Subsample returned with the keypoints (see point_sampling.SAMPLERS);
+        # both can be overridden per call of predict. It does not
+        # change the points the search renders, see sample_point_cloud.
+        self.point_cloud_points = point_cloud_points
+        self.point_cloud_sampling = point_cloud_sampling
+
+        # With debug_dir set, every render is written there as PNG, named
+        # per process and thread so concurrent searches do not overwrite
+        # each other. Off by default: the encode sits in the timed path.
+        self.debug_dir = debug_dir
+
+        # Parallel orientation search: every worker owns a private Pose graph,
+        # checked out of a queue for the duration of one candidate.
+        self.search_workers = max(1, int(search_workers))
+        self.search_executor = None
+        self.search_poses = None
+        if self.search_workers > 1:
+            self.search_executor = ThreadPoolExecutor(max_workers=self.search_workers, thread_name_prefix="pose-search")
+            self.search_poses = queue.Queue()
+            for _ in range(self.search_workers):
+                self.search_poses.put(self.create_pose())
+            print(f"   [AI] Parallel orientation search: {self.search_workers} workers")
+        print("   [AI] System Ready.")
+
+    def create_pose(self, static_image_mode=True, model_complexity=2):
+        return self.mp_pose.Pose(
+            static_image_mode=static_image_mode,
+            model_complexity=model_complexity,
             enable_segmentation=False,
             min_detection_confidence=0.3,
         )
-        print("   [AI] System Ready.")
+
+    def warm_up(self):
+        """Runs one inference on every Pose graph so the first scan does not pay for model loading.
+
+        Returns the seconds it took.
+        """
+        started = time.perf_counter()
+        figure = warm_up_figure()
+        img, _ = self.render_snapshot(figure)
+        self.pose.process(img)
+        if self.search_poses is not None:
+            poses = [self.search_poses.get() for _ in range(self.search_workers)]
+            try:
+                for pose in poses:
+                    pose.process(img)
+            finally:
+                for pose in poses:
+                    self.search_poses.put(pose)
+        if self.coarse_pose is not None:
+            coarse_img, _ = self.render_snapshot(figure, image_size=self.cascade_image_size)
+            self.coarse_pose.process(coarse_img)
+        return time.perf_counter() - started
+
+    def write_debug_image(self, label, img):
+        if self.debug_dir:
+            name = f"debug_{os.getpid()}_{threading.get_ident()}_{label}.png"
+            cv2.imwrite(os.path.join(self.debug_dir, name), img)
 
     def remove_platform_by_spread_jump(self, points_rotated, n_slices=20, ratio_threshold=1.6):
         if len(points_rotated) < 200:
             return points_rotated, False
 
-        min_y = np.min(points_rotated[:, 1])
-        max_y = np.max(points_rotated[:, 1])
+        min_y = float(np.min(points_rotated[:, 1]))
+        max_y = float(np.max(points_rotated[:, 1]))
         height = max_y - min_y
         if height <= 0:
             return points_rotated, False
 
         slice_h = height / n_slices
-        spreads = []
-        for i in range(n_slices):
-            lo = min_y + i * slice_h
-            hi = lo + slice_h
-            mask = (points_rotated[:, 1] >= lo) & (points_rotated[:, 1] < hi)
-            pts = points_rotated[mask]
-            if len(pts) < 10:
-                spreads.append(0.0)
-                continue
-            spread = max(np.max(pts[:, 0]) - np.min(pts[:, 0]), np.max(pts[:, 2]) - np.min(pts[:, 2]))
-            spreads.append(float(spread))
-
-        spreads = np.array(spreads)
+        spreads = horizontal_spread(height_slices(points_rotated, n_slices, axis=1), axis=1, min_count=10)
 
         mid_lo = int(n_slices * 0.2)
         mid_hi = int(n_slices * 0.8)
@@ -88,8 +237,10 @@ class AI_Pose_Estimator:
         u_coords = points[:, 0]
         v_coords = points[:, 1]
 
-        min_u, max_u = np.min(u_coords), np.max(u_coords)
-        min_v, max_v = np.min(v_coords), np.max(v_coords)
+        # Projection math runs in float64 whatever the cloud's dtype, so a
+        # float32 cloud lands on the same pixels as a float64 one.
+        min_u, max_u = float(np.min(u_coords)), float(np.max(u_coords))
+        min_v, max_v = float(np.min(v_coords)), float(np.max(v_coords))
 
         span_u = max_u - min_u
         span_v = max_v - min_v
@@ -101,18 +252,91 @@ class AI_Pose_Estimator:
         center_u = (min_u + max_u) / 2
         center_v = (min_v + max_v) / 2
 
-        u_px = ((u_coords - center_u) * scale + image_size / 2).astype(int)
-        v_px = (image_size / 2 - (v_coords - center_v) * scale).astype(int)
+        # In-place steps and int32 pixels keep the per-point temporaries small.
+        u = np.subtract(u_coords, center_u, dtype=np.float64)
+        u *= scale
+        u += image_size / 2
+        u_px = u.astype(np.int32)
+        v = np.subtract(v_coords, center_v, dtype=np.float64)
+        v *= -scale
+        v += image_size / 2
+        v_px = v.astype(np.int32)
+        del u, v
 
-        img = np.full((image_size, image_size, 3), 255, dtype=np.uint8)
         valid = (u_px >= 0) & (u_px < image_size) & (v_px >= 0) & (v_px < image_size)
-        for u, v in zip(u_px[valid], v_px[valid]):
-            cv2.circle(img, (int(u), int(v)), 5, (0, 0, 0), -1)
+        flat_px = v_px[valid] * image_size + u_px[valid]
+
+        # Bin every point into its pixel at once, then stamp the disc footprint
+        # over all hit pixels with a single dilation instead of one circle per point.
+        hits = np.zeros(image_size * image_size, dtype=np.uint8)
+        hits[flat_px] = 255
+        silhouette = cv2.dilate(hits.reshape(image_size, image_size), splat_kernel(image_size))
+
+        img = cv2.cvtColor(255 - silhouette, cv2.COLOR_GRAY2BGR)
         img = cv2.GaussianBlur(img, (5, 5), 0)
 
-        params = {"scale": scale, "center_u": center_u, "center_v": center_v, "image_size": image_size}
+        params = {"scale": scale, "center_u": center_u, "center_v": center_v, "image_size": image_size, "span_v": span_v}
+
         return img, params
 
+    def estimate_principal_alignment(self, points_centered, max_points=20000, end_fraction=0.05):
+        n = len(points_centered)
+        if n < 100:
+            return None
+        sample = points_centered[::max(1, n // max_points)]
+
+        evals, evecs = np.linalg.eigh(np.cov(sample.T))
+        long_axis = evecs[:, 2]
+        width_axis = evecs[:, 1]
+        if evals[2] <= 0:
+            return None
+        elongation = 1.0 - np.sqrt(max(evals[1], 0.0) / evals[2])
+
+        along = sample @ long_axis
+        across = sample @ width_axis
+        lo, hi = np.min(along), np.max(along)
+        extent = hi - lo
+        if extent <= 0:
+            return None
+
+        # Cue 1: the torso, arms and head put the centroid above mid-height,
+        # so the mean sits on the head side of the long axis.
+        asym = (np.mean(along) - (lo + hi) / 2) / extent
+        # Cue 2: the end slice holding the head is narrower than the one holding
+        # both feet (and any scanner platform).
+        end = extent * end_fraction
+        low_end = across[along < lo + end]
+        high_end = across[along > hi - end]
+        if len(low_end) < 10 or len(high_end) < 10:
+            return None
+        width_low = np.max(low_end) - np.min(low_end)
+        width_high = np.max(high_end) - np.min(high_end)
+
+        head_sign_mass = np.sign(asym)
+        head_sign_width = np.sign(width_low - width_high)
+        agree = head_sign_mass != 0 and head_sign_mass == head_sign_width
+
+        head_axis = long_axis * (head_sign_mass if head_sign_mass != 0 else 1.0)
+        confidence = float(min(1.0, abs(asym) / 0.03) * elongation) if agree else 0.0
+
+        return {
+            "head_axis": head_axis,
+            "width_axis": width_axis,
+            "elongation": float(elongation),
+            "asymmetry": float(asym),
+            "confidence": confidence,
+        }
+
+    def rank_rotation_candidates(self, candidates, alignment):
+        # Prefer rotations that send the head axis to image-up (+y) and the
+        # shoulder axis to image-horizontal (x) for a frontal silhouette.
+        def rank(item):
+            RotMat = np.asarray(item[1][0], dtype=float)
+            up = (RotMat @ alignment["head_axis"])[1]
+            frontal = abs((RotMat @ alignment["width_axis"])[0])
+            return up + 0.25 * frontal
+        return [idx for idx, _ in sorted(enumerate(candidates), key=rank, reverse=True)]
+
     def get_rotation_matrices(self):
         matrices, labels = [], []
         matrices.append(np.eye(3))
@@ -159,63 +383,55 @@ class AI_Pose_Estimator:
         else:
             return -0.3, "HEAD probably DOWN"
 
-    def extract_keypoints_from_clean_cloud(self, points_clean, best_rotation, global_center, real_height_meters):
-        img_clean, params_clean = self.render_snapshot(points_clean)
+    def lift_keypoints(self, points_clean, best_rotation, global_center, timings=None):
+        with maybe_stage(timings, "render"):
+            img_clean, params_clean = self.render_snapshot(points_clean)
         if img_clean is None:
             raise Exception("Cannot render cleaned cloud.")
 
-        cv2.imwrite("debug_CLEAN.png", img_clean)
+        self.write_debug_image("CLEAN", img_clean)
 
-        results_clean = self.pose.process(img_clean)
+        with maybe_stage(timings, "inference"):
+            results_clean = self.pose.process(img_clean)
         if not results_clean or not results_clean.pose_landmarks:
             raise Exception("MediaPipe failed on cleaned cloud image.")
 
         landmarks = results_clean.pose_landmarks.landmark
         print(f"   [KEYPOINTS] Re-detected on clean image: {len(landmarks)} landmarks")
 
-        mapping = {
-            "nose": 0,
-            "l_ear": 7,
-            "r_ear": 8,
-            "l_shoulder": 11,
-            "r_shoulder": 12,
-            "l_hip": 23,
-            "r_hip": 24,
-            "l_knee": 25,
-            "r_knee": 26,
-            "l_ankle": 27,
-            "r_ankle": 28,
-        }
+        return self.lift_landmarks(landmarks, params_clean, points_clean, best_rotation, global_center, timings)
 
+    def lift_landmarks(self, landmarks, params_clean, points_clean, best_rotation, global_center, timings=None):
         res = params_clean["image_size"]
         scale = params_clean["scale"]
         c_u = params_clean["center_u"]
         c_v = params_clean["center_v"]
 
-        final_keypoints = {}
-        for name, idx in mapping.items():
-            lm = landmarks[idx]
-            u_px = lm.x * res
-            v_px = lm.y * res
+        with maybe_stage(timings, "lifting"):
+            # One (x, y) grid over the clean cloud serves every landmark's depth lookup.
+            SEARCH_RADIUS = np.sqrt(0.05)
+            index = GridIndex(points_clean[:, :2], SEARCH_RADIUS)
 
-            rot_x = (u_px - res / 2) / scale + c_u
-            rot_y = c_v - (v_px - res / 2) / scale
+            final_keypoints = {}
+            for name, idx in KEYPOINT_LANDMARKS.items():
+                lm = landmarks[idx]
+                u_px = lm.x * res
+                v_px = lm.y * res
 
-            dist_sq = ((points_clean[:, 0] - rot_x) ** 2 + (points_clean[:, 1] - rot_y) ** 2)
-            min_idx = np.argmin(dist_sq)
+                rot_x = (u_px - res / 2) / scale + c_u
+                rot_y = c_v - (v_px - res / 2) / scale
 
-            SEARCH_RADIUS_SQ = 0.05
-            nearby_mask = dist_sq < SEARCH_RADIUS_SQ
-            if np.any(nearby_mask):
-                rot_z = np.median(points_clean[nearby_mask, 2])
-            else:
-                nearest_10 = np.argsort(dist_sq)[:10]
-                rot_z = np.median(points_clean[nearest_10, 2])
+                nearby = index.query_radius((rot_x, rot_y), SEARCH_RADIUS)
+                if len(nearby):
+                    rot_z = np.median(points_clean[nearby, 2])
+                else:
+                    nearest_10 = index.query_knn((rot_x, rot_y), 10)
+                    rot_z = np.median(points_clean[nearest_10, 2])
 
-            point_rot = np.array([rot_x, rot_y, rot_z])
-            point_orig = np.dot(point_rot, best_rotation) + global_center
+                point_rot = np.array([rot_x, rot_y, rot_z])
+                point_orig = np.dot(point_rot, best_rotation) + global_center
 
-            final_keypoints[name] = {"x": float(point_orig[0]), "y": float(point_orig[1]), "z": float(point_orig[2])}
+                final_keypoints[name] = {"x": float(point_orig[0]), "y": float(point_orig[1]), "z": float(point_orig[2])}
 
         min_y = np.min(points_clean[:, 1])
         max_y = np.max(points_clean[:, 1])
@@ -223,6 +439,33 @@ class AI_Pose_Estimator:
         if current_height <= 0:
             current_height = 1.0
 
+        return final_keypoints, float(current_height)
+
+    @staticmethod
+    def preview_keypoints(candidate, global_center):
+        """Rough keypoints of a search candidate, straight from its own landmarks.
+
+        Pixels are mapped back through the candidate's render at the cloud's
+        mean depth, without platform removal or the clean re-detection, and
+        the rendered cloud's height stands in for the clean height.
+        """
+        params = candidate["params"]
+        res = params["image_size"]
+        landmarks = candidate["results"].pose_landmarks.landmark
+        keypoints = {}
+        for name, idx in KEYPOINT_LANDMARKS.items():
+            lm = landmarks[idx]
+            rot_x = (lm.x * res - res / 2) / params["scale"] + params["center_u"]
+            rot_y = params["center_v"] - (lm.y * res - res / 2) / params["scale"]
+            point_orig = np.dot(np.array([rot_x, rot_y, 0.0]), candidate["rotation"]) + global_center
+            keypoints[name] = {"x": float(point_orig[0]), "y": float(point_orig[1]), "z": float(point_orig[2])}
+        return keypoints, float(params["span_v"]) or 1.0
+
+    @staticmethod
+    def scale_keypoints(raw_keypoints, current_height, real_height_meters):
+        """Scales keypoints lifted in scan units so the clean cloud is `real_height_meters` tall."""
+        final_keypoints = {k: dict(v) for k, v in raw_keypoints.items()}
+
         scaling_factor = real_height_meters / current_height
         print(f"   [SCALE] Height (clean): {current_height:.3f} → {real_height_meters:.3f}m  | Factor: {scaling_factor:.4f}")
 
@@ -246,95 +489,380 @@ class AI_Pose_Estimator:
 
         return {k: v for k, v in final_keypoints.items() if v is not None}
 
-    def predict(self, pcd, real_height_meters=1.75):
-        points_original = np.asarray(pcd.points)
-        global_center = np.mean(points_original, axis=0)
-        points_centered = points_original - global_center
+    def extract_keypoints_from_clean_cloud(self, points_clean, best_rotation, global_center, real_height_meters):
+        raw_keypoints, current_height = self.lift_keypoints(points_clean, best_rotation, global_center)
+        return self.scale_keypoints(raw_keypoints, current_height, real_height_meters)
 
+    def center_points(self, points_original):
+        """The cloud's mean and the cloud moved onto it, in the estimator's working dtype."""
+        global_center = np.mean(points_original, axis=0)
+        points_centered = np.empty(points_original.shape, dtype=self.dtype)
+        np.subtract(points_original, global_center, out=points_centered, casting="same_kind")
+        return global_center, points_centered
+
+    @staticmethod
+    def rotate(points, RotMat, out=None):
+        return np.matmul(points, np.asarray(RotMat, dtype=points.dtype).T, out=out)
+
+    def evaluate_orientation(self, pose, points_centered, RotMat, label, timings=None, out=None):
+        log = []
+        with maybe_stage(timings, "render"):
+            points_rotated = self.rotate(points_centered, RotMat, out)
+            img, params = self.render_snapshot(points_rotated)
+        if img is None:
+            return None, log
+
+        self.write_debug_image(label, img)
+        with maybe_stage(timings, "inference"):
+            results = pose.process(img)
+
+        if not results.pose_landmarks:
+            log.append(f"      [{label}] No landmarks detected")
+            return None, log
+
+        lms = results.pose_landmarks.landmark
+        log.append(f"      [{label}] Detected {len(lms)} landmarks")
+
+        score, score_log = self.score_landmarks(lms, points_rotated)
+        log.extend(score_log)
+
+        candidate = {"label": label, "score": score, "results": results, "rotation": RotMat, "params": params}
+        return candidate, log
+
+    def score_landmarks(self, lms, points_rotated):
+        log = []
+        h_r = np.max(points_rotated[:, 1]) - np.min(points_rotated[:, 1])
+        w_r = np.max(points_rotated[:, 0]) - np.min(points_rotated[:, 0])
+        aspect = h_r / (w_r + 0.001)
+
+        if aspect > 2.5:
+            orient_bonus, orient_txt = 0.6, f"VERY VERTICAL (aspect={aspect:.2f})"
+        elif aspect > 2.0:
+            orient_bonus, orient_txt = 0.5, f"VERTICAL (aspect={aspect:.2f})"
+        elif aspect > 1.5:
+            orient_bonus, orient_txt = 0.2, f"Semi-vertical (aspect={aspect:.2f})"
+        else:
+            orient_bonus, orient_txt = -0.3, f"HORIZONTAL (aspect={aspect:.2f})"
+
+        head_up_bonus, head_txt = self.compute_head_up_score(lms)
+        base_score = np.mean([lm.visibility for lm in lms])
+        score = base_score + orient_bonus + head_up_bonus
+
+        for idx in [11, 12]:
+            lm = lms[idx]
+            log.append(f"         Shoulder {idx}: vis={lm.visibility:.2f}, x={lm.x:.2f}, y={lm.y:.2f}")
+        log.append(f"         {orient_txt}")
+        log.append(f"         {head_txt}")
+        log.append(f"         Score: {score:.3f} (base={base_score:.2f}, orient={orient_bonus:.2f}, head_up={head_up_bonus:.2f})")
+        return score, log
+
+    def evaluate_orientation_pooled(self, points_centered, RotMat, label, timings=None, buffers=None):
+        pose = self.search_poses.get()
+        out = buffers.get() if buffers is not None else None
         try:
-            target_points = 50000
-            n_total = len(points_original)
-
-            if n_total > target_points:
-                np.random.seed(42)  # determinist
-                indices = np.random.choice(n_total, target_points, replace=False)
-                raw_point_cloud = points_original[indices]
-            else:
-                raw_point_cloud = points_original
-
-            point_cloud_data = raw_point_cloud.astype(float).tolist()
-            print(f"   [POINT_CLOUD] Raw subsampled (no transforms): {n_total} -> {len(raw_point_cloud)} points")
-        except Exception as pc_e:
-            print(f"   [POINT_CLOUD WARNING] Raw subsampling failed: {pc_e}")
-            point_cloud_data = []
-
-        best_score = -999
-        best_results = None
-        best_rotation = None
-        best_params = None
-        best_points_rotated = None
-
-        print(f"   [AI] Processing for target height: {real_height_meters}m")
+            return self.evaluate_orientation(pose, points_centered, RotMat, label, timings, out)
+        finally:
+            self.search_poses.put(pose)
+            if out is not None:
+                buffers.put(out)
+
+    def evaluate_candidates(self, points_centered, candidates, timings=None, buffers=None):
+        # `buffers` is a queue of arrays shaped like points_centered that the
+        # rotated clouds are written into, one per concurrent evaluation.
+        out = None
+        if self.search_executor is not None:
+            evaluated = self.search_executor.map(
+                lambda cand: self.evaluate_orientation_pooled(points_centered, cand[0], cand[1], timings, buffers), candidates
+            )
+        else:
+            out = buffers.get() if buffers is not None else None
+            evaluated = (self.evaluate_orientation(self.pose, points_centered, RotMat, label, timings, out) for RotMat, label in candidates)
 
-        for RotMat, label in self.get_rotation_matrices():
-            points_rotated = np.dot(points_centered, RotMat.T)
-            img, params = self.render_snapshot(points_rotated)
-            if img is None:
+        results = []
+        try:
+            for candidate, log_lines in evaluated:
+                for line in log_lines:
+                    print(line)
+                results.append((candidate, log_lines))
+        finally:
+            if out is not None:
+                buffers.put(out)
+        return results
+
+    def select_best_candidate(self, evaluated):
+        # Results are indexed in get_rotation_matrices order and only a strictly
+        # higher score wins, so the pick is the same however the work was scheduled.
+        best = None
+        for result in evaluated:
+            if result is None:
                 continue
+            candidate = result[0]
+            if candidate is not None and (best is None or candidate["score"] > best["score"]):
+                best = candidate
+        return best
+
+    def sample_point_cloud(self, points_original, max_points=None, method=None):
+        """The subsample returned with the keypoints, with the estimator's settings unless given."""
+        max_points = self.point_cloud_points if max_points is None else max_points
+        return sample_point_cloud(points_original, max_points, method or self.point_cloud_sampling)
+
+    def coarse_scores(self, points_centered, candidates, timings=None):
+        """Cascade score of every candidate: low-resolution render, light model, score_landmarks.
+
+        None for a candidate without landmarks.
+        """
+        sample = points_centered[::max(1, len(points_centered) // COARSE_MAX_POINTS)]
+        scores = []
+        for RotMat, label in candidates:
+            with maybe_stage(timings, "coarse_render"):
+                points_rotated = self.rotate(sample, RotMat)
+                img, _ = self.render_snapshot(points_rotated, image_size=self.cascade_image_size)
+            with maybe_stage(timings, "coarse_inference"):
+                results = self.coarse_pose.process(img)
+            score = None
+            if results.pose_landmarks:
+                score, _ = self.score_landmarks(results.pose_landmarks.landmark, points_rotated)
+            scores.append(score)
+        print("   [CASCADE] Coarse scores: " + ", ".join(
+            f"{label}={score:.2f}" if score is not None else f"{label}=-" for (_, label), score in zip(candidates, scores)))
+        return scores
+
+    def order_candidates(self, candidates, alignment, points_centered, device_id=None, timings=None):
+        """Evaluation order, size of the first batch, how many to try, the cascade scores and whether to exit early.
+
+        Most-likely-first from the prior when it is confident for the device,
+        else the alignment ranking (its top-k tried together, reordered by the
+        prior when it has some history), else the cascade ranking (only its
+        top-k tried unless none of them is usable), else the prior's order or
+        the fixed get_rotation_matrices order. Only the prior and alignment
+        orders may stop at search_accept_score; the others are exhaustive.
+        """
+        labels = [label for _, label in candidates]
+        everything = len(candidates)
+        ranked, share = self.prior.rank(labels, device_id) if self.prior is not None else (None, 0.0)
+        prior_order = [labels.index(label) for label in ranked] if ranked is not None else None
+        if prior_order is not None and self.prior.confident(share):
+            print(f"   [PRIOR] {ranked[0]} won {share:.0%} of scans, trying {ranked[:3]} first")
+            return prior_order, self.search_workers, everything, None, True
+        if alignment is not None and alignment["confidence"] >= self.align_min_confidence:
+            order = self.rank_rotation_candidates(candidates, alignment)
+            if prior_order is not None:
+                # Sum of both ranks; the alignment decides ties.
+                prior_rank = {idx: pos for pos, idx in enumerate(prior_order)}
+                order = sorted(order, key=lambda idx: order.index(idx) + prior_rank[idx])
+            print(f"   [ALIGN] Trying {[labels[i] for i in order[:self.align_top_k]]} first")
+            return order, self.align_top_k, everything, None, True
+        if self.coarse_pose is not None:
+            coarse = self.coarse_scores(points_centered, candidates, timings)
+            order = sorted(range(everything), key=lambda i: -coarse[i] if coarse[i] is not None else np.inf)
+            print(f"   [CASCADE] Full model on {[labels[i] for i in order[:self.cascade_top_k]]}")
+            return order, self.search_workers, self.cascade_top_k, coarse, False
+        if prior_order is not None:
+            print(f"   [PRIOR] Trying {ranked[:3]} first")
+            return prior_order, self.search_workers, everything, None, True
+        return list(range(everything)), self.search_workers, everything, None, False
+
+    def analyze(self, pcd, timings=None, device_id=None, progress=None):
+        """Runs the orientation search and landmark lifting without applying a target height.
+
+        The result holds the keypoints in scan units, the clean-cloud height they
+        scale against and the search metadata; `finalize` turns it into the
+        response for a given height. It does not depend on the height, so it can
+        be cached and rescaled.
+
+        Peak memory per input point, on top of the Open3D cloud: during the
+        search the centred copy plus one rotation buffer per search worker
+        (24 B each, 12 B in lean mode) and about 24 B of render temporaries per
+        worker; while lifting, the best rotation, the cleaned copy when a
+        platform was cut and about 48 B of GridIndex temporaries. Measured at
+        1M points with one search worker: 81 B/point, 69 B/point lean.
+
+        `progress`, if given, is called whenever the best orientation so far
+        changes, with its preview_keypoints and how many orientations have
+        been evaluated. The result has no point_cloud; callers attach one
+        (see predict) before `finalize`.
+        """
+        points_original = np.asarray(pcd.points)
+        global_center, points_centered = self.center_points(points_original)
+
+        # Rotated candidates are written into these instead of a new array
+        # per orientation; the best one is rotated again once at the end.
+        buffers = queue.Queue()
+        for _ in range(self.search_workers):
+            buffers.put(np.empty_like(points_centered))
+
+        candidates = list(self.get_rotation_matrices())
+        evaluated = [None] * len(candidates)
+
+        with maybe_stage(timings, "alignment"):
+            alignment = self.estimate_principal_alignment(points_centered) if self.use_alignment else None
+        if alignment is not None:
+            print(f"   [ALIGN] confidence={alignment['confidence']:.2f} "
+                  f"(elongation={alignment['elongation']:.2f}, asymmetry={alignment['asymmetry']:+.3f})")
+
+        order, first_batch, limit, coarse, early_exit = self.order_candidates(
+            candidates, alignment, points_centered, device_id, timings)
+        accept_score = self.search_accept_score if early_exit else None
+        # Batches keep every search worker busy; after each one the search
+        # stops if a candidate already cleared the acceptance score.
+        batch = self.search_workers
+        pos = 0
+        reported = None
+        while pos < len(order):
+            if pos >= limit:
+                best_so_far = self.select_best_candidate(evaluated)
+                if best_so_far is not None and best_so_far["score"] >= MIN_POSE_SCORE:
+                    break
+                print(f"   [CASCADE] No usable orientation in the top {limit}, trying the rest")
+                limit = len(order)
+            size = min(first_batch if pos == 0 else batch, limit - pos)
+            chunk = order[pos:pos + size]
+            for idx, result in zip(chunk, self.evaluate_candidates(points_centered, [candidates[i] for i in chunk], timings, buffers)):
+                evaluated[idx] = result
+            pos += len(chunk)
+            best_so_far = self.select_best_candidate(evaluated)
+            if progress is not None and best_so_far is not None and best_so_far is not reported:
+                reported = best_so_far
+                raw_keypoints, current_height = self.preview_keypoints(best_so_far, global_center)
+                progress({"keypoints": raw_keypoints, "current_height": current_height, "orientation": best_so_far["label"],
+                          "score": best_so_far["score"], "evaluated": pos, "total": len(order)})
+            if accept_score is not None and best_so_far is not None and best_so_far["score"] >= accept_score:
+                if pos < len(order):
+                    print(f"   [SEARCH] {best_so_far['label']} scored {best_so_far['score']:.3f}, "
+                          f"skipping {len(order) - pos} orientation(s)")
+                break
+
+        best = self.select_best_candidate(evaluated)
+        n_inferences = sum(1 for result in evaluated if result is not None)
+
+        best_score = best["score"] if best is not None else -999
+        if best is None or best_score < MIN_POSE_SCORE:
+            raise Exception(f"AI failed (best_score={best_score:.3f}). Try a cleaner scan.")
 
-            cv2.imwrite(f"debug_{label}.png", img)
-            results = self.pose.process(img)
-
-            if not results.pose_landmarks:
-                print(f"      [{label}] No landmarks detected")
-                continue
+        print(f"\n   [AI] Best orientation: {best['label']} score={best_score:.3f}")
+
+        best_rotation = best["rotation"]
+        best_points_rotated = self.rotate(points_centered, best_rotation, out=buffers.get())
+        del buffers, points_centered
+
+        with maybe_stage(timings, "platform_removal"):
+            points_clean, platform_removed = self.remove_platform_by_spread_jump(best_points_rotated)
+
+        raw_keypoints, current_height = self.lift_keypoints(points_clean, best_rotation, global_center, timings)
+
+        if self.prior is not None:
+            self.prior.record(best["label"], device_id)
+
+        return {
+            "keypoints": raw_keypoints,
+            "current_height": current_height,
+            "rotation": best_rotation,
+            "scores": {result[0]["label"]: result[0]["score"] for result in evaluated if result is not None and result[0] is not None},
+            "meta": {
+                "platform_removed": platform_removed,
+                "best_score": best_score,
+                "best_orientation": best["label"],
+                "orientation_inferences": n_inferences,
+                "alignment_confidence": alignment["confidence"] if alignment is not None else None,
+                "coarse_scores": {label: score for (_, label), score in zip(candidates, coarse)} if coarse is not None else None,
+            },
+        }
 
-            lms = results.pose_landmarks.landmark
-            print(f"      [{label}] Detected {len(lms)} landmarks")
-
-            h_r = np.max(points_rotated[:, 1]) - np.min(points_rotated[:, 1])
-            w_r = np.max(points_rotated[:, 0]) - np.min(points_rotated[:, 0])
-            aspect = h_r / (w_r + 0.001)
-
-            if aspect > 2.5:
-                orient_bonus, orient_txt = 0.6, f"VERY VERTICAL (aspect={aspect:.2f})"
-            elif aspect > 2.0:
-                orient_bonus, orient_txt = 0.5, f"VERTICAL (aspect={aspect:.2f})"
-            elif aspect > 1.5:
-                orient_bonus, orient_txt = 0.2, f"Semi-vertical (aspect={aspect:.2f})"
-            else:
-                orient_bonus, orient_txt = -0.3, f"HORIZONTAL (aspect={aspect:.2f})"
-
-            head_up_bonus, head_txt = self.compute_head_up_score(lms)
-            base_score = np.mean([lm.visibility for lm in lms])
-            score = base_score + orient_bonus + head_up_bonus
-
-            for idx in [11, 12]:
-                lm = lms[idx]
-                print(f"         Shoulder {idx}: vis={lm.visibility:.2f}, x={lm.x:.2f}, y={lm.y:.2f}")
-            print(f"         {orient_txt}")
-            print(f"         {head_txt}")
-            print(f"         Score: {score:.3f} (base={base_score:.2f}, orient={orient_bonus:.2f}, head_up={head_up_bonus:.2f})")
-
-            if score > best_score:
-                best_score = score
-                best_results = results
-                best_rotation = RotMat
-                best_params = params
-                best_points_rotated = points_rotated.copy()
-
-        if best_results is None or best_score < 0.3:
-            raise Exception(f"AI failed (best_score={best_score:.3f}). Try a cleaner scan.")
+    @staticmethod
+    def finalize(analysis, real_height_meters):
+        final_keypoints = AI_Pose_Estimator.scale_keypoints(analysis["keypoints"], analysis["current_height"], real_height_meters)
+        final_keypoints["meta"].update(analysis["meta"])
+        if "point_cloud" in analysis:
+            final_keypoints["point_cloud"] = analysis["point_cloud"]
+        return final_keypoints
 
-        print(f"\n   [AI] Best orientation: score={best_score:.3f}")
+    def predict(self, pcd, real_height_meters=1.75, timings=None, device_id=None, progress=None,
+                point_cloud_points=None, point_cloud_sampling=None):
+        print(f"   [AI] Processing for target height: {real_height_meters}m")
+        analysis = self.analyze(pcd, timings, device_id, progress)
+        with maybe_stage(timings, "subsample"):
+            analysis["point_cloud"] = self.sample_point_cloud(np.asarray(pcd.points), point_cloud_points, point_cloud_sampling)
+        return self.finalize(analysis, real_height_meters)
+
+    def track(self, pcd, rotation, pose, min_score, timings=None):
+        """One-inference analysis of a frame in the orientation of the previous one.
+
+        The cloud is turned with `rotation`, cleaned and rendered once; the same
+        landmarks are scored like an orientation candidate and lifted. Returns
+        None when tracking is lost (no landmarks or score under `min_score`).
+        """
+        points_original = np.asarray(pcd.points)
+        global_center, points_centered = self.center_points(points_original)
 
-        points_clean, platform_removed = self.remove_platform_by_spread_jump(best_points_rotated)
+        with maybe_stage(timings, "platform_removal"):
+            points_clean, platform_removed = self.remove_platform_by_spread_jump(self.rotate(points_centered, rotation))
 
-        final_keypoints = self.extract_keypoints_from_clean_cloud(points_clean, best_rotation, global_center, real_height_meters)
+        with maybe_stage(timings, "render"):
+            img, params = self.render_snapshot(points_clean)
+        if img is None:
+            return None
+        with maybe_stage(timings, "inference"):
+            results = pose.process(img)
+        if not results or not results.pose_landmarks:
+            print("   [TRACK] No landmarks, tracking lost")
+            return None
 
-        final_keypoints["meta"]["platform_removed"] = platform_removed
-        final_keypoints["meta"]["best_score"] = best_score
+        landmarks = results.pose_landmarks.landmark
+        score, log = self.score_landmarks(landmarks, points_clean)
+        for line in log:
+            print(line)
+        if score < min_score:
+            print(f"   [TRACK] Score {score:.3f} < {min_score}, tracking lost")
+            return None
 
-        final_keypoints["point_cloud"] = point_cloud_data
+        raw_keypoints, current_height = self.lift_landmarks(landmarks, params, points_clean, rotation, global_center, timings)
+        return {
+            "keypoints": raw_keypoints,
+            "current_height": current_height,
+            "rotation": rotation,
+            "scores": {},
+            "meta": {
+                "platform_removed": platform_removed,
+                "best_score": score,
+                "orientation_inferences": 1,
+                "alignment_confidence": None,
+            },
+        }
 
-        return final_keypoints
\ No newline at end of file
+    def predict_sequence(self, pcds, real_height_meters=1.75, track_min_score=None):
+        """Predicts an ordered series of scans of the same subject.
+
+        The first frame (and any frame after tracking is lost) runs the full
+        orientation search. Following frames reuse the previous best rotation
+        and a video-mode Pose graph, which seeds its landmark search from the
+        previous frame, so a tracked frame costs a single inference. Returns
+        one result per cloud; a frame that fails both ways gets {"error": ...}.
+        """
+        min_score = self.align_accept_score if track_min_score is None else track_min_score
+        tracker = self.create_pose(static_image_mode=False)
+        rotation, label = None, None
+        results = []
+        try:
+            for i, pcd in enumerate(pcds):
+                print(f"   [SEQUENCE] Frame {i + 1}")
+                analysis = None
+                if rotation is not None:
+                    analysis = self.track(pcd, rotation, tracker, min_score)
+                    if analysis is not None:
+                        analysis["meta"]["best_orientation"] = label
+                        analysis["meta"]["tracking"] = "tracked"
+                if analysis is None:
+                    try:
+                        analysis = self.analyze(pcd)
+                    except Exception as e:
+                        print(f"   [SEQUENCE] Frame {i + 1} failed: {e}")
+                        rotation, label = None, None
+                        results.append({"error": str(e)})
+                        continue
+                    analysis["meta"]["tracking"] = "search"
+                rotation, label = analysis["rotation"], analysis["meta"]["best_orientation"]
+                analysis["point_cloud"] = self.sample_point_cloud(np.asarray(pcd.points))
+                results.append(self.finalize(analysis, real_height_meters))
+        finally:
+            tracker.close()
+        return results
@@ -0,0 +1,82 @@
+import json
+import os
+import tempfile
+import threading
+
+DEFAULT_DEVICE = "_default"
+
+
+class OrientationPrior:
+    """Counts of which get_rotation_matrices label won, per device.
+
+    Scans without a device id are counted under DEFAULT_DEVICE, and every
+    scan also feeds that bucket, so a new device starts from the fleet-wide
+    habit. Counts are halved once a device passes `max_total` wins, so the
+    prior follows a scanner that gets remounted. With `path` set the counts
+    are loaded at start and rewritten (atomically) after every update; when
+    several processes share the file the last writer wins.
+
+    The prior is `confident` once its top label has won at least `min_share`
+    of a bucket's scans (about 40 consistent scans for 9 labels); below that
+    it only reorders other rankings.
+    """
+
+    def __init__(self, path=None, min_observations=3, max_total=1000, min_share=0.8):
+        self.path = path
+        self.min_observations = min_observations
+        self.min_share = min_share
+        self.max_total = max_total
+        self._counts = {}
+        self._lock = threading.Lock()
+        if path and os.path.exists(path):
+            try:
+                with open(path) as f:
+                    self._counts = {device: {label: float(n) for label, n in labels.items()}
+                                    for device, labels in json.load(f).items()}
+                print(f"   [PRIOR] Loaded orientation prior for {len(self._counts)} device(s) from {path}")
+            except (OSError, ValueError, AttributeError) as e:
+                print(f"   [PRIOR] Ignoring unreadable prior {path}: {e}")
+
+    def rank(self, labels, device_id=None):
+        """Labels ordered most-likely-first and the top label's share of the wins.
+
+        The share counts one extra win for every label, so a short history
+        never looks certain. (None, 0.0) when there is too little history. Falls back from the
+        device to DEFAULT_DEVICE; ties keep the given order.
+        """
+        with self._lock:
+            for device in ([device_id] if device_id else []) + [DEFAULT_DEVICE]:
+                counts = self._counts.get(device, {})
+                total = sum(counts.values())
+                if total >= self.min_observations:
+                    ranked = sorted(labels, key=lambda label: -counts.get(label, 0.0))
+                    return ranked, (counts.get(ranked[0], 0.0) + 1) / (total + len(labels))
+        return None, 0.0
+
+    def confident(self, share):
+        return share >= self.min_share
+
+    def record(self, label, device_id=None):
+        with self._lock:
+            for device in {device_id or DEFAULT_DEVICE, DEFAULT_DEVICE}:
+                counts = self._counts.setdefault(device, {})
+                counts[label] = counts.get(label, 0.0) + 1
+                if sum(counts.values()) > self.max_total:
+                    for key in counts:
+                        counts[key] /= 2
+            if self.path:
+                self._save(json.dumps(self._counts, indent=2, sort_keys=True))
+
+    def _save(self, snapshot):
+        try:
+            directory = os.path.dirname(os.path.abspath(self.path))
+            fd, tmp = tempfile.mkstemp(dir=directory, suffix=".tmp")
+            with os.fdopen(fd, "w") as f:
+                f.write(snapshot)
+            os.replace(tmp, self.path)
+        except OSError as e:
+            print(f"   [PRIOR] Could not save {self.path}: {e}")
+
+    def stats(self):
+        with self._lock:
+            return {device: dict(labels) for device, labels in self._counts.items()}
@@ -0,0 +1,349 @@
+import io
+import itertools
+import mmap
+
+import numpy as np
+
+PLY_TYPES = {
+    "char": "i1", "int8": "i1",
+    "uchar": "u1", "uint8": "u1",
+    "short": "i2", "int16": "i2",
+    "ushort": "u2", "uint16": "u2",
+    "int": "i4", "int32": "i4",
+    "uint": "u4", "uint32": "u4",
+    "float": "f4", "float32": "f4",
+    "double": "f8", "float64": "f8",
+}
+
+CHUNK_POINTS = 262_144
+
+
+def read_ply_header(f):
+    """Parses a PLY header from a binary file object positioned at its start.
+
+    Returns a dict with the format, the elements (name, count, properties) in
+    file order and the byte length of the header.
+    """
+    header = {"format": "unknown", "elements": [], "length": 0}
+    first = f.readline()
+    if first.strip() != b"ply":
+        raise ValueError("Not a PLY file")
+    length = len(first)
+
+    while True:
+        raw = f.readline()
+        if not raw:
+            raise ValueError("PLY header has no end_header")
+        length += len(raw)
+        line = raw.decode("ascii", errors="ignore").strip()
+
+        if line.startswith("format"):
+            parts = line.split()
+            if len(parts) >= 2:
+                header["format"] = parts[1]
+        elif line.startswith("element"):
+            parts = line.split()
+            header["elements"].append({"name": parts[1], "count": int(parts[2]), "properties": []})
+        elif line.startswith("property"):
+            parts = line.split()
+            if not header["elements"]:
+                raise ValueError("PLY property outside of an element")
+            if parts[1] == "list":
+                header["elements"][-1]["properties"].append((parts[4], "list"))
+            else:
+                header["elements"][-1]["properties"].append((parts[2], parts[1]))
+        elif line == "end_header":
+            break
+
+    header["length"] = length
+    return header
+
+
+def vertex_layout(header):
+    if not header["elements"] or header["elements"][0]["name"] != "vertex":
+        raise ValueError("PLY vertex element must come first")
+    vertex = header["elements"][0]
+    names = [name for name, _ in vertex["properties"]]
+    for axis in ("x", "y", "z"):
+        if axis not in names:
+            raise ValueError(f"PLY vertex has no '{axis}' property")
+    if any(kind == "list" for _, kind in vertex["properties"]):
+        raise ValueError("PLY vertex with list properties is not supported")
+    return vertex
+
+
+def vertex_dtype(vertex, fmt):
+    endian = {"binary_little_endian": "<", "binary_big_endian": ">"}[fmt]
+    return np.dtype([(name, endian + PLY_TYPES[kind]) for name, kind in vertex["properties"]])
+
+
+def chunk_sizes(count, chunk_points=CHUNK_POINTS):
+    return [min(chunk_points, count - start) for start in range(0, count, chunk_points)]
+
+
+def sample_per_chunk(sizes, max_points, rng):
+    """Splits a uniform sample of `max_points` rows across chunks.
+
+    Drawing the per-chunk counts from a multivariate hypergeometric and then
+    sampling inside each chunk is the same as sampling the whole file without
+    replacement, but never needs an index array as long as the file.
+    """
+    counts = rng.multivariate_hypergeometric(sizes, max_points)
+    return [np.sort(rng.choice(size, n, replace=False)) for size, n in zip(sizes, counts)]
+
+
+def sample_indices(n_total, max_points, seed=42):
+    rng = np.random.default_rng(seed)
+    return np.sort(rng.choice(n_total, max_points, replace=False))
+
+
+def cap_points(points, max_points, seed=42):
+    if not max_points or len(points) <= max_points:
+        return points
+    return points[sample_indices(len(points), max_points, seed)]
+
+
+def xyz_of(records, dtype):
+    out = np.empty((len(records), 3), dtype=dtype)
+    out[:, 0] = records["x"]
+    out[:, 1] = records["y"]
+    out[:, 2] = records["z"]
+    return out
+
+
+def new_stats():
+    return {"vertices": 0, "min": None, "max": None}
+
+
+def accumulate_stats(stats, x, y, z):
+    """Adds one chunk of columns to the running vertex count and bounding box."""
+    if len(x) == 0:
+        return
+    lo = [float(np.min(v)) for v in (x, y, z)]
+    hi = [float(np.max(v)) for v in (x, y, z)]
+    stats["vertices"] += len(x)
+    stats["min"] = lo if stats["min"] is None else [min(a, b) for a, b in zip(stats["min"], lo)]
+    stats["max"] = hi if stats["max"] is None else [max(a, b) for a, b in zip(stats["max"], hi)]
+
+
+def voxel_keys(xyz, origin, voxel_size):
+    cells = np.floor((xyz - origin) / voxel_size).astype(np.int64)
+    return (cells[:, 0] << 42) | (cells[:, 1] << 21) | cells[:, 2]
+
+
+def voxel_decimate_chunks(chunks, voxel_size, max_voxels=None, stats=None):
+    """Keeps the first point of every voxel while reading chunk by chunk.
+
+    With `max_voxels` set the voxel size doubles whenever more cells than
+    that are occupied and the points kept so far are bucketed again, so
+    memory stays bounded however large the file is. The final size is
+    recorded in `stats["voxel_size"]`.
+    """
+    seen = np.empty(0, dtype=np.int64)
+    kept = []
+    origin = None
+    for xyz in chunks:
+        if origin is None:
+            # Keys are relative to the first chunk's minimum; 21 bits per axis
+            # cover about 2 km at 1 mm voxels, more than any scanner produces.
+            # Coarser voxels only need fewer bits.
+            origin = xyz.min(axis=0) - voxel_size * (1 << 19)
+        keys, first = np.unique(voxel_keys(xyz, origin, voxel_size), return_index=True)
+        new = ~np.isin(keys, seen, assume_unique=True)
+        kept.append(xyz[first[new]])
+        seen = np.union1d(seen, keys[new])
+        while max_voxels and len(seen) > max_voxels:
+            voxel_size *= 2
+            points = np.concatenate(kept)
+            seen, first = np.unique(voxel_keys(points, origin, voxel_size), return_index=True)
+            kept = [points[np.sort(first)]]
+    if stats is not None:
+        stats["voxel_size"] = voxel_size
+    return np.concatenate(kept) if kept else np.empty((0, 3))
+
+
+def iter_binary_chunks(mm, vertex_dt, data_offset, count, dtype, picks=None, chunk_points=CHUNK_POINTS, stats=None):
+    itemsize = vertex_dt.itemsize
+    for i, n in enumerate(chunk_sizes(count, chunk_points)):
+        offset = data_offset + i * chunk_points * itemsize
+        block = np.frombuffer(mm, dtype=vertex_dt, count=n, offset=offset)
+        if stats is not None:
+            accumulate_stats(stats, block["x"], block["y"], block["z"])
+        xyz = xyz_of(block if picks is None else block[picks[i]], dtype)
+        del block
+        release_pages(mm, offset, n * itemsize)
+        yield xyz
+
+
+def release_pages(mm, offset, length):
+    # Pages of a read-only file mapping are clean, so dropping them only
+    # removes them from this process's RSS; the page cache keeps them.
+    if not hasattr(mmap, "MADV_DONTNEED"):
+        return
+    lo = offset - offset % mmap.PAGESIZE
+    mm.madvise(mmap.MADV_DONTNEED, lo, offset + length - lo)
+
+
+def iter_ascii_chunks(f, vertex, count, dtype, picks=None, chunk_points=CHUNK_POINTS, stats=None):
+    names = [name for name, _ in vertex["properties"]]
+    cols = (names.index("x"), names.index("y"), names.index("z"))
+    for i, n in enumerate(chunk_sizes(count, chunk_points)):
+        block = np.loadtxt(itertools.islice(f, n), usecols=cols, dtype=dtype, ndmin=2)
+        if len(block) == 0:
+            break
+        if stats is not None:
+            accumulate_stats(stats, block[:, 0], block[:, 1], block[:, 2])
+        yield block if picks is None else block[picks[i][picks[i] < len(block)]]
+
+
+def read_ply_points(path, max_points=None, method="random", voxel_size=0.01, dtype=np.float64, seed=42,
+                    max_voxels=None, stats=None):
+    """Reads only the x/y/z columns of a PLY file, sampling while reading.
+
+    Binary PLY is memory-mapped and walked in fixed-size chunks whose pages are
+    released as soon as the chunk is done, so peak RSS follows the sample size
+    rather than the file size. ASCII PLY is parsed in the same chunks.
+    `method` is "random" (uniform without replacement, deterministic for a
+    given seed) or "voxel" (first point per `voxel_size` cell, coarsened to at
+    most `max_voxels` cells if set, then capped). `max_points=None` keeps
+    every point. A `stats` dict from new_stats() receives the vertex count
+    and bounding box of the whole file, not just of the sample.
+    """
+    rng = np.random.default_rng(seed)
+    with open(path, "rb") as f:
+        header = read_ply_header(f)
+        vertex = vertex_layout(header)
+        count = vertex["count"]
+        fmt = header["format"]
+        if count == 0:
+            return np.empty((0, 3), dtype=dtype)
+
+        picks = None
+        if method != "voxel" and max_points and count > max_points:
+            picks = sample_per_chunk(chunk_sizes(count), max_points, rng)
+
+        if fmt == "ascii":
+            chunks = iter_ascii_chunks(f, vertex, count, dtype, picks, stats=stats)
+            if method == "voxel":
+                return cap_points(voxel_decimate_chunks(chunks, voxel_size, max_voxels, stats), max_points, seed)
+            return np.concatenate(list(chunks))
+
+        if fmt not in ("binary_little_endian", "binary_big_endian"):
+            raise ValueError(f"Unsupported PLY format: {fmt}")
+
+        mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+    try:
+        chunks = iter_binary_chunks(mm, vertex_dtype(vertex, fmt), header["length"], count, dtype, picks, stats=stats)
+        if method == "voxel":
+            return cap_points(voxel_decimate_chunks(chunks, voxel_size, max_voxels, stats), max_points, seed)
+        return np.concatenate(list(chunks))
+    finally:
+        mm.close()
+
+
+MAX_HEADER_BYTES = 64 * 1024
+
+
+class PlyStreamParser:
+    """Incremental version of read_ply_points for bytes that arrive in pieces.
+
+    feed() keeps only the header and the current chunk of records (or lines,
+    for ASCII) buffered; every complete chunk is reduced to x/y/z, sampled
+    exactly like read_ply_points would and kept. finish() returns the points.
+    Anything after the vertex element is ignored. Header problems raise
+    ValueError from feed(), while the caller still has the bytes seen so far.
+    `stats` collects the same whole-file statistics as read_ply_points.
+    """
+
+    def __init__(self, max_points=None, method="random", voxel_size=0.01, dtype=np.float64, seed=42, max_voxels=None):
+        self.max_points = max_points
+        self.method = method
+        self.voxel_size = voxel_size
+        self.dtype = dtype
+        self.seed = seed
+        self.max_voxels = max_voxels
+        self.stats = new_stats()
+        self.header = None
+        self._pending = bytearray()
+        self._lines = []
+        self._chunks = []
+        self._chunk = 0
+        self._done = 0
+
+    def feed(self, data):
+        if self.header is None:
+            self._pending += data
+            end = self._pending.find(b"end_header")
+            newline = self._pending.find(b"\n", end) if end >= 0 else -1
+            if newline < 0:
+                if len(self._pending) > MAX_HEADER_BYTES:
+                    raise ValueError("PLY header has no end_header")
+                return
+            self._start(bytes(self._pending[:newline + 1]))
+            data = bytes(self._pending[newline + 1:])
+            self._pending = bytearray()
+        if self._done < self.count:
+            self._pending += data
+            self._drain()
+
+    def _start(self, header_bytes):
+        self.header = read_ply_header(io.BytesIO(header_bytes))
+        self.vertex = vertex_layout(self.header)
+        self.count = self.vertex["count"]
+        fmt = self.header["format"]
+        if fmt == "ascii":
+            names = [name for name, _ in self.vertex["properties"]]
+            self._cols = (names.index("x"), names.index("y"), names.index("z"))
+        elif fmt in ("binary_little_endian", "binary_big_endian"):
+            self._vertex_dt = vertex_dtype(self.vertex, fmt)
+        else:
+            raise ValueError(f"Unsupported PLY format: {fmt}")
+        self._sizes = chunk_sizes(self.count)
+        self._picks = None
+        if self.method != "voxel" and self.max_points and self.count > self.max_points:
+            self._picks = sample_per_chunk(self._sizes, self.max_points, np.random.default_rng(self.seed))
+
+    def _drain(self, final=False):
+        if self.header["format"] == "ascii":
+            last = self._pending.rfind(b"\n")
+            if final and self._pending.strip():
+                last = len(self._pending) - 1
+            if last >= 0:
+                self._lines.extend(bytes(self._pending[:last + 1]).splitlines())
+                del self._pending[:last + 1]
+            while self._chunk < len(self._sizes) and (len(self._lines) >= self._sizes[self._chunk] or final and self._lines):
+                n = self._sizes[self._chunk]
+                block = np.loadtxt(self._lines[:n], usecols=self._cols, dtype=self.dtype, ndmin=2)
+                del self._lines[:n]
+                accumulate_stats(self.stats, block[:, 0], block[:, 1], block[:, 2])
+                self._keep(block if self._picks is None else block[self._picks[self._chunk][self._picks[self._chunk] < len(block)]], n)
+            return
+
+        itemsize = self._vertex_dt.itemsize
+        while self._chunk < len(self._sizes) and len(self._pending) >= self._sizes[self._chunk] * itemsize:
+            n = self._sizes[self._chunk]
+            raw = bytes(self._pending[:n * itemsize])
+            del self._pending[:n * itemsize]
+            block = np.frombuffer(raw, dtype=self._vertex_dt, count=n)
+            accumulate_stats(self.stats, block["x"], block["y"], block["z"])
+            self._keep(xyz_of(block if self._picks is None else block[self._picks[self._chunk]], self.dtype), n)
+
+    def _keep(self, xyz, n):
+        self._chunks.append(xyz)
+        self._chunk += 1
+        self._done += n
+
+    def finish(self):
+        if self.header is None:
+            raise ValueError("PLY header has no end_header")
+        if self._done < self.count:
+            self._drain(final=True)
+        if self._done < self.count and self.header["format"] != "ascii":
+            raise ValueError(f"PLY data ends after {self._done} of {self.count} vertices")
+        if not self._chunks:
+            return np.empty((0, 3), dtype=self.dtype)
+        if self.method == "voxel":
+            points = voxel_decimate_chunks(self._chunks, self.voxel_size, self.max_voxels, self.stats)
+            return cap_points(points, self.max_points, self.seed)
+        return np.concatenate(self._chunks)
@@ -0,0 +1,111 @@
+import hashlib
+import os
+import tempfile
+
+from ply_reader import PlyStreamParser
+
+
+class PlyUpload:
+    """Writable target for one uploaded PLY, filled by werkzeug's form parser.
+
+    Uploads of up to `spill_bytes` (by the request's Content-Length) are
+    parsed while the body arrives and never touch the disk; `points` holds
+    the result after finish() and `stats` the whole-file statistics of
+    read_ply_points. Larger uploads, uploads of unknown length and
+    files the stream parser rejects in their header are written to a
+    temporary file instead and read from `path` like before. Either way the
+    SHA-256 of the bytes is kept for the result cache. discard() deletes the
+    temporary file, if there is one.
+
+    `keep` marks an upload that outlives its request (a queued job).
+
+    With `path` set it just wraps a PLY that is already on disk; discard()
+    leaves that file alone.
+    """
+
+    def __init__(self, expected_bytes=None, spill_bytes=0, name="upload.ply", path=None, **parser_kwargs):
+        self.name = os.path.basename(path) if path else name
+        self.path = path
+        self.points = None
+        self.stats = None
+        self.error = None
+        self.keep = False
+        self._digest = hashlib.sha256() if path is None else None
+        self._file = None
+        self._parser = None
+        self._head = None
+        self._owns_path = path is None
+        if path is not None:
+            return
+        if expected_bytes is not None and expected_bytes <= spill_bytes:
+            self._parser = PlyStreamParser(**parser_kwargs)
+            # Raw bytes until the header is parsed, in case the upload has to spill after all.
+            self._head = bytearray()
+        else:
+            self._spill()
+
+    def _spill(self):
+        self._file = tempfile.NamedTemporaryFile(delete=False, suffix=".ply")
+        self.path = self._file.name
+
+    def write(self, data):
+        self._digest.update(data)
+        if self._file is not None:
+            self._file.write(data)
+        elif self._parser is not None:
+            try:
+                if self._parser.header is None:
+                    self._head += data
+                self._parser.feed(data)
+                if self._parser.header is not None:
+                    self._head = None
+            except ValueError as e:
+                if self._head is not None:
+                    print(f"  [UPLOAD] Stream parser cannot read this file ({e}), spilling to disk")
+                    self._spill()
+                    self._file.write(self._head)
+                    self._head = None
+                else:
+                    self.error = str(e)
+                self._parser = None
+        return len(data)
+
+    def seek(self, offset, whence=0):
+        # The form parser rewinds the container once the part is complete.
+        return 0
+
+    def tell(self):
+        return 0
+
+    def read(self, size=-1):
+        return b""
+
+    def readline(self, size=-1):
+        return b""
+
+    def finish(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+        elif self._parser is not None:
+            try:
+                self.points = self._parser.finish()
+                self.stats = self._parser.stats
+            except ValueError as e:
+                self.error = str(e)
+            self._parser = None
+
+    def hexdigest(self):
+        return self._digest.hexdigest() if self._digest is not None else None
+
+    def close(self):
+        # Called by werkzeug when the request ends; jobs still need the data.
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def discard(self):
+        self.close()
+        self.points = None
+        if self.path and self._owns_path and os.path.exists(self.path):
+            os.remove(self.path)
@@ -0,0 +1,76 @@
+"""Compact binary encoding for the `point_cloud` returned by /process-scan.
+
+Layout (all little-endian), 36-byte header followed by the payload:
+
+    offset  size  field
+    0       4     magic b"BPC1"
+    4       1     version (1)
+    5       1     encoding: 1 = float32, 2 = uint16 quantized to the bounding box
+    6       1     compression: 0 = none, 1 = zlib (RFC 1950) over the payload
+    7       1     reserved (0)
+    8       4     uint32 point count N
+    12      12    float32 bbox min x, y, z
+    24      12    float32 bbox max x, y, z
+    36      ...   payload: N * 3 values, point-major (x0 y0 z0 x1 y1 z1 ...)
+
+For uint16 the value of an axis is min + q / 65535 * (max - min); an axis whose
+min equals max decodes to min. The response carries the blob base64-encoded
+in `point_cloud_encoded` instead of the JSON `point_cloud` list.
+"""
+
+import struct
+import zlib
+
+import numpy as np
+
+MAGIC = b"BPC1"
+VERSION = 1
+HEADER = struct.Struct("<4sBBBBI3f3f")
+
+ENCODINGS = {"f32": 1, "q16": 2}
+COMPRESSIONS = {"none": 0, "zlib": 1}
+
+
+def encode_point_cloud(points, encoding="f32", compression="none", level=6):
+    if encoding not in ENCODINGS:
+        raise ValueError(f"Unknown point cloud encoding: {encoding}")
+    if compression not in COMPRESSIONS:
+        raise ValueError(f"Unknown point cloud compression: {compression}")
+
+    points = np.asarray(points, dtype=np.float32).reshape(-1, 3)
+    if len(points):
+        bbox_min, bbox_max = points.min(axis=0), points.max(axis=0)
+    else:
+        bbox_min = bbox_max = np.zeros(3, dtype=np.float32)
+
+    if encoding == "f32":
+        payload = points.astype("<f4", copy=False).tobytes()
+    else:
+        span = (bbox_max - bbox_min).astype(np.float64)
+        span[span == 0] = 1.0
+        q = np.rint((points - bbox_min) / span * 65535.0)
+        payload = np.clip(q, 0, 65535).astype("<u2").tobytes()
+
+    if compression == "zlib":
+        payload = zlib.compress(payload, level)
+
+    header = HEADER.pack(MAGIC, VERSION, ENCODINGS[encoding], COMPRESSIONS[compression], 0, len(points), *bbox_min, *bbox_max)
+    return header + payload
+
+
+def decode_point_cloud(blob):
+    magic, version, encoding, compression, _, count, *bbox = HEADER.unpack_from(blob)
+    if magic != MAGIC or version != VERSION:
+        raise ValueError("Not a BPC1 point cloud blob")
+
+    payload = blob[HEADER.size:]
+    if compression == COMPRESSIONS["zlib"]:
+        payload = zlib.decompress(payload)
+
+    if encoding == ENCODINGS["f32"]:
+        return np.frombuffer(payload, dtype="<f4", count=count * 3).reshape(count, 3)
+
+    bbox_min = np.array(bbox[:3], dtype=np.float64)
+    span = np.array(bbox[3:], dtype=np.float64) - bbox_min
+    q = np.frombuffer(payload, dtype="<u2", count=count * 3).reshape(count, 3)
+    return (bbox_min + q / 65535.0 * span).astype(np.float32)
@@ -0,0 +1,137 @@
+import numpy as np
+
+from ply_reader import chunk_sizes, sample_per_chunk, voxel_keys
+
+VOXEL_SEARCH_STEPS = 6
+STRATIFIED_SLICES = 64
+FPS_CANDIDATES_PER_POINT = 4
+# Farthest-point time grows with the square of the target (0.4 s of greedy
+# loop for 2k points, 2.3 s for 5k, 25 s for 20k); larger targets are voxel
+# sampled instead.
+FPS_MAX_POINTS = 2_000
+
+
+def uniform_indices(points, max_points, rng):
+    """Uniform sample without replacement, drawn per chunk from a local Generator.
+
+    Same split as the PLY reader, so no index array as long as the cloud is built.
+    """
+    sizes = chunk_sizes(len(points))
+    picks = sample_per_chunk(sizes, max_points, rng)
+    starts = np.cumsum([0] + sizes[:-1])
+    return np.concatenate([start + pick for start, pick in zip(starts, picks)]).astype(np.int64)
+
+
+def voxel_indices(points, max_points, rng):
+    """First point of every occupied voxel, with the voxel size searched so about `max_points` cells are occupied.
+
+    A scan is a surface, so the number of occupied cells goes with the inverse
+    square of the voxel size; each step rescales by that. The finest grid with
+    at least `max_points` cells wins and is capped uniformly, so the sample
+    follows the shape rather than the point density.
+    """
+    origin = points.min(axis=0)
+    extent = float(np.max(points.max(axis=0) - origin))
+    if extent <= 0:
+        return uniform_indices(points, max_points, rng)
+    voxel_size = extent / np.sqrt(max_points)
+    best = first = None
+    for _ in range(VOXEL_SEARCH_STEPS):
+        _, first = np.unique(voxel_keys(points, origin, voxel_size), return_index=True)
+        if len(first) >= max_points:
+            best = first
+            if len(first) <= max_points * 1.1:
+                break
+        voxel_size *= np.sqrt(len(first) / max_points)
+    if best is None:
+        return np.sort(first)
+    return np.sort(best[uniform_indices(best, max_points, rng)])
+
+
+def stratified_indices(points, max_points, rng, n_slices=STRATIFIED_SLICES):
+    """Equal share of the sample for every height band of the cloud.
+
+    The scan's up axis is not known before the orientation search, so the
+    bands run along its longest bounding-box axis, which is the body's for a
+    standing subject. Bands with fewer points than their share give the rest
+    to the others, so thin parts (ankles, neck, raised arms) keep their
+    points while the torso is thinned.
+    """
+    lo, hi = points.min(axis=0), points.max(axis=0)
+    axis = int(np.argmax(hi - lo))
+    span = float(hi[axis] - lo[axis])
+    if span <= 0:
+        return uniform_indices(points, max_points, rng)
+    band = np.minimum(((points[:, axis] - lo[axis]) * (n_slices / span)).astype(np.int64), n_slices - 1)
+    count = np.bincount(band, minlength=n_slices)
+
+    # Water-filling: every band gets the same quota up to its own size.
+    quota = np.zeros(n_slices, dtype=np.int64)
+    remaining = max_points
+    while remaining > 0:
+        open_bands = np.flatnonzero(quota < count)
+        share = max(1, remaining // len(open_bands))
+        add = np.minimum(count[open_bands] - quota[open_bands], share)
+        add[np.cumsum(add) > remaining] = 0
+        quota[open_bands] += add
+        remaining -= int(add.sum())
+
+    # Band ids are small, so the stable argsort is a linear-time radix sort.
+    order = np.argsort(band.astype(np.int16), kind="stable")
+    starts = np.concatenate(([0], np.cumsum(count)))
+    picks = [order[starts[i] + rng.choice(count[i], quota[i], replace=False)] for i in np.flatnonzero(quota)]
+    return np.sort(np.concatenate(picks))
+
+
+def farthest_point_indices(points, max_points, rng):
+    """Greedy farthest-point sample of a voxel-decimated candidate set.
+
+    Candidates are FPS_CANDIDATES_PER_POINT times the target, so memory stays
+    at one distance per candidate; time is target x candidates, so targets
+    above FPS_MAX_POINTS fall back to voxel_indices.
+    """
+    if max_points > FPS_MAX_POINTS:
+        return voxel_indices(points, max_points, rng)
+    if len(points) > FPS_CANDIDATES_PER_POINT * max_points:
+        candidates = voxel_indices(points, FPS_CANDIDATES_PER_POINT * max_points, rng)
+        if len(candidates) <= max_points:
+            return candidates
+    else:
+        candidates = np.arange(len(points))
+    subset = points[candidates].astype(np.float64)
+    chosen = np.empty(max_points, dtype=np.int64)
+    # Start from the candidate farthest from the centroid, so the result does not depend on the seed.
+    centred = subset - subset.mean(axis=0)
+    current = int(np.argmax(np.einsum("ij,ij->i", centred, centred)))
+    distance = np.full(len(subset), np.inf)
+    for i in range(max_points):
+        chosen[i] = current
+        delta = subset - subset[current]
+        np.minimum(distance, np.einsum("ij,ij->i", delta, delta), out=distance)
+        current = int(np.argmax(distance))
+    return np.sort(candidates[chosen])
+
+
+SAMPLERS = {
+    "uniform": uniform_indices,
+    "voxel": voxel_indices,
+    "stratified": stratified_indices,
+    "fps": farthest_point_indices,
+}
+
+
+def sample_points(points, max_points, method="uniform", seed=42):
+    """Subsample of at most `max_points` rows of `points`, in their original order.
+
+    `method` is one of SAMPLERS. Every call draws from its own Generator, so
+    concurrent requests neither share nor disturb random state and a given
+    seed always gives the same sample.
+    """
+    if method not in SAMPLERS:
+        raise ValueError(f"Unknown sampling method: {method}")
+    points = np.asarray(points)
+    if max_points <= 0:
+        return points[:0]
+    if len(points) <= max_points:
+        return points
+    return points[SAMPLERS[method](points, max_points, np.random.default_rng(seed))]
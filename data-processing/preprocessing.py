@@ -0,0 +1,81 @@
+import time
+
+import numpy as np
+
+from spatial_index import GridIndex, statistical_outlier_mask
+
+REDUCTIONS = ("none", "voxel", "density")
+OUTLIER_METHODS = ("statistical", "grid", "occupancy", "none")
+
+
+def density_decimate(points, voxel_size, max_per_voxel):
+    """Keeps at most `max_per_voxel` original points in every voxel.
+
+    Dense regions are thinned while sparse ones (thin limbs, fingers) keep all
+    their points, unlike a plain voxel average.
+    """
+    cells = np.floor((points - points.min(axis=0)) / voxel_size).astype(np.int64)
+    _, inverse = np.unique(cells, axis=0, return_inverse=True)
+    inverse = inverse.ravel()
+    order = np.argsort(inverse, kind="stable")
+    sorted_cells = inverse[order]
+    starts = np.flatnonzero(np.r_[True, sorted_cells[1:] != sorted_cells[:-1]])
+    rank = np.arange(len(order)) - np.repeat(starts, np.diff(np.r_[starts, len(order)]))
+    return np.sort(order[rank < max_per_voxel])
+
+
+def occupancy_outlier_mask(points, voxel_size, min_neighbours):
+    """O(n) outlier test: a point survives when its 3x3x3 voxel block holds enough points."""
+    index = GridIndex(points, voxel_size)
+    return index.neighbourhood_counts() >= min_neighbours
+
+
+def denoise(pcd, reduction="none", voxel_size=0.005, max_per_voxel=4,
+            outlier="statistical", nb_neighbors=30, std_ratio=3.0,
+            occupancy_voxel=0.03, min_neighbours=20):
+    """Reduces the cloud, then removes outliers on the reduced cloud.
+
+    reduction: "none", "voxel" (Open3D voxel centroids) or "density" (keep up to
+    `max_per_voxel` original points per voxel).
+    outlier: "statistical" (Open3D), "grid" (same rule on a GridIndex),
+    "occupancy" (voxel-neighbourhood count) or "none". "grid" walks the cells
+    in Python, about 14 us per point (5.8 s for 400k points), so it is slower
+    than Open3D's filter and only worth it where Open3D is unavailable.
+    Returns the cleaned cloud and a list of per-stage reports.
+    """
+    report = []
+
+    def record(stage, started, n_in, n_out):
+        ms = (time.perf_counter() - started) * 1000
+        report.append({"stage": stage, "ms": round(ms, 1), "points_in": n_in, "points_out": n_out})
+        print(f"   [PREPROCESS] {stage}: {n_in} -> {n_out} points in {ms:.0f} ms")
+
+    n = len(pcd.points)
+    started = time.perf_counter()
+    if reduction == "voxel" and voxel_size > 0:
+        pcd = pcd.voxel_down_sample(voxel_size)
+        record(f"voxel({voxel_size})", started, n, len(pcd.points))
+    elif reduction == "density" and voxel_size > 0:
+        keep = density_decimate(np.asarray(pcd.points), voxel_size, max_per_voxel)
+        pcd = pcd.select_by_index(keep.tolist())
+        record(f"density({voxel_size}, {max_per_voxel}/voxel)", started, n, len(pcd.points))
+    elif reduction != "none":
+        raise ValueError(f"Unknown reduction: {reduction}")
+
+    n = len(pcd.points)
+    started = time.perf_counter()
+    if outlier == "statistical":
+        pcd, _ = pcd.remove_statistical_outlier(nb_neighbors=nb_neighbors, std_ratio=std_ratio)
+    elif outlier == "grid":
+        index = GridIndex.for_neighbors(np.asarray(pcd.points), 10)
+        keep = statistical_outlier_mask(index, nb_neighbors=nb_neighbors, std_ratio=std_ratio)
+        pcd = pcd.select_by_index(np.flatnonzero(keep).tolist())
+    elif outlier == "occupancy":
+        keep = occupancy_outlier_mask(np.asarray(pcd.points), occupancy_voxel, min_neighbours)
+        pcd = pcd.select_by_index(np.flatnonzero(keep).tolist())
+    elif outlier != "none":
+        raise ValueError(f"Unknown outlier filter: {outlier}")
+    if outlier != "none":
+        record(outlier, started, n, len(pcd.points))
+
+    return pcd, report
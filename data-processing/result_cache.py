@@ -0,0 +1,144 @@
+import hashlib
+import os
+import pickle
+import tempfile
+import threading
+from collections import OrderedDict
+
+HASH_CHUNK = 1 << 20
+
+
+def file_digest(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(HASH_CHUNK), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def cache_key(path, config, digest=None):
+    """Content address of a scan: the PLY bytes plus every setting that changes the analysis.
+
+    The target height is deliberately not part of the key; cached entries are
+    stored unscaled and rescaled per request. `digest` is the file's SHA-256
+    when it was already hashed while streaming; `path` is then not read.
+    """
+    config_part = repr(sorted(config.items())).encode("utf-8")
+    return hashlib.sha256((digest or file_digest(path)).encode("ascii") + config_part).hexdigest()
+
+
+class ResultCache:
+    """LRU cache of height-independent scan analyses.
+
+    Entries live in memory up to `max_bytes` (measured as their pickled size).
+    With `disk_dir` set, entries are also written there and evicted by
+    least-recent access once the directory exceeds `disk_max_bytes`; a memory
+    miss that hits the disk is promoted back to memory. The disk tier holds
+    pickles, so it must only be writable by this service.
+    """
+
+    def __init__(self, max_bytes=256 * 1024 * 1024, disk_dir=None, disk_max_bytes=2 * 1024 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self.disk_dir = disk_dir
+        self.disk_max_bytes = disk_max_bytes
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        if disk_dir:
+            os.makedirs(disk_dir, exist_ok=True)
+
+    def _disk_path(self, key):
+        return os.path.join(self.disk_dir, key + ".pkl")
+
+    def get(self, key):
+        with self._lock:
+            item = self._entries.get(key)
+            if item is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return pickle.loads(item)
+
+        blob = self._read_disk(key)
+        with self._lock:
+            if blob is None:
+                self.misses += 1
+                return None
+            self.disk_hits += 1
+            self._remember(key, blob)
+        return pickle.loads(blob)
+
+    def put(self, key, entry):
+        blob = pickle.dumps(entry, protocol=pickle.HIGHEST_PROTOCOL)
+        with self._lock:
+            self._remember(key, blob)
+        if self.disk_dir:
+            self._write_disk(key, blob)
+
+    def _remember(self, key, blob):
+        if len(blob) > self.max_bytes:
+            return
+        old = self._entries.pop(key, None)
+        if old is not None:
+            self._bytes -= len(old)
+        self._entries[key] = blob
+        self._bytes += len(blob)
+        while self._bytes > self.max_bytes:
+            _, evicted = self._entries.popitem(last=False)
+            self._bytes -= len(evicted)
+
+    def _read_disk(self, key):
+        if not self.disk_dir:
+            return None
+        path = self._disk_path(key)
+        try:
+            with open(path, "rb") as f:
+                blob = f.read()
+            os.utime(path)  # mtime doubles as the last-access time for eviction
+            return blob
+        except OSError:
+            return None
+
+    def _write_disk(self, key, blob):
+        try:
+            fd, tmp = tempfile.mkstemp(dir=self.disk_dir, suffix=".tmp")
+            with os.fdopen(fd, "wb") as f:
+                f.write(blob)
+            os.replace(tmp, self._disk_path(key))
+            self._evict_disk()
+        except OSError as e:
+            print(f"[CACHE] Disk write failed: {e}")
+
+    def _evict_disk(self):
+        files = []
+        for name in os.listdir(self.disk_dir):
+            if not name.endswith(".pkl"):
+                continue
+            try:
+                st = os.stat(os.path.join(self.disk_dir, name))
+            except OSError:
+                continue
+            files.append((st.st_mtime, st.st_size, name))
+        total = sum(size for _, size, _ in files)
+        for _, size, name in sorted(files):
+            if total <= self.disk_max_bytes:
+                break
+            try:
+                os.remove(os.path.join(self.disk_dir, name))
+                total -= size
+            except OSError:
+                pass
+
+    def stats(self):
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "disk_dir": self.disk_dir,
+            }
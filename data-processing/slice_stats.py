@@ -0,0 +1,78 @@
+import numpy as np
+
+
+def height_slices(points, n_slices, axis=1):
+    """Per-slice statistics of a cloud cut into `n_slices` equal bands along `axis`.
+
+    Points are binned once and grouped by slice with a radix sort, so count,
+    per-axis min/max and centroid for all slices come out of a single
+    reduceat pass instead of one mask per slice. Slice i holds the points with
+    edges[i] <= h < edges[i + 1]; a point exactly on the top edge belongs to
+    no slice.
+
+    Returns a dict of arrays: edges (n_slices + 1), count (n_slices) and min,
+    max, centroid (n_slices x dims, NaN for empty slices).
+    """
+    points = np.asarray(points)
+    dims = points.shape[1]
+    empty = np.full((n_slices, dims), np.nan)
+    if len(points) == 0:
+        return {"edges": np.zeros(n_slices + 1), "count": np.zeros(n_slices, dtype=np.int64),
+                "min": empty, "max": empty.copy(), "centroid": empty.copy()}
+
+    heights = points[:, axis]
+    # Edges in float64 whatever the dtype, so a float32 cloud is cut like a float64 one.
+    min_h, max_h = float(np.min(heights)), float(np.max(heights))
+    slice_h = (max_h - min_h) / n_slices
+    edges = min_h + np.arange(n_slices + 1) * slice_h
+
+    index = slice_index(heights, edges, slice_h)
+    # Slice ids fit in int16 for any sane resolution, and a stable argsort of
+    # int16 keys is a linear-time radix sort.
+    key_type = np.int16 if n_slices < np.iinfo(np.int16).max else np.int64
+    order = np.argsort(index.astype(key_type), kind="stable")
+    count = np.bincount(index, minlength=n_slices + 1)[:n_slices]
+    starts = np.concatenate(([0], np.cumsum(count)))
+
+    stats = {"edges": edges, "count": count, "min": empty, "max": empty.copy(), "centroid": empty.copy()}
+    filled = np.flatnonzero(count)
+    if len(filled):
+        # Points above the top edge sort last (id n_slices) and are left out.
+        sorted_points = np.take(points, order[:starts[-1]], axis=0)
+        begin = starts[filled]
+        stats["min"][filled] = np.minimum.reduceat(sorted_points, begin, axis=0)
+        stats["max"][filled] = np.maximum.reduceat(sorted_points, begin, axis=0)
+        stats["centroid"][filled] = np.add.reduceat(sorted_points, begin, axis=0) / count[filled, None]
+    return stats
+
+
+def slice_index(heights, edges, slice_h):
+    """Slice id of every height, with id len(edges) - 1 for heights at or above the top edge."""
+    n_slices = len(edges) - 1
+    if slice_h <= 0:
+        return np.full(len(heights), n_slices, dtype=np.int64)
+    index = np.clip(np.floor((heights - edges[0]) / slice_h).astype(np.int64), 0, n_slices)
+    # Division can round across an edge; settle those few against the edges
+    # themselves so membership is exactly edges[i] <= h < edges[i + 1].
+    index -= heights < edges[index]
+    upper = np.minimum(index + 1, n_slices)
+    index += (index < n_slices) & (heights >= edges[upper])
+    return index
+
+
+def horizontal_spread(stats, axis=1, min_count=1):
+    """Widest horizontal extent of each slice; 0 for slices under `min_count` points."""
+    extent = stats["max"] - stats["min"]
+    horizontal = [i for i in range(extent.shape[1]) if i != axis]
+    spread = np.max(extent[:, horizontal], axis=1)
+    spread[stats["count"] < min_count] = 0.0
+    return spread
+
+
+def occupied_span(stats, min_fraction=0.001):
+    """Bottom and top edge of the slices holding at least `min_fraction` of the points."""
+    count = stats["count"]
+    dense = np.flatnonzero(count >= max(1, min_fraction * np.sum(count)))
+    if len(dense) == 0:
+        return float(stats["edges"][0]), float(stats["edges"][0])
+    return float(stats["edges"][dense[0]]), float(stats["edges"][dense[-1] + 1])
@@ -0,0 +1,193 @@
+import itertools
+
+import numpy as np
+
+MAX_PAIRWISE = 2_000_000
+
+
+class GridIndex:
+    """Uniform-grid spatial index over 2D or 3D points.
+
+    Points are bucketed once by cell (one sort), after which radius and
+    k-nearest queries only look at the cells around the query point. Any point
+    outside a block of `r` cells around the query cell is at least
+    `r * cell_size` away, which is what makes the k-nearest search exact.
+    """
+
+    def __init__(self, points, cell_size):
+        if cell_size <= 0:
+            raise ValueError("cell_size must be positive")
+        self.points = np.asarray(points)
+        self.dims = self.points.shape[1]
+        self.cell_size = float(cell_size)
+
+        self.origin = np.min(self.points, axis=0) if len(self.points) else np.zeros(self.dims)
+        cells = np.floor((self.points - self.origin) / self.cell_size).astype(np.int64)
+        self.shape = np.max(cells, axis=0) + 1 if len(cells) else np.ones(self.dims, dtype=np.int64)
+        # Row-major strides so that a cell key is a single int64.
+        self.strides = np.cumprod(np.concatenate(([1], self.shape[::-1][:-1])))[::-1].astype(np.int64)
+
+        keys = cells @ self.strides
+        self.order = np.argsort(keys, kind="stable")
+        sorted_keys = keys[self.order]
+        boundaries = np.flatnonzero(np.diff(sorted_keys)) + 1
+        self.cell_keys = sorted_keys[np.concatenate(([0], boundaries))] if len(sorted_keys) else sorted_keys
+        self.cell_starts = np.concatenate(([0], boundaries, [len(sorted_keys)])).astype(np.int64)
+        self._cell_coords = cells
+        self.occupied_cells = cells[self.order[self.cell_starts[:-1]]] if len(cells) else cells
+        self._offsets = {}
+
+    def __len__(self):
+        return len(self.points)
+
+    @classmethod
+    def for_neighbors(cls, points, k):
+        """Picks a cell size that puts roughly `k` points in each occupied cell."""
+        points = np.asarray(points)
+        extent = np.ptp(points, axis=0)
+        extent = extent[extent > 0]
+        if len(extent) == 0:
+            return cls(points, 1.0)
+        cell = float(np.prod(extent) * k / len(points)) ** (1.0 / len(extent))
+        index = cls(points, cell)
+        # Scans are surfaces, not volumes: correct the first guess with the
+        # measured occupancy, assuming counts scale with the cell area.
+        per_cell = len(points) / max(1, len(index.cell_keys))
+        if per_cell > 2 * k or per_cell < k / 2:
+            index = cls(points, cell * np.sqrt(k / per_cell))
+        return index
+
+    def _block_cells(self, center_cell, ring):
+        if (2 * ring + 1) ** self.dims > len(self.cell_keys):
+            return np.flatnonzero(np.all(np.abs(self.occupied_cells - center_cell) <= ring, axis=1))
+        offsets = self._offsets.get(ring)
+        if offsets is None:
+            offsets = np.array(list(itertools.product(range(-ring, ring + 1), repeat=self.dims)), dtype=np.int64)
+            self._offsets[ring] = offsets
+        cells = center_cell + offsets
+        inside = np.all((cells >= 0) & (cells < self.shape), axis=1)
+        return self._present(cells[inside] @ self.strides)
+
+    def _present(self, keys):
+        pos = np.searchsorted(self.cell_keys, keys)
+        valid = pos < len(self.cell_keys)
+        pos, keys = pos[valid], keys[valid]
+        return pos[self.cell_keys[pos] == keys]
+
+    def _gather(self, cell_ids):
+        starts = self.cell_starts[cell_ids]
+        lengths = self.cell_starts[cell_ids + 1] - starts
+        total = int(np.sum(lengths))
+        # Concatenated ranges [start, start + length) without a Python loop.
+        shift = np.repeat(starts - (np.cumsum(lengths) - lengths), lengths)
+        return self.order[np.arange(total) + shift]
+
+    def _cell_for(self, center):
+        return np.floor((np.asarray(center, dtype=float) - self.origin) / self.cell_size).astype(np.int64)
+
+    def query_radius(self, center, radius, return_distances=False):
+        center = np.asarray(center, dtype=float)
+        lo = np.maximum(self._cell_for(center - radius), 0)
+        hi = np.minimum(self._cell_for(center + radius), self.shape - 1)
+        if np.any(hi < lo):
+            empty = np.empty(0, dtype=np.int64)
+            return (empty, np.empty(0)) if return_distances else empty
+
+        ranges = [np.arange(l, h + 1) for l, h in zip(lo, hi)]
+        cells = np.stack(np.meshgrid(*ranges, indexing="ij"), axis=-1).reshape(-1, self.dims)
+        candidates = self._gather(self._present(cells @ self.strides))
+        dist_sq = np.sum((self.points[candidates] - center) ** 2, axis=1)
+        hit = dist_sq < radius * radius
+        if return_distances:
+            return candidates[hit], np.sqrt(dist_sq[hit])
+        return candidates[hit]
+
+    def query_knn(self, center, k, return_distances=False):
+        center = np.asarray(center, dtype=float)
+        k = min(k, len(self.points))
+        center_cell = self._cell_for(center)
+        # A query outside the grid still needs enough rings to reach it.
+        ring = max(1, int(np.max(np.maximum(-center_cell, center_cell - self.shape + 1))))
+        max_ring = int(np.max(self.shape)) + ring
+        while True:
+            candidates = self._gather(self._block_cells(center_cell, ring))
+            dist_sq = np.sum((self.points[candidates] - center) ** 2, axis=1)
+            if len(candidates) >= k:
+                nearest = np.argpartition(dist_sq, k - 1)[:k] if k < len(candidates) else np.arange(len(candidates))
+                nearest = nearest[np.argsort(dist_sq[nearest], kind="stable")]
+                if dist_sq[nearest[-1]] <= (ring * self.cell_size) ** 2 or ring >= max_ring:
+                    if return_distances:
+                        return candidates[nearest], np.sqrt(dist_sq[nearest])
+                    return candidates[nearest]
+            ring += 1
+
+    def neighbourhood_counts(self, ring=1):
+        """Number of points in the (2 * ring + 1)^dims block of cells around each point's cell."""
+        cell_counts = np.diff(self.cell_starts)
+        totals = np.zeros(len(self.cell_keys), dtype=np.int64)
+        offsets = np.array(list(itertools.product(range(-ring, ring + 1), repeat=self.dims)), dtype=np.int64)
+        for offset in offsets:
+            neighbours = self.occupied_cells + offset
+            inside = np.all((neighbours >= 0) & (neighbours < self.shape), axis=1)
+            keys = neighbours[inside] @ self.strides
+            pos = np.minimum(np.searchsorted(self.cell_keys, keys), len(self.cell_keys) - 1)
+            found = self.cell_keys[pos] == keys
+            totals[np.flatnonzero(inside)[found]] += cell_counts[pos[found]]
+        per_point = np.empty(len(self.points), dtype=np.int64)
+        per_point[self.order] = np.repeat(totals, cell_counts)
+        return per_point
+
+    def knn_mean_distances(self, k):
+        """Mean distance from every point to its k nearest neighbours (itself included).
+
+        Works one occupied cell at a time against its neighbouring block, widening
+        the block only for the points whose k-th neighbour is not yet proven.
+        """
+        k = min(k, len(self.points))
+        means = np.zeros(len(self.points))
+        for cell_id in range(len(self.cell_keys)):
+            members = self.order[self.cell_starts[cell_id]:self.cell_starts[cell_id + 1]]
+            center_cell = self._cell_coords[members[0]]
+            ring = 1
+            pending = members
+            while len(pending):
+                candidates = self._gather(self._block_cells(center_cell, ring))
+                if len(candidates) < k:
+                    ring *= 2
+                    continue
+                complete = len(candidates) == len(self.points)
+                cand_pts = self.points[candidates]
+                cand_sq = np.sum(cand_pts * cand_pts, axis=1)
+                unproven = []
+                # Bound the pending x candidates distance matrix for dense cells.
+                step = max(1, MAX_PAIRWISE // len(candidates))
+                for start in range(0, len(pending), step):
+                    chunk = pending[start:start + step]
+                    chunk_pts = self.points[chunk]
+                    dist_sq = np.sum(chunk_pts * chunk_pts, axis=1)[:, None] + cand_sq[None, :] - 2.0 * (chunk_pts @ cand_pts.T)
+                    dist = np.sqrt(np.maximum(dist_sq, 0.0))
+                    nearest = np.partition(dist, k - 1, axis=1)[:, :k] if k < len(candidates) else dist
+                    proven = complete | (np.max(nearest, axis=1) <= ring * self.cell_size)
+                    means[chunk[proven]] = np.mean(nearest[proven], axis=1)
+                    unproven.append(chunk[~proven])
+                pending = np.concatenate(unproven)
+                ring *= 2
+        return means
+
+
+def statistical_outlier_mask(index, nb_neighbors=30, std_ratio=3.0):
+    """Open3D's remove_statistical_outlier rule, computed on a GridIndex.
+
+    Like Open3D, a point's mean distance runs over its `nb_neighbors` nearest
+    points including itself, the cloud statistics sum only the non-zero means
+    but divide by the number of points (n - 1 for the deviation), and a point
+    is kept when its mean is non-zero and below mean + std_ratio * std.
+    """
+    avg = index.knn_mean_distances(nb_neighbors)
+    valid = avg > 0
+    n = len(avg)
+    if n < 2:
+        return valid
+    cloud_mean = np.sum(avg[valid]) / n
+    std_dev = np.sqrt(np.sum((avg[valid] - cloud_mean) ** 2) / (n - 1))
+    return valid & (avg < cloud_mean + std_ratio * std_dev)
@@ -0,0 +1,40 @@
+import time
+
+from job_queue import ScanJobQueue
+
+
+class Upload:
+    def __init__(self):
+        self.discarded = False
+
+    def discard(self):
+        self.discarded = True
+
+
+def wait_finished(jobs, job_id, timeout=5.0):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        job = jobs.get(job_id)
+        if job["finished_at"] is not None:
+            return job
+        time.sleep(0.01)
+    raise AssertionError(f"job {job_id} did not finish")
+
+
+def test_result_is_kept_until_it_expires():
+    jobs = ScanJobQueue(lambda upload, height, options: {"height": height}, result_ttl=3600)
+    upload = Upload()
+    job = wait_finished(jobs, jobs.submit(upload, 1.75))
+    assert upload.discarded
+    assert job["status"] == "done"
+    assert job["result"] == {"height": 1.75}
+    assert jobs.stats()["finished_jobs_retained"] == 1
+
+
+def test_expired_results_are_purged_without_new_submissions():
+    jobs = ScanJobQueue(lambda upload, height, options: {"height": height}, result_ttl=3600)
+    job_id = jobs.submit(Upload(), 1.75)
+    wait_finished(jobs, job_id)
+    jobs.result_ttl = -1
+    assert jobs.stats()["finished_jobs_retained"] == 0
+    assert jobs.get(job_id) is None
@@ -0,0 +1,100 @@
+import numpy as np
+import pytest
+
+from ply_reader import CHUNK_POINTS, PlyStreamParser, new_stats, read_ply_points
+
+
+def ply_bytes(points, fmt, with_faces=False):
+    """PLY with x/y/z plus extra vertex properties, optionally followed by a face element."""
+    n = len(points)
+    header = [
+        "ply",
+        f"format {fmt} 1.0",
+        f"element vertex {n}",
+        "property float x",
+        "property float y",
+        "property float z",
+        "property uchar red",
+        "property double confidence",
+    ]
+    if with_faces:
+        header += ["element face 2", "property list uchar int vertex_indices"]
+    header.append("end_header")
+    head = ("\n".join(header) + "\n").encode("ascii")
+
+    red = np.arange(n) % 256
+    confidence = np.linspace(0.0, 1.0, n)
+    if fmt == "ascii":
+        body = "".join(f"{x} {y} {z} {r} {c}\n" for (x, y, z), r, c in zip(points.astype(np.float32), red, confidence))
+        faces = "3 0 1 2\n3 1 2 3\n" if with_faces else ""
+        return head + (body + faces).encode("ascii")
+
+    order = "<" if fmt == "binary_little_endian" else ">"
+    records = np.empty(n, dtype=[("x", order + "f4"), ("y", order + "f4"), ("z", order + "f4"),
+                                 ("red", "u1"), ("confidence", order + "f8")])
+    records["x"], records["y"], records["z"] = points.T
+    records["red"], records["confidence"] = red, confidence
+    faces = b""
+    if with_faces:
+        face = np.array([3], dtype="u1").tobytes()
+        faces = b"".join(face + np.array(ids, dtype=order + "i4").tobytes() for ids in ((0, 1, 2), (1, 2, 3)))
+    return head + records.tobytes() + faces
+
+
+def parse_in_pieces(data, piece, **options):
+    parser = PlyStreamParser(**options)
+    for start in range(0, len(data), piece):
+        parser.feed(data[start:start + piece])
+    return parser.finish(), parser.stats
+
+
+def read_from_file(tmp_path, data, **options):
+    path = tmp_path / "scan.ply"
+    path.write_bytes(data)
+    stats = new_stats()
+    return read_ply_points(str(path), stats=stats, **options), stats
+
+
+def cloud(n, seed=0):
+    return np.random.default_rng(seed).uniform(-1.0, 1.0, size=(n, 3)).astype(np.float32)
+
+
+@pytest.mark.parametrize("fmt", ["binary_little_endian", "binary_big_endian", "ascii"])
+@pytest.mark.parametrize("with_faces", [False, True])
+@pytest.mark.parametrize("piece", [1, 7, 4096, 1 << 30])
+def test_matches_read_ply_points(tmp_path, fmt, with_faces, piece):
+    data = ply_bytes(cloud(500), fmt, with_faces)
+    expected, expected_stats = read_from_file(tmp_path, data)
+    points, stats = parse_in_pieces(data, piece)
+    np.testing.assert_array_equal(points, expected)
+    assert stats == expected_stats
+
+
+@pytest.mark.parametrize("fmt", ["binary_little_endian", "ascii"])
+@pytest.mark.parametrize("options", [
+    {"max_points": 1000},
+    {"max_points": 5000, "method": "voxel", "voxel_size": 0.05},
+    {"max_points": 2000, "method": "voxel", "voxel_size": 0.01, "max_voxels": 2000},
+])
+def test_sampling_matches_read_ply_points_across_chunks(tmp_path, fmt, options):
+    # More vertices than one chunk, so the per-chunk sampling is exercised.
+    data = ply_bytes(cloud(CHUNK_POINTS + 1000, seed=1), fmt, with_faces=True)
+    expected, expected_stats = read_from_file(tmp_path, data, **options)
+    points, stats = parse_in_pieces(data, 65_537, **options)
+    np.testing.assert_array_equal(points, expected)
+    assert stats == expected_stats
+
+
+def test_truncated_binary_data_is_rejected():
+    data = ply_bytes(cloud(100), "binary_little_endian")
+    parser = PlyStreamParser()
+    parser.feed(data[:-5])
+    with pytest.raises(ValueError):
+        parser.finish()
+
+
+def test_missing_end_header_is_rejected():
+    parser = PlyStreamParser()
+    parser.feed(b"ply\nformat ascii 1.0\nelement vertex 1\n")
+    with pytest.raises(ValueError):
+        parser.finish()
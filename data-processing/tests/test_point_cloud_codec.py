@@ -0,0 +1,56 @@
+import struct
+import zlib
+
+import numpy as np
+import pytest
+
+from point_cloud_codec import COMPRESSIONS, ENCODINGS, HEADER, decode_point_cloud, encode_point_cloud
+
+
+@pytest.fixture
+def points():
+    return np.random.default_rng(5).uniform([-0.4, 0.0, -0.3], [0.4, 1.8, 0.3], size=(1000, 3))
+
+
+@pytest.mark.parametrize("compression", sorted(COMPRESSIONS))
+def test_f32_round_trip_is_exact_in_float32(points, compression):
+    decoded = decode_point_cloud(encode_point_cloud(points, "f32", compression))
+    assert decoded.dtype == np.float32
+    np.testing.assert_array_equal(decoded, points.astype(np.float32))
+
+
+@pytest.mark.parametrize("compression", sorted(COMPRESSIONS))
+def test_q16_round_trip_is_within_half_a_step(points, compression):
+    decoded = decode_point_cloud(encode_point_cloud(points, "q16", compression))
+    step = (points.max(axis=0) - points.min(axis=0)) / 65535.0
+    assert np.all(np.abs(decoded - points) <= step / 2 + 1e-6)
+
+
+def test_q16_flat_axis_decodes_to_its_value():
+    points = np.array([[0.0, 1.0, 2.0], [1.0, 1.0, 2.0], [0.5, 1.0, 2.0]])
+    decoded = decode_point_cloud(encode_point_cloud(points, "q16"))
+    np.testing.assert_allclose(decoded[:, 1:], points[:, 1:])
+
+
+@pytest.mark.parametrize("encoding", sorted(ENCODINGS))
+def test_empty_cloud(encoding):
+    assert decode_point_cloud(encode_point_cloud(np.empty((0, 3)), encoding)).shape == (0, 3)
+
+
+def test_header_layout(points):
+    blob = encode_point_cloud(points, "q16", "zlib")
+    magic, version, encoding, compression, reserved, count, *bbox = HEADER.unpack_from(blob)
+    assert HEADER.size == 36
+    assert (magic, version, encoding, compression, reserved, count) == (b"BPC1", 1, 2, 1, 0, len(points))
+    np.testing.assert_allclose(bbox[:3], points.min(axis=0).astype(np.float32))
+    np.testing.assert_allclose(bbox[3:], points.max(axis=0).astype(np.float32))
+    assert len(zlib.decompress(blob[HEADER.size:])) == len(points) * 3 * 2
+
+
+def test_rejects_unknown_options_and_blobs(points):
+    with pytest.raises(ValueError):
+        encode_point_cloud(points, "f16")
+    with pytest.raises(ValueError):
+        encode_point_cloud(points, "f32", "gzip")
+    with pytest.raises(ValueError):
+        decode_point_cloud(struct.pack("<4s", b"NOPE") + bytes(HEADER.size))
@@ -0,0 +1,31 @@
+import numpy as np
+import pytest
+
+from preprocessing import density_decimate
+
+
+@pytest.fixture
+def points():
+    rng = np.random.default_rng(5)
+    # A dense torso-like blob next to a sparse limb.
+    return np.vstack([rng.normal(0.0, 0.02, size=(2000, 3)),
+                      np.column_stack([np.linspace(0.2, 0.8, 60), np.zeros(60), np.zeros(60)])])
+
+
+@pytest.mark.parametrize("voxel_size", [0.005, 0.02])
+@pytest.mark.parametrize("max_per_voxel", [1, 4])
+def test_density_decimate_caps_points_per_voxel(points, voxel_size, max_per_voxel):
+    keep = density_decimate(points, voxel_size, max_per_voxel)
+    assert np.all(np.diff(keep) > 0)
+
+    cells = np.floor((points - points.min(axis=0)) / voxel_size).astype(np.int64)
+    _, kept_counts = np.unique(cells[keep], axis=0, return_counts=True)
+    assert kept_counts.max() <= max_per_voxel
+    # Every occupied voxel keeps min(its count, max_per_voxel) points.
+    _, counts = np.unique(cells, axis=0, return_counts=True)
+    assert len(keep) == np.minimum(counts, max_per_voxel).sum()
+
+
+def test_density_decimate_keeps_sparse_points(points):
+    keep = density_decimate(points, 0.005, 4)
+    assert set(range(2000, len(points))) <= set(keep.tolist())
@@ -0,0 +1,72 @@
+import numpy as np
+import pytest
+
+from slice_stats import height_slices, horizontal_spread, occupied_span
+
+
+def loop_slices(points, n_slices, axis=1):
+    """The per-slice mask loop height_slices replaced (as in remove_platform_by_spread_jump)."""
+    heights = points[:, axis]
+    min_h = np.min(heights)
+    slice_h = (np.max(heights) - min_h) / n_slices
+    rows = []
+    for i in range(n_slices):
+        lo = min_h + i * slice_h
+        pts = points[(heights >= lo) & (heights < lo + slice_h)]
+        rows.append((len(pts), pts.min(axis=0), pts.max(axis=0), pts.mean(axis=0)) if len(pts) else (0, None, None, None))
+    return rows
+
+
+def loop_spread(points, n_slices, min_count=10):
+    spreads = []
+    for count, lo, hi, _ in loop_slices(points, n_slices):
+        spreads.append(0.0 if count < min_count else max(hi[0] - lo[0], hi[2] - lo[2]))
+    return np.array(spreads)
+
+
+@pytest.fixture
+def body():
+    rng = np.random.default_rng(7)
+    torso = rng.normal([0.0, 1.2, 0.0], [0.15, 0.3, 0.1], size=(5000, 3))
+    platform = rng.uniform([-0.5, -0.02, -0.5], [0.5, 0.0, 0.5], size=(2000, 3))
+    # A gap with no points between 1.95 and 2.2 leaves empty slices.
+    head = rng.normal([0.0, 2.3, 0.0], 0.02, size=(50, 3))
+    return np.vstack([torso, platform, head])
+
+
+@pytest.mark.parametrize("n_slices", [1, 20, 64])
+@pytest.mark.parametrize("dtype", [np.float64, np.float32])
+def test_matches_per_slice_loop(body, n_slices, dtype):
+    points = body.astype(dtype)
+    stats = height_slices(points, n_slices)
+    for i, (count, lo, hi, centroid) in enumerate(loop_slices(points, n_slices)):
+        assert stats["count"][i] == count
+        if count:
+            np.testing.assert_array_equal(stats["min"][i], lo)
+            np.testing.assert_array_equal(stats["max"][i], hi)
+            np.testing.assert_allclose(stats["centroid"][i], centroid, rtol=1e-5, atol=1e-6)
+        else:
+            assert np.all(np.isnan(stats["min"][i]))
+
+
+def test_horizontal_spread_matches_platform_loop(body):
+    np.testing.assert_allclose(horizontal_spread(height_slices(body, 20), min_count=10), loop_spread(body, 20))
+
+
+def test_edge_membership():
+    points = np.array([[0.0, h, 0.0] for h in (0.0, 0.5, 1.0, 1.5, 2.0)])
+    stats = height_slices(points, 4)
+    # edges[i] <= h < edges[i + 1]: the point on the top edge is in no slice.
+    np.testing.assert_array_equal(stats["count"], [1, 1, 1, 1])
+
+
+def test_empty_and_flat_clouds():
+    assert height_slices(np.empty((0, 3)), 5)["count"].sum() == 0
+    flat = np.zeros((10, 3))
+    assert height_slices(flat, 5)["count"].sum() == 0
+
+
+def test_occupied_span(body):
+    lo, hi = occupied_span(height_slices(body, 50), min_fraction=0.001)
+    assert lo == pytest.approx(body[:, 1].min())
+    assert hi == pytest.approx(body[:, 1].max(), abs=0.1)
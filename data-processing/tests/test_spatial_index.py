@@ -0,0 +1,73 @@
+import numpy as np
+import pytest
+
+from spatial_index import GridIndex, statistical_outlier_mask
+
+
+def brute_force_knn(points, center, k):
+    dist = np.sqrt(np.sum((points - center) ** 2, axis=1))
+    return np.sort(dist)[:k]
+
+
+@pytest.fixture
+def points():
+    rng = np.random.default_rng(3)
+    # A dense blob, a sparse shell and a few far outliers.
+    return np.vstack([rng.normal(0.0, 0.05, size=(800, 3)),
+                      rng.uniform(-1.0, 1.0, size=(300, 3)),
+                      rng.uniform(5.0, 6.0, size=(5, 3))])
+
+
+@pytest.mark.parametrize("cell_size", [0.01, 0.1, 1.0])
+@pytest.mark.parametrize("k", [1, 10, 50])
+def test_query_knn_matches_brute_force(points, cell_size, k):
+    index = GridIndex(points, cell_size)
+    rng = np.random.default_rng(4)
+    # Queries inside, around and outside the grid.
+    for center in np.vstack([points[rng.choice(len(points), 20)], rng.uniform(-3.0, 8.0, size=(20, 3))]):
+        found, dist = index.query_knn(center, k, return_distances=True)
+        np.testing.assert_allclose(dist, brute_force_knn(points, center, k))
+        np.testing.assert_allclose(np.sqrt(np.sum((points[found] - center) ** 2, axis=1)), dist)
+
+
+def test_query_knn_with_k_above_point_count(points):
+    index = GridIndex(points[:20], 0.1)
+    assert len(index.query_knn(points[0], 50)) == 20
+
+
+@pytest.mark.parametrize("k", [1, 8, 30])
+def test_knn_mean_distances_matches_brute_force(points, k):
+    index = GridIndex.for_neighbors(points, 10)
+    expected = [brute_force_knn(points, p, k).mean() for p in points]
+    # Distances come from |a|^2 + |b|^2 - 2ab, exact to about 1e-8 at these coordinates.
+    np.testing.assert_allclose(index.knn_mean_distances(k), expected, atol=1e-6)
+
+
+@pytest.mark.parametrize("nb_neighbors,std_ratio", [(10, 1.0), (30, 3.0)])
+def test_statistical_outlier_mask_matches_open3d_rule(points, nb_neighbors, std_ratio):
+    # Open3D's remove_statistical_outlier, written out on a full distance matrix.
+    dist = np.sqrt(np.sum((points[:, None, :] - points[None, :, :]) ** 2, axis=2))
+    avg = np.sort(dist, axis=1)[:, :nb_neighbors].mean(axis=1)
+    valid = avg > 0
+    cloud_mean = avg[valid].sum() / len(avg)
+    std_dev = np.sqrt(np.sum((avg[valid] - cloud_mean) ** 2) / (len(avg) - 1))
+    expected = valid & (avg < cloud_mean + std_ratio * std_dev)
+
+    keep = statistical_outlier_mask(GridIndex.for_neighbors(points, 10), nb_neighbors, std_ratio)
+    np.testing.assert_array_equal(keep, expected)
+    assert not keep[-5:].any()
+
+
+def test_query_radius_matches_brute_force(points):
+    index = GridIndex(points, 0.05)
+    for center in points[:50]:
+        found = index.query_radius(center, 0.08)
+        expected = np.flatnonzero(np.sum((points - center) ** 2, axis=1) < 0.08 ** 2)
+        np.testing.assert_array_equal(np.sort(found), expected)
+
+
+def test_2d_index(points):
+    flat = points[:, :2]
+    index = GridIndex(flat, 0.1)
+    _, dist = index.query_knn(flat[0], 5, return_distances=True)
+    np.testing.assert_allclose(dist, brute_force_knn(flat, flat[0], 5))
@@ -1,11 +1,44 @@
-import requests
-import open3d as o3d
-import numpy as np
+"""Draws a scan with the skeleton the pipeline found in it.
+
+    python visualize_skeleton.py test.ply                    # via the server, its returned subsample
+    python visualize_skeleton.py test.ply --source pyramid   # full-resolution levels of the scan
+    python visualize_skeleton.py test.ply --in-process       # no server, AI_Pose_Estimator directly
+    python visualize_skeleton.py test.ply --sampling stratified --points 20000
+    python visualize_skeleton.py --batch scans/ --report qa.json
+
+The cloud is drawn from a pyramid of voxel-decimated levels, each with twice
+the voxel size of the one before, starting at the level whose voxels are
+about one pixel of the window; "+" and "-" switch to a finer or coarser
+level. With --source pyramid the levels are built from the PLY itself and
+saved next to it (<scan>.lod.npz) for the next run. --batch runs every scan
+in-process without a window and prints one QA line per scan.
+"""
+
+import argparse
+import base64
+import glob
+import json
 import os
+import time
+
+import numpy as np
+import open3d as o3d
+import requests
+
+from ply_reader import read_ply_points, voxel_decimate_chunks
+from point_cloud_codec import decode_point_cloud
+from point_sampling import SAMPLERS
 
 SERVER_URL = 'http://127.0.0.1:5000/process-scan'
 FILE_PATH = 'test.ply'
 TARGET_HEIGHT_CM = 180
+WINDOW_WIDTH = 1024
+WINDOW_HEIGHT = 768
+PYRAMID_MAX_POINTS = 2_000_000
+PYRAMID_MIN_POINTS = 5_000
+PYRAMID_BASE_VOXEL = 0.002
+IN_PROCESS_MAX_POINTS = None  # like the server, no load cap unless LOAD_MAX_POINTS is set
+POINT_CLOUD_POINTS = 50_000
 
 
 def create_sphere_at_xyz(xyz, color=[1, 0, 0], radius=0.04):
@@ -15,6 +48,11 @@ def create_sphere_at_xyz(xyz, color=[1, 0, 0], radius=0.04):
     return sphere
 
 
+def keypoint_items(result):
+    # The response also carries meta and the point cloud next to the keypoints.
+    return [(name, val) for name, val in result.items() if isinstance(val, dict) and "x" in val]
+
+
 def create_skeleton_lines(keypoints):
     points = []
     connections = [
@@ -31,9 +69,7 @@ def create_skeleton_lines(keypoints):
     name_to_index = {}
     current_index = 0
 
-    for name, data in keypoints.items():
-        if name in ["meta", "method"]:
-            continue
+    for name, data in keypoint_items(keypoints):
         points.append([data['x'], data['y'], data['z']])
         name_to_index[name] = current_index
         current_index += 1
@@ -53,81 +89,257 @@ def create_skeleton_lines(keypoints):
     return line_set
 
 
-def main():
-    print("--- 3D SKELETON VISUALIZATION ---")
-    print(f"File: {FILE_PATH}, Height: {TARGET_HEIGHT_CM} cm")
+def request_keypoints(path, height_cm, url=SERVER_URL, sampling=None):
+    # q16 is the most compact point cloud encoding; plenty for drawing.
+    data = {'height': height_cm, 'point_cloud_encoding': 'q16', 'point_cloud_compression': 'zlib'}
+    if sampling:
+        data.update(point_cloud_points=sampling["points"], point_cloud_sampling=sampling["method"])
+    with open(path, 'rb') as f:
+        response = requests.post(url, files={'file': f}, data=data)
+    if response.status_code != 200:
+        return {"error": f"Server error {response.status_code}: {response.text}"}
+    return response.json()
 
-    if not os.path.exists(FILE_PATH):
-        print(f"File not found: {FILE_PATH}")
-        return
 
-    print("1. Sending scan to AI...")
-    try:
-        with open(FILE_PATH, 'rb') as f:
-            response = requests.post(
-                SERVER_URL, files={'file': f}, data={'height': TARGET_HEIGHT_CM}
-            )
-    except Exception as e:
-        print(f"Server error: {e}")
-        return
+def create_estimator():
+    from model_loader import AI_Pose_Estimator
+    return AI_Pose_Estimator()
 
-    if response.status_code != 200:
-        print("Server error:", response.text)
-        return
 
+def predict_in_process(estimator, path, height_cm, max_points=IN_PROCESS_MAX_POINTS, sampling=None):
+    """Load, denoise and predict like the server's default pipeline, without the HTTP round trip.
+
+    Like app.load_point_cloud, a PLY the fast reader rejects is read with Open3D instead.
+    """
+    from preprocessing import denoise
+
+    try:
+        pcd = o3d.geometry.PointCloud(o3d.utility.Vector3dVector(read_ply_points(path, max_points=max_points)))
+    except ValueError as e:
+        print(f"   PLY reader: {e}, falling back to Open3D")
+        pcd = o3d.io.read_point_cloud(path)
+    except OSError as e:
+        return {"error": f"Loading error: {e}"}
+    if pcd.is_empty():
+        return {"error": "Empty or corrupt file"}
+    clean, _ = denoise(pcd)
     try:
-        data = response.json()
+        if sampling:
+            return estimator.predict(clean, real_height_meters=height_cm / 100.0,
+                                     point_cloud_points=sampling["points"], point_cloud_sampling=sampling["method"])
+        return estimator.predict(clean, real_height_meters=height_cm / 100.0)
     except Exception as e:
-        print(f"JSON parse error: {e}")
-        return
+        return {"error": str(e)}
 
-    if "error" in data:
-        print(f"AI error: {data['error']}")
-        return
 
-    print(f"AI responded! Method: {data.get('meta', {}).get('method', 'Unknown')}")
+def response_points(result):
+    """The subsample returned with the keypoints, whatever its encoding; None if there is none."""
+    if result.get("point_cloud_encoded"):
+        return decode_point_cloud(base64.b64decode(result["point_cloud_encoded"]))
+    if result.get("point_cloud") is not None and len(result["point_cloud"]):
+        return np.asarray(result["point_cloud"], dtype=float)
+    return None
 
-    print("2. Preparing 3D scene...")
-    pcd = o3d.io.read_point_cloud(FILE_PATH)
-    pcd.paint_uniform_color([0.8, 0.8, 0.8])
 
-    points_arr = np.asarray(pcd.points)
-    cloud_height = np.max(points_arr[:, 2]) - np.min(points_arr[:, 2])
-    if cloud_height <= 0:
-        ranges = np.max(points_arr, axis=0) - np.min(points_arr, axis=0)
-        cloud_height = np.max(ranges)
+def build_pyramid(points, base_voxel=PYRAMID_BASE_VOXEL, min_points=PYRAMID_MIN_POINTS):
+    """Levels of `points`, finest first, each decimated with twice the previous voxel size.
 
-    target_height_meters = TARGET_HEIGHT_CM / 100.0
-    scale_factor = target_height_meters / cloud_height
-    print(f"   Cloud height: {cloud_height:.3f} → scale: {scale_factor:.4f}")
-    pcd.scale(scale_factor, center=pcd.get_center())
+    A voxel size that keeps more than 3/4 of the previous level gives no
+    level of its own.
+    """
+    levels, voxels = [np.asarray(points)], [0.0]
+    voxel = base_voxel
+    while len(levels[-1]) > min_points:
+        coarser = voxel_decimate_chunks([levels[-1]], voxel)
+        if len(coarser) <= 0.75 * len(levels[-1]):
+            levels.append(coarser)
+            voxels.append(voxel)
+        voxel *= 2
+    return levels, voxels
+
+
+def load_pyramid(path):
+    """The pyramid of a PLY file, read from <path>.lod.npz when that is newer than the scan."""
+    cache = path + ".lod.npz"
+    if os.path.exists(cache) and os.path.getmtime(cache) >= os.path.getmtime(path):
+        with np.load(cache) as saved:
+            voxels = list(saved["voxels"])
+            return [saved[f"level_{i}"] for i in range(len(voxels))], voxels
+
+    started = time.perf_counter()
+    levels, voxels = build_pyramid(read_ply_points(path, max_points=PYRAMID_MAX_POINTS))
+    try:
+        np.savez(cache, voxels=np.array(voxels), **{f"level_{i}": level for i, level in enumerate(levels)})
+    except OSError as e:
+        print(f"   Cannot save pyramid to {cache}: {e}")
+    print(f"   Built {len(levels)} levels in {time.perf_counter() - started:.2f}s")
+    return levels, voxels
 
-    pcd = pcd.voxel_down_sample(voxel_size=0.015)
-    print(f"   Points after downsample: {len(pcd.points)}")
 
-    geometries = [pcd]
+def level_for_view(voxels, extent, window_height=WINDOW_HEIGHT):
+    """The coarsest level whose voxels are no larger than one pixel when the whole scan fills the window."""
+    pixel = extent / window_height
+    fitting = [i for i, voxel in enumerate(voxels) if voxel <= pixel]
+    return fitting[-1] if fitting else 0
 
-    print("3. Generating joints...")
-    for key, val in data.items():
-        if key == "meta":
-            continue
+
+def level_cloud(points, scale):
+    pcd = o3d.geometry.PointCloud(o3d.utility.Vector3dVector(np.asarray(points, dtype=float) * scale))
+    pcd.paint_uniform_color([0.8, 0.8, 0.8])
+    return pcd
+
+
+def skeleton_geometries(result):
+    geometries = []
+    for key, val in keypoint_items(result):
         xyz = [val['x'], val['y'], val['z']]
         color = [0, 0, 1] if "ear" in key else ([1, 0.5, 0] if "hip" in key else [1, 0, 0])
         geometries.append(create_sphere_at_xyz(xyz, color=color, radius=0.03))
-
-    print("4. Generating bones...")
-    skeleton = create_skeleton_lines(data)
+    skeleton = create_skeleton_lines(result)
     if skeleton:
         geometries.append(skeleton)
+    return geometries
+
+
+def show(levels, voxels, scale, geometries, title):
+    # Keypoints are scaled about the origin, so the scan is scaled the same way.
+    extent = float(np.max(np.ptp(levels[0], axis=0))) * scale
+    current = {"level": level_for_view([v * scale for v in voxels], extent)}
+    current["cloud"] = level_cloud(levels[current["level"]], scale)
+
+    vis = o3d.visualization.VisualizerWithKeyCallback()
+    vis.create_window(window_name=title, width=WINDOW_WIDTH, height=WINDOW_HEIGHT)
+    vis.add_geometry(current["cloud"])
+    for geometry in geometries:
+        vis.add_geometry(geometry)
+
+    def switch(step):
+        def callback(vis):
+            level = min(max(current["level"] + step, 0), len(levels) - 1)
+            if level != current["level"]:
+                vis.remove_geometry(current["cloud"], reset_bounding_box=False)
+                current["level"], current["cloud"] = level, level_cloud(levels[level], scale)
+                vis.add_geometry(current["cloud"], reset_bounding_box=False)
+                print(f"   Level {level}: {len(levels[level])} points")
+            return False
+        return callback
+
+    vis.register_key_callback(ord("="), switch(-1))
+    vis.register_key_callback(ord("+"), switch(-1))
+    vis.register_key_callback(ord("-"), switch(1))
+    print(f"   Level {current['level']} of {len(levels)}: {len(levels[current['level']])} points (+/- to change)")
+    vis.run()
+    vis.destroy_window()
+
+
+def visualize(path, height_cm, source, in_process, url, sampling=None):
+    print("--- 3D SKELETON VISUALIZATION ---")
+    print(f"File: {path}, Height: {height_cm} cm")
+
+    if not os.path.exists(path):
+        print(f"File not found: {path}")
+        return
+
+    if in_process:
+        print("1. Running AI in-process...")
+        result = predict_in_process(create_estimator(), path, height_cm, sampling=sampling)
+    else:
+        print("1. Sending scan to AI...")
+        try:
+            result = request_keypoints(path, height_cm, url, sampling)
+        except Exception as e:
+            print(f"Server error: {e}")
+            return
 
-    print("5. Opening 3D window...")
-    o3d.visualization.draw_geometries(
-        geometries,
-        window_name=f"Biomechanics - {FILE_PATH} ({TARGET_HEIGHT_CM}cm)",
-        width=1024,
-        height=768,
-    )
+    if "error" in result:
+        print(f"AI error: {result['error']}")
+        return
+
+    meta = result.get("meta", {})
+    print(f"AI responded! Method: {meta.get('method', 'Unknown')}")
+
+    print("2. Preparing 3D scene...")
+    points = response_points(result) if source == "response" else None
+    if points is not None:
+        levels, voxels = build_pyramid(points)
+    else:
+        if source == "response":
+            print("   No point cloud in the response, using the scan's pyramid")
+        levels, voxels = load_pyramid(path)
+    print(f"   Levels: {', '.join(str(len(level)) for level in levels)} points")
+
+    print("3. Generating joints and bones...")
+    geometries = skeleton_geometries(result)
+
+    print("4. Opening 3D window...")
+    show(levels, voxels, meta.get("scaling_factor", 1.0), geometries, f"Biomechanics - {path} ({height_cm}cm)")
+
+
+def scan_paths(inputs):
+    paths = []
+    for item in inputs:
+        paths.extend(sorted(glob.glob(os.path.join(item, "*.ply"))) if os.path.isdir(item) else [item])
+    return paths
+
+
+def run_batch(paths, height_cm, report_path=None):
+    """QA pass over many scans with one in-process estimator; returns how many failed."""
+    estimator = create_estimator()
+    rows = []
+    print(f"{'Scan':<40}{'Method':<32}{'Orientation':<14}{'Score':>7}{'Time':>9}")
+    for path in paths:
+        started = time.perf_counter()
+        result = predict_in_process(estimator, path, height_cm)
+        meta = result.get("meta", {})
+        row = {
+            "file": path,
+            "seconds": round(time.perf_counter() - started, 2),
+            "method": meta.get("method"),
+            "best_orientation": meta.get("best_orientation"),
+            "best_score": meta.get("best_score"),
+            "platform_removed": meta.get("platform_removed"),
+            "error": result.get("error"),
+            "keypoints": {name: val for name, val in keypoint_items(result)},
+        }
+        row["ok"] = row["error"] is None and row["method"] != "Heuristic_Fallback"
+        rows.append(row)
+        score = f"{row['best_score']:.2f}" if row["best_score"] is not None else "-"
+        print(f"{os.path.basename(path)[:39]:<40}{(row['method'] or 'ERROR: ' + row['error'])[:31]:<32}"
+              f"{row['best_orientation'] or '-':<14}{score:>7}{row['seconds']:>8.1f}s")
+
+    failed = sum(1 for row in rows if not row["ok"])
+    print(f"{len(rows) - failed}/{len(rows)} scans OK")
+    if report_path:
+        with open(report_path, "w") as f:
+            json.dump(rows, f, indent=2)
+        print(f"Report written to {report_path}")
+    return failed
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Draw the skeleton found in a scan, or QA many scans in-process.")
+    parser.add_argument("paths", nargs="*", default=[FILE_PATH], help="PLY file (with --batch: files or directories)")
+    parser.add_argument("--height", type=float, default=TARGET_HEIGHT_CM, help="subject height in cm")
+    parser.add_argument("--source", choices=("response", "pyramid"), default="response",
+                        help="draw the subsample returned with the keypoints, or levels built from the PLY itself")
+    parser.add_argument("--in-process", action="store_true", help="run AI_Pose_Estimator here instead of calling the server")
+    parser.add_argument("--url", default=SERVER_URL)
+    parser.add_argument("--batch", action="store_true", help="in-process QA of every scan, no window")
+    parser.add_argument("--report", help="with --batch, write the per-scan results to this JSON file")
+    parser.add_argument("--sampling", choices=sorted(SAMPLERS), help="how the returned point cloud is subsampled")
+    parser.add_argument("--points", type=int, help=f"size of the returned point cloud (default {POINT_CLOUD_POINTS})")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    if args.batch:
+        raise SystemExit(1 if run_batch(scan_paths(args.paths), args.height, args.report) else 0)
+    sampling = None
+    if args.sampling or args.points is not None:
+        sampling = {"points": POINT_CLOUD_POINTS if args.points is None else args.points, "method": args.sampling or "uniform"}
+    visualize(args.paths[0], args.height, args.source, args.in_process, args.url, sampling)
 
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()